@@ -0,0 +1,218 @@
+"""
+Offline benchmark: runs search, episode listing, CDN extraction and the
+download against fixture_site.FixtureSite instead of hanime.tv, so timings
+are repeatable and nothing leaves the machine.
+
+    python benchmark.py --runs 5 --json before.json
+    python benchmark.py --runs 5 --compare before.json
+    python benchmark.py --ops download --bandwidth 4M --media mp4
+
+Caches, prefetch, the journal and the metrics endpoint are disabled so every
+run does the full work; each run uses a fresh temp directory.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Optional
+
+from fixture_site import FixtureSite
+
+OPS = ("search", "episodes", "cdn", "download")
+
+
+def _size(text: str) -> int:
+    """'512K', '8M', '1.5G' or plain bytes."""
+    text = text.strip().upper()
+    scale = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))]
+
+
+def _summary(samples: dict) -> dict:
+    seconds = samples["seconds"]
+    out = {"runs": samples["runs"], "ok": len(seconds)}
+    if seconds:
+        out.update(
+            min=min(seconds),
+            p50=statistics.median(seconds),
+            p90=_percentile(seconds, 0.9),
+            max=max(seconds),
+            mean=statistics.fmean(seconds),
+        )
+    if samples.get("bytes") and seconds:
+        out["mb_per_s"] = sum(samples["bytes"]) / sum(seconds) / 1024 ** 2
+    return out
+
+
+def _isolate(base_url: str, workdir: str, fast_path: bool) -> None:
+    """Point config at the fixture and a scratch dir; must run before importing it."""
+    os.environ.update({
+        "HANIME_BASE_URL": base_url,
+        "HANIME_SEARCH_API_URL": base_url + "/api/search",
+        "FAST_PATH": str(fast_path).lower(),
+        "DATA_DIR": workdir,
+        "DOWNLOAD_DIR": os.path.join(workdir, "downloads"),
+        "SEARCH_CACHE_TTL": "0",
+        "EPISODES_CACHE_TTL": "0",
+        "CDN_CACHE_TTL": "0",
+        "CACHE_DB_PATH": "",
+        "FILE_ID_DB_PATH": "",
+        "JOURNAL_DB_PATH": "",
+        "SESSION_DB_PATH": "",
+        "PREFETCH_CDN": "false",
+        "METRICS_PORT": "0",
+    })
+    os.makedirs(os.environ["DOWNLOAD_DIR"], exist_ok=True)
+
+
+async def _timed(samples: dict, coro, nbytes=None):
+    samples["runs"] += 1
+    started = time.monotonic()
+    try:
+        result = await coro
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Benchmark op failed: {e}")
+        return None
+    elapsed = time.monotonic() - started
+    if result:
+        samples["seconds"].append(elapsed)
+        if nbytes is not None:
+            samples.setdefault("bytes", []).append(nbytes(result))
+    return result
+
+
+async def _run(args, site: FixtureSite) -> dict:
+    # Imported only now so config picks up the environment set by _isolate;
+    # a download-only run doesn't need Playwright installed
+    from downloader import downloader
+
+    ops = args.ops
+    samples = {op: {"runs": 0, "seconds": []} for op in ops}
+    browser = any(op in ops for op in ("search", "episodes", "cdn"))
+    if browser:
+        from scraper import scraper
+        await scraper.start()
+    try:
+        for run in range(args.runs):
+            episode_url: Optional[str] = site.first_episode_url()
+            if "search" in ops:
+                results = await _timed(samples["search"], scraper.search(args.query))
+                if results:
+                    episode_url = results[0]["url"]
+            if "episodes" in ops:
+                episodes = await _timed(samples["episodes"], scraper.get_series_episodes(episode_url))
+                if episodes:
+                    episode_url = episodes[-1]["url"]
+
+            slug = episode_url.rstrip("/").rsplit("/", 1)[-1]
+            cdn_url = site.media_url(slug)
+            if "cdn" in ops:
+                cdn_url = await _timed(
+                    samples["cdn"], scraper.get_cdn_url(episode_url, use_cache=False)
+                ) or cdn_url
+            if "download" in ops:
+                fp = await _timed(
+                    samples["download"],
+                    downloader.download(cdn_url, f"bench-{run}"),
+                    nbytes=os.path.getsize,
+                )
+                if fp:
+                    os.remove(fp)
+    finally:
+        if browser:
+            await scraper.stop()
+    return samples
+
+
+def _print_report(summary: dict, baseline: Optional[dict]) -> None:
+    header = f"{'op':<10}{'ok':>7}{'min':>9}{'p50':>9}{'p90':>9}{'max':>9}{'mean':>9}{'MB/s':>9}"
+    if baseline:
+        header += f"{'Δp50':>10}"
+    print(header)
+    for op, s in summary.items():
+        if not s.get("ok"):
+            print(f"{op:<10}{'0/' + str(s['runs']):>7}  (no successful runs)")
+            continue
+        line = f"{op:<10}{str(s['ok']) + '/' + str(s['runs']):>7}"
+        line += "".join(f"{s[k]:>9.3f}" for k in ("min", "p50", "p90", "max", "mean"))
+        line += f"{s['mb_per_s']:>9.2f}" if "mb_per_s" in s else f"{'':>9}"
+        old = (baseline or {}).get(op)
+        if old and old.get("p50"):
+            line += f"{(s['p50'] - old['p50']) / old['p50'] * 100:>+9.1f}%"
+        print(line)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--ops", default=",".join(OPS), help=f"comma-separated subset of {','.join(OPS)}")
+    parser.add_argument("--query", default="maid")
+    parser.add_argument("--latency", type=float, default=50, help="per-request server latency, ms")
+    parser.add_argument("--bandwidth", type=_size, default=0, help="per-connection media rate, bytes/s (0 = unthrottled)")
+    parser.add_argument("--media", choices=("hls", "mp4"), default="hls")
+    parser.add_argument("--cdn-path", choices=("request", "xhr"), default="request",
+                        help="how the player reveals the manifest")
+    parser.add_argument("--no-fast-path", action="store_true", help="skip the HTTP tier, browser only")
+    parser.add_argument("--no-api", action="store_true",
+                        help="fixture answers 404 on its JSON APIs (fast path falls back to page state)")
+    parser.add_argument("--segments", type=int, default=20)
+    parser.add_argument("--segment-size", type=_size, default=256 * 1024)
+    parser.add_argument("--json", metavar="PATH", help="write raw samples and summary here")
+    parser.add_argument("--compare", metavar="PATH", help="earlier --json output to diff p50 against")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    args.ops = [op for op in args.ops.split(",") if op]
+    unknown = set(args.ops) - set(OPS)
+    if unknown:
+        parser.error(f"unknown ops: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.ERROR,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    site = FixtureSite(
+        latency=args.latency / 1000,
+        bandwidth=args.bandwidth,
+        media=args.media,
+        segments=args.segments,
+        segment_size=args.segment_size,
+        cdn_path=args.cdn_path,
+        api=not args.no_api,
+    )
+    workdir = tempfile.mkdtemp(prefix="hanime-bench-")
+    try:
+        _isolate(site.start(), workdir, fast_path=not args.no_fast_path)
+        samples = asyncio.run(_run(args, site))
+    finally:
+        site.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {op: _summary(s) for op, s in samples.items()}
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["summary"]
+    _print_report(summary, baseline)
+    print(f"fixture: {site.requests} requests, {site.bytes_sent / 1024 ** 2:.1f} MiB media sent")
+
+    if args.json:
+        params = {k: v for k, v in vars(args).items() if k not in ("json", "compare", "verbose")}
+        with open(args.json, "w") as f:
+            json.dump({"params": params, "summary": summary, "samples": samples}, f, indent=2)
+    return 0 if all(s.get("ok") for s in summary.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,7 @@ import asyncio
 import logging
 import os
 import time
+from typing import Optional
 
 from pyrogram import Client, filters, idle
 from pyrogram.types import (
@@ -13,8 +14,29 @@ from pyrogram.types import (
 from pyrogram.errors import FloodWait, MessageNotModified
 
 import config
-from scraper import scraper
+from cache import FileIdStore
+from scraper import canonical_url, scraper
 from downloader import downloader
+from executors import download_executor, postprocess_executor
+from journal import journal
+from metrics import (
+    BROWSER_CONTEXTS,
+    CACHE_REQUESTS,
+    DELIVERY_SECONDS,
+    EXECUTOR_RUNS,
+    EXECUTOR_TASKS,
+    FAILURES,
+    SESSION_BYTES,
+    SESSION_DROPS,
+    SESSION_ENTRIES,
+    STAGE_JOBS,
+    UPLOAD_THROUGHPUT,
+    registry,
+)
+from progress import progress
+from scheduler import Job, PRIORITY_LOW, PRIORITY_NORMAL, scheduler
+from sessions import Entry, Session, sessions
+from uploader import StreamingUpload
 
 logging.basicConfig(
     level=logging.INFO,
@@ -22,12 +44,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# In-memory state per user
-user_state: dict = {}
-
 # Global event loop — set in main(), used by yt-dlp thread
 _loop: asyncio.AbstractEventLoop = None
 
+# Strong references to running delivery tasks
+_background_tasks: set = set()
+
+# Deliveries in flight, keyed by canonical episode URL
+_inflight: dict = {}
+
+# Episodes already uploaded once, re-sent by Telegram file_id
+file_ids = FileIdStore(config.FILE_ID_DB_PATH)
+
 
 # ------------------------------------------------------------------ #
 #  Helpers                                                             #
@@ -40,17 +68,19 @@ def format_bytes(size: int) -> str:
     return f"{size:.1f} TB"
 
 
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m{seconds:02d}s" if minutes else f"{seconds}s"
+
+
 async def safe_edit(msg: Message, text: str, **kwargs):
     try:
         await msg.edit_text(text, **kwargs)
     except MessageNotModified:
         pass
-    except FloodWait as e:
-        await asyncio.sleep(e.value)
-        try:
-            await msg.edit_text(text, **kwargs)
-        except Exception:
-            pass
+    except FloodWait:
+        # Don't stall the handler — the progress service retries after the wait
+        progress.update(msg, text, **kwargs)
     except Exception as e:
         logger.debug(f"safe_edit ignored: {e}")
 
@@ -64,9 +94,9 @@ async def cmd_start(client: Client, message: Message):
         "🎌 **Hanime Downloader Bot**\n\n"
         "**Commands:**\n"
         "• `/search <n>` — Search hanime.tv and browse episodes\n"
-        "• `/dl <url>` — Download directly from a hanime.tv episode URL\n"
+        "• `/dl <url> [url…]` — Download one or more hanime.tv episode URLs\n"
         "• `/help` — Show this message\n\n"
-        "_After `/search`, pick a title → pick an episode → bot downloads & sends it._"
+        "_After `/search`, pick a title → pick an episode (or **Download all**) → bot downloads & sends it._"
     )
 
 
@@ -97,16 +127,14 @@ async def cmd_search(client: Client, message: Message):
         await safe_edit(status_msg, "😔 No results found. Try a different keyword.")
         return
 
-    user_state[uid] = {
-        "search_results": results,
-        "selected_url": None,
-        "episodes": [],
-        "query": query,
-    }
+    old = sessions.get(uid)
+    if old:
+        _cancel_prefetch(old)
+    session = sessions.start(uid, query, results)
 
     buttons = [
-        [InlineKeyboardButton(f"📺 {r['title'][:50]}", callback_data=f"series:{uid}:{i}")]
-        for i, r in enumerate(results)
+        [InlineKeyboardButton(f"📺 {r.title[:50]}", callback_data=f"series:{uid}:{i}")]
+        for i, r in enumerate(session.results)
     ]
 
     await safe_edit(
@@ -124,18 +152,28 @@ async def cmd_dl(client: Client, message: Message):
     args = message.command[1:]
     if not args:
         await message.reply_text(
-            "❓ **Usage:** `/dl <hanime.tv episode URL>`\n"
+            "❓ **Usage:** `/dl <hanime.tv episode URL> [more URLs…]`\n"
             "Example: `/dl https://hanime.tv/videos/hentai/my-anime-1`"
         )
         return
 
-    url = args[0].strip()
-    if "hanime.tv" not in url:
-        await message.reply_text("❌ Please provide a valid **hanime.tv** URL.")
+    urls = [a.strip() for a in args if a.strip()]
+    if any("hanime.tv" not in url for url in urls):
+        await message.reply_text("❌ Please provide valid **hanime.tv** URLs.")
         return
 
-    title = url.rstrip("/").split("/")[-1].replace("-", " ").title()
-    await _download_and_send(client, message, url, title)
+    episodes = [
+        {"url": url, "title": url.rstrip("/").split("/")[-1].replace("-", " ").title()}
+        for url in dict.fromkeys(urls)
+    ]
+    if len(episodes) == 1:
+        _spawn(_download_and_send(
+            client, message, episodes[0]["url"], episodes[0]["title"], message.from_user.id
+        ))
+    else:
+        _spawn(_run_batch(
+            client, message, message.from_user.id, f"{len(episodes)} episodes", episodes
+        ))
 
 
 # ------------------------------------------------------------------ #
@@ -150,43 +188,55 @@ async def cb_series(client: Client, cb: CallbackQuery):
         await cb.answer("❌ This is not your search session!", show_alert=True)
         return
 
-    state = user_state.get(uid)
-    if not state:
+    session = sessions.get(uid)
+    if not session or idx >= len(session.results):
         await cb.answer("⌛ Session expired. Run /search again.", show_alert=True)
         return
 
-    selected = state["search_results"][idx]
+    selected = session.results[idx]
     await cb.answer()
-    await cb.message.edit_text(f"⏳ Loading episodes for **{selected['title']}**…")
+    await cb.message.edit_text(f"⏳ Loading episodes for **{selected.title}**…")
 
     try:
-        episodes = await scraper.get_series_episodes(selected["url"])
+        found = await scraper.get_series_episodes(selected.url)
     except Exception as e:
         logger.error(f"Episode fetch error: {e}")
         await cb.message.edit_text(f"❌ Failed to load episodes:\n`{e}`")
         return
 
-    if not episodes:
-        episodes = [{"title": selected["title"], "url": selected["url"], "number": 1}]
-
-    state["episodes"] = episodes
-    state["selected_url"] = selected["url"]
-    state["selected_title"] = selected["title"]
+    episodes = [Entry.from_dict(ep) for ep in found] or [Entry(selected.title, selected.url, 1)]
+    session.select(selected, episodes)
+    sessions.save(session)
 
     buttons = [
         [InlineKeyboardButton(
-            f"🎬 {ep['title'][:48] if ep.get('title') else f'Episode {ep.get('number', i + 1)}'}",
+            f"🎬 {ep.title[:48] if ep.title else 'Episode ' + str(ep.number or i + 1)}",
             callback_data=f"episode:{uid}:{i}"
         )]
         for i, ep in enumerate(episodes)
     ]
+    if len(episodes) > 1:
+        buttons.append([InlineKeyboardButton(
+            f"📥 Download all ({len(episodes)})", callback_data=f"all:{uid}"
+        )])
     buttons.append([InlineKeyboardButton("🔙 Back to results", callback_data=f"back:{uid}")])
 
     await cb.message.edit_text(
-        f"📋 **{selected['title']}**\n{len(episodes)} episode(s) — tap to download:",
+        f"📋 **{selected.title}**\n{len(episodes)} episode(s) — tap to download:",
         reply_markup=InlineKeyboardMarkup(buttons),
     )
 
+    # The user will most likely tap one of these — resolve CDN URLs with
+    # spare browser capacity so the tap can skip extraction
+    _cancel_prefetch(session)
+    session.prefetch = scraper.prefetch_cdn_urls([ep.url for ep in episodes])
+
+
+def _cancel_prefetch(session: Session) -> None:
+    task, session.prefetch = session.prefetch, None
+    if task and not task.done():
+        task.cancel()
+
 
 # ------------------------------------------------------------------ #
 #  Callback: back to search results                                    #
@@ -199,19 +249,19 @@ async def cb_back(client: Client, cb: CallbackQuery):
         await cb.answer("❌ Not your session!", show_alert=True)
         return
 
-    state = user_state.get(uid)
-    if not state:
+    session = sessions.get(uid)
+    if not session:
         await cb.answer("⌛ Session expired. Run /search again.", show_alert=True)
         return
 
     await cb.answer()
-    results = state["search_results"]
+    _cancel_prefetch(session)
     buttons = [
-        [InlineKeyboardButton(f"📺 {r['title'][:50]}", callback_data=f"series:{uid}:{i}")]
-        for i, r in enumerate(results)
+        [InlineKeyboardButton(f"📺 {r.title[:50]}", callback_data=f"series:{uid}:{i}")]
+        for i, r in enumerate(session.results)
     ]
     await cb.message.edit_text(
-        f"🔎 Results for `{state.get('query', '...')}` — pick a title:",
+        f"🔎 Results for `{session.query or '...'}` — pick a title:",
         reply_markup=InlineKeyboardMarkup(buttons),
     )
 
@@ -228,38 +278,343 @@ async def cb_episode(client: Client, cb: CallbackQuery):
         await cb.answer("❌ Not your session!", show_alert=True)
         return
 
-    state = user_state.get(uid)
-    if not state or not state.get("episodes"):
+    session = sessions.get(uid)
+    if not session or idx >= len(session.episodes):
         await cb.answer("⌛ Session expired. Run /search again.", show_alert=True)
         return
 
-    episode = state["episodes"][idx]
+    episode = session.episodes[idx]
     await cb.answer("⬇️ Starting download…")
-    await _download_and_send(client, cb.message, episode["url"], episode["title"])
+    _spawn(_download_and_send(client, cb.message, episode.url, episode.title, uid))
+
+
+# ------------------------------------------------------------------ #
+#  Callback: download every episode of the series                      #
+# ------------------------------------------------------------------ #
+@Client.on_callback_query(filters.regex(r"^all:\d+$"))
+async def cb_all(client: Client, cb: CallbackQuery):
+    uid = int(cb.data.split(":")[1])
+
+    if cb.from_user.id != uid:
+        await cb.answer("❌ Not your session!", show_alert=True)
+        return
+
+    session = sessions.get(uid)
+    if not session or not session.episodes:
+        await cb.answer("⌛ Session expired. Run /search again.", show_alert=True)
+        return
+
+    await cb.answer(f"⬇️ Queuing {len(session.episodes)} episodes…")
+    episodes = [{"url": ep.url, "title": ep.title} for ep in session.episodes]
+    _spawn(_run_batch(client, cb.message, uid, session.selected_title or "Series", episodes))
 
 
 # ------------------------------------------------------------------ #
 #  Core: CDN extract → yt-dlp download → Telegram upload              #
 # ------------------------------------------------------------------ #
+def _spawn(coro) -> asyncio.Task:
+    """Run a delivery in the background so the handler returns at once."""
+    task = asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+class _Delivery:
+    """
+    One in-flight episode delivery. Everyone who asks for the same episode
+    while it runs attaches here: their status message mirrors the owner's
+    progress and they get the video once it has been uploaded.
+    """
+
+    __slots__ = (
+        "key", "page_url", "title", "chat_id", "subscribers", "last_text",
+        "journal_id", "resume", "batch", "delivered",
+    )
+
+    def __init__(self, key: str, page_url: str, title: str, chat_id: int):
+        self.key = key
+        self.page_url = page_url
+        self.title = title
+        self.chat_id = chat_id
+        self.subscribers: list[Message] = []  # status messages, owner first
+        self.last_text = ""
+        self.journal_id: Optional[int] = None
+        self.resume: Optional[dict] = None  # journal row of an interrupted run
+        # Batch episodes report to the batch message instead of their own
+        self.batch: Optional["_Batch"] = None
+        self.delivered = False
+
+    @property
+    def followers(self) -> list[Message]:
+        """Status messages of requests that attached to this delivery."""
+        return list(self.subscribers) if self.batch else self.subscribers[1:]
+
+    def update(self, text: str):
+        self.last_text = text
+        for status in self.subscribers:
+            progress.update(status, text)
+        if self.batch:
+            self.batch.refresh()
+
+    async def delete_statuses(self):
+        for status in self.subscribers:
+            progress.discard(status)
+            try:
+                await status.delete()
+            except Exception as e:
+                logger.debug(f"Status delete ignored: {e}")
+
+
+class _Batch:
+    """
+    Several episodes requested at once, reported in one status message.
+    Up to BATCH_PIPELINE_DEPTH episodes are in flight, so while one is
+    downloading the next is already being extracted; the scheduler's stage
+    limits bound the overall concurrency.
+    """
+
+    __slots__ = ("title", "status", "job", "episodes", "jobs", "deliveries", "results", "started")
+
+    def __init__(self, title: str, status: Message, job: Job, episodes: list[dict]):
+        self.title = title
+        self.status = status
+        self.job = job
+        self.episodes = episodes
+        self.jobs: list[Optional[Job]] = [None] * len(episodes)
+        self.deliveries: list[Optional[_Delivery]] = [None] * len(episodes)
+        self.results: list[Optional[str]] = [None] * len(episodes)
+        self.started = time.monotonic()
+
+    def finish(self, index: int, result: str) -> None:
+        self.results[index] = result
+        self.refresh()
+
+    def _line(self, index: int) -> str:
+        name = (self.episodes[index].get("title") or f"Episode {index + 1}")[:40]
+        result = self.results[index]
+        if result:
+            return f"{result} {name}"
+        job, delivery = self.jobs[index], self.deliveries[index]
+        if job is None or job.stage is None:
+            return f"🕒 {name}"
+        icon = {"extract": "🕵️", "download": "⬇️", "upload": "📤"}.get(job.stage, "⏳")
+        detail = ""
+        if delivery and "%" in delivery.last_text:
+            # The percentage from the episode's own progress text
+            head = delivery.last_text.split("%", 1)[0]
+            detail = " " + head.rsplit(" ", 1)[-1] + "%"
+        return f"{icon} {name}{detail}"
+
+    def refresh(self) -> None:
+        total = len(self.episodes)
+        done = sum(1 for r in self.results if r)
+        delivered = sum(1 for r in self.results if r in ("✅", "⚡"))
+        elapsed = format_duration(time.monotonic() - self.started)
+        if done == total:
+            head = f"📦 **{self.title}** — {delivered}/{total} delivered in {elapsed}"
+        else:
+            head = f"📦 **{self.title}** — {done}/{total} done · ⏱ {elapsed}"
+        lines = [self._line(i) for i in range(total)]
+        progress.update(self.status, head + "\n\n" + "\n".join(lines))
+
+
 async def _download_and_send(
     client: Client,
     trigger_msg: Message,
     page_url: str,
     title: str,
+    user_id: int,
+    priority: int = PRIORITY_NORMAL,
+    resume: Optional[dict] = None,
+    batch: Optional[_Batch] = None,
+    index: int = 0,
 ):
-    # ── Step 1: Extract CDN URL via Playwright ──────────────────────
-    status = await trigger_msg.reply_text(
-        f"🕵️ **Extracting CDN URL…**\n"
-        f"🎬 {title}\n"
-        f"_This can take up to 30 seconds_"
-    )
+    """
+    Deliver one episode to the chat of trigger_msg. resume is a journal row
+    left by an interrupted run: its status message is reused and the
+    download continues from the recorded progress. Episodes of a batch run
+    under the batch's admission and report into its status message.
+    """
+    started = time.monotonic()
+    key = canonical_url(page_url)
+    if await _send_cached(client, trigger_msg.chat.id, key, page_url, title):
+        DELIVERY_SECONDS.observe(time.monotonic() - started, result="cached")
+        if batch:
+            batch.finish(index, "⚡")
+        return
+
+    delivery = _inflight.get(key)
+    if delivery:
+        status = await trigger_msg.reply_text(
+            delivery.last_text or f"🔗 **Joining download in progress:** {title}"
+        )
+        delivery.subscribers.append(status)
+        logger.info(f"Coalesced request for {key} ({len(delivery.subscribers)} waiting)")
+        if batch:
+            batch.finish(index, "🔗")
+        return
 
-    cdn_url = await scraper.get_cdn_url(page_url)
+    job = scheduler.child_job(batch.job) if batch else scheduler.new_job(user_id, priority)
+    if job is None:
+        await trigger_msg.reply_text(
+            f"⏳ You already have {config.MAX_JOBS_PER_USER} downloads queued or running.\n"
+            "Wait for one to finish and try again."
+        )
+        return
+
+    delivery = _Delivery(key, page_url, title, trigger_msg.chat.id)
+    _inflight[key] = delivery
+    interrupted = False
+    try:
+        if batch:
+            delivery.batch = batch
+            batch.jobs[index] = job
+            batch.deliveries[index] = delivery
+            # No per-episode status message; a restart re-announces it on its own
+            delivery.journal_id = journal.create(key, page_url, title, user_id, delivery.chat_id, 0)
+        else:
+            if resume:
+                delivery.resume = resume
+                status = trigger_msg
+            else:
+                status = await trigger_msg.reply_text(f"🕒 **Queued:** {title}")
+            delivery.subscribers.append(status)
+            delivery.journal_id = journal.create(
+                key, page_url, title, user_id, status.chat.id, status.id
+            )
+        await _run_job(client, delivery, job)
+    except asyncio.CancelledError:
+        # Shutdown mid-job: keep the journal row so the next start resumes it
+        interrupted = True
+        raise
+    except Exception as e:
+        logger.error(f"Job failed for {page_url}: {e}")
+        FAILURES.inc(op="job")
+        delivery.update(f"❌ **Failed:** {title}\n`{e}`")
+    finally:
+        if _inflight.get(key) is delivery:
+            del _inflight[key]
+        scheduler.finish(job)
+        if not interrupted:
+            journal.finish(delivery.journal_id)
+            DELIVERY_SECONDS.observe(
+                time.monotonic() - started,
+                result="delivered" if delivery.delivered else "failed",
+            )
+            if batch:
+                batch.finish(index, "✅" if delivery.delivered else "❌")
+
+
+async def _run_batch(
+    client: Client,
+    trigger_msg: Message,
+    user_id: int,
+    title: str,
+    episodes: list[dict],
+):
+    """Deliver several episodes as one pipelined batch."""
+    episodes = episodes[:config.BATCH_MAX_EPISODES]
+    job = scheduler.new_job(user_id, PRIORITY_LOW)
+    if job is None:
+        await trigger_msg.reply_text(
+            f"⏳ You already have {config.MAX_JOBS_PER_USER} downloads queued or running.\n"
+            "Wait for one to finish and try again."
+        )
+        return
+
+    try:
+        status = await trigger_msg.reply_text(f"📦 **{title}** — queuing {len(episodes)} episodes…")
+        batch = _Batch(title, status, job, episodes)
+        window = asyncio.Semaphore(max(1, config.BATCH_PIPELINE_DEPTH))
+
+        async def run_one(index: int, episode: dict):
+            async with window:
+                await _download_and_send(
+                    client, trigger_msg, episode["url"],
+                    episode.get("title") or f"{title} {index + 1}",
+                    user_id, PRIORITY_LOW, batch=batch, index=index,
+                )
+
+        batch.refresh()
+        await asyncio.gather(*(run_one(i, ep) for i, ep in enumerate(episodes)))
+        logger.info(f"Batch {title!r} done: {batch.results}")
+    finally:
+        scheduler.finish(job)
+
+
+async def _send_cached(
+    client: Client, chat_id: int, key: str, page_url: str, title: str
+) -> bool:
+    """Re-send a previously uploaded episode by file_id. True on success."""
+    cached = file_ids.get(key)
+    if not cached:
+        return False
+    try:
+        await client.send_video(
+            chat_id=chat_id,
+            video=cached["file_id"],
+            caption=f"🎌 **{cached.get('title') or title}**\n🔗 {page_url}",
+            supports_streaming=True,
+        )
+    except Exception as e:
+        # file_id no longer usable — forget it and run the full pipeline
+        logger.warning(f"Cached file_id for {key} failed, re-downloading: {e}")
+        file_ids.delete(key)
+        return False
+    logger.info(f"⚡ Delivered from file_id cache: {title}")
+    return True
+
+
+def _queued_notice(delivery: _Delivery, stage: str):
+    async def on_wait(position: int):
+        delivery.update(
+            f"🕒 **Queued for {stage}** — position {position}\n"
+            f"🎬 {delivery.title}"
+        )
+    return on_wait
+
+
+async def _run_job(client: Client, delivery: _Delivery, job: Job):
+    page_url, title = delivery.page_url, delivery.title
+    caption = f"🎌 **{title}**\n🔗 {page_url}"
+
+    # A download that finished before the restart only needs uploading
+    done = delivery.resume
+    if (
+        done
+        and done["stage"] in ("downloaded", "upload")
+        and done["quality"]
+        and done["output_path"]
+        and os.path.isfile(done["output_path"])
+    ):
+        logger.info(f"Resuming upload of {done['output_path']}")
+        journal.update(
+            delivery.journal_id,
+            stage="downloaded",
+            output_path=done["output_path"],
+            quality=done["quality"],
+            top_quality=done["top_quality"],
+        )
+        await _deliver_file(
+            client, delivery, job, done["output_path"], caption,
+            done["quality"], bool(done["top_quality"]),
+        )
+        return
+
+    # ── Step 1: Extract CDN URL via Playwright ──────────────────────
+    async with scheduler.stage(job, "extract", _queued_notice(delivery, "extraction")):
+        delivery.update(
+            f"🕵️ **Extracting CDN URL…**\n"
+            f"🎬 {title}\n"
+            f"_This can take up to 30 seconds_"
+        )
+        journal.update(delivery.journal_id, stage="extract")
+        cdn_url = await scraper.get_cdn_url(page_url)
 
     if cdn_url:
         cdn_display = cdn_url[:70] + "…" if len(cdn_url) > 70 else cdn_url
-        await safe_edit(
-            status,
+        delivery.update(
             f"✅ CDN URL found!\n"
             f"⬇️ **Downloading:** {title}\n"
             f"`{cdn_display}`"
@@ -267,20 +622,56 @@ async def _download_and_send(
     else:
         logger.warning("CDN not intercepted — falling back to page URL for yt-dlp")
         cdn_url = page_url
-        await safe_edit(
-            status,
+        delivery.update(
             f"⚠️ CDN not intercepted, trying yt-dlp directly…\n"
             f"⬇️ **Downloading:** {title}"
         )
 
-    # ── Step 2: Download via yt-dlp ─────────────────────────────────
+    # A resume only applies to the same stream it was recorded against
+    resume = delivery.resume if delivery.resume and delivery.resume.get("cdn_url") == cdn_url else None
+
+    # ── Step 2: Download via yt-dlp (upload streams alongside) ──────
     last_update = [0.0]
+    last_journal = [0.0]
+
+    stream = None
+    stream_task = None
+    if config.STREAMING_UPLOAD:
+        stream = StreamingUpload(client, f"{title}.mp4", _loop)
+
+        async def _stream_upload():
+            # Only take an upload slot once we know the format can stream
+            if not await stream.wait_ready():
+                return None
+            async with scheduler.stage(job, "upload"):
+                upload_started = time.monotonic()
+                sent = await stream.send(delivery.chat_id, caption)
+                if sent:
+                    UPLOAD_THROUGHPUT.observe(
+                        stream.uploaded / max(time.monotonic() - upload_started, 1e-6),
+                        mode="stream",
+                    )
+                return sent
+
+        stream_task = asyncio.create_task(_stream_upload())
 
     def progress_hook(d):
+        if stream:
+            stream.feed(d)
         if d["status"] != "downloading":
             return
         now = time.time()
-        if now - last_update[0] < 4:
+        if now - last_journal[0] >= 5:
+            last_journal[0] = now
+            journal.update(
+                delivery.journal_id,
+                output_path=d.get("tmpfilename") or d.get("filename"),
+                fragment_index=d.get("fragment_index") or 0,
+                fragment_count=d.get("fragment_count") or 0,
+                part_bytes=d.get("part_bytes") or 0,
+                bytes_done=d.get("downloaded_bytes") or 0,
+            )
+        if now - last_update[0] < 1:
             return
         last_update[0] = now
 
@@ -299,78 +690,308 @@ async def _download_and_send(
             f"📦 {format_bytes(downloaded)} / {format_bytes(total)}\n"
             f"⚡ {format_bytes(int(speed))}/s  ⏱ ETA {eta}s"
         )
+        if stream and stream.uploaded:
+            text += f"\n📤 {format_bytes(stream.uploaded)} uploaded"
         if _loop and not _loop.is_closed():
-            asyncio.run_coroutine_threadsafe(safe_edit(status, text), _loop)
+            _loop.call_soon_threadsafe(delivery.update, text)
 
-    file_path = await downloader.download(cdn_url, title, progress_hook)
+    file_path = None
+    sent = None
+    try:
+        async with scheduler.stage(job, "download", _queued_notice(delivery, "download")):
+            journal.update(delivery.journal_id, stage="download", cdn_url=cdn_url)
+
+            # Size the download first instead of finding out after fetching it
+            plan = await downloader.plan(cdn_url)
+            if not plan.fits:
+                if stream:
+                    stream.abort()
+                delivery.update(
+                    f"⚠️ **Too large for Telegram:** {title}\n"
+                    f"Smallest available version ({plan.label}) is about "
+                    f"{format_bytes(plan.estimate)}; the bot limit is {config.MAX_FILE_SIZE_MB} MB.\n"
+                    "Nothing was downloaded."
+                )
+                return
+            if plan.estimate:
+                delivery.update(
+                    f"⬇️ **Downloading:** {title}\n"
+                    f"🎞 {plan.label} · ~{format_bytes(plan.estimate)}"
+                )
+
+            expired = []
+            file_path = await downloader.download(
+                plan.url,
+                title,
+                progress_hook,
+                on_expired=lambda: expired.append(True),
+                streaming=stream is not None,
+                resume=resume,
+                format_spec=plan.format_spec,
+            )
+
+            if not file_path and expired and cdn_url != page_url:
+                # Signed URL went stale (403/410) — drop it and resolve a fresh one once
+                scraper.invalidate_cdn_url(page_url)
+                if stream:
+                    stream.abort()
+                delivery.update(f"♻️ CDN link expired, re-extracting…\n🎬 {title}")
+                fresh_url = await scraper.get_cdn_url(page_url, use_cache=False)
+                if fresh_url:
+                    journal.update(delivery.journal_id, cdn_url=fresh_url, fragment_index=0, part_bytes=0)
+                    plan = await downloader.plan(fresh_url)
+                    if plan.fits:
+                        file_path = await downloader.download(
+                            plan.url, title, progress_hook, format_spec=plan.format_spec
+                        )
+
+            if not file_path and cdn_url != page_url:
+                # The top-ranked stream failed — fall back to the runners-up
+                # seen during the same extraction
+                for alt_url in scraper.cdn_alternates(page_url):
+                    if stream:
+                        stream.abort()
+                    delivery.update(f"🔁 Stream failed, trying another one…\n🎬 {title}")
+                    journal.update(delivery.journal_id, cdn_url=alt_url, fragment_index=0, part_bytes=0)
+                    plan = await downloader.plan(alt_url)
+                    if not plan.fits:
+                        continue
+                    file_path = await downloader.download(
+                        plan.url, title, progress_hook, format_spec=plan.format_spec
+                    )
+                    if file_path:
+                        break
+
+        if file_path:
+            journal.update(
+                delivery.journal_id,
+                stage="downloaded",
+                output_path=file_path,
+                quality=plan.label,
+                top_quality=int(plan.top),
+            )
+
+        if stream_task:
+            if file_path:
+                stream.finish(file_path)
+            else:
+                stream.abort()
+            if stream.uploaded:
+                delivery.update(f"📤 **Finishing upload:** {title}…")
+            try:
+                sent = await stream_task
+            except Exception as e:
+                logger.warning(f"Streaming upload failed, falling back to normal upload: {e}")
+    finally:
+        if stream_task and not stream_task.done():
+            # Left early (plan didn't fit, or an error) before the file was
+            # handed over — release the upload slot and the partial file
+            stream.abort()
+            await asyncio.gather(stream_task, return_exceptions=True)
 
     if not file_path:
-        await safe_edit(
-            status,
+        delivery.update(
             f"❌ **Download failed** for _{title}_\n"
             "The CDN may be rate-limiting or the URL expired.\n"
             "Try again or use `/dl <url>` directly."
         )
         return
 
+    await _deliver_file(client, delivery, job, file_path, caption, plan.label, plan.top, sent)
+
+
+async def _deliver_file(
+    client: Client,
+    delivery: _Delivery,
+    job: Job,
+    file_path: str,
+    caption: str,
+    quality: str,
+    top: bool,
+    sent: Optional[Message] = None,
+) -> None:
+    """
+    Upload a finished download unless a streamed upload already sent it,
+    remember its file_id and re-send it to followers. Deletes the file.
+    """
+    title = delivery.title
+    journal.update(delivery.journal_id, stage="upload")
+    try:
+        if sent is None:
+            sent = await _upload_file(client, delivery, job, file_path, caption)
+            if sent is None:
+                return
+        logger.info(f"✅ Delivered: {title}")
+        delivery.delivered = True
+
+        media = sent.video or sent.document
+        meta = dict(
+            file_unique_id=media.file_unique_id,
+            file_size=media.file_size,
+            duration=getattr(media, "duration", None),
+            width=getattr(media, "width", None),
+            height=getattr(media, "height", None),
+            title=title,
+        )
+        # Keyed by the rendition actually sent; only the top one answers
+        # later requests for "best"
+        file_ids.put(delivery.key, quality, media.file_id, **meta)
+        if top and quality != "best":
+            file_ids.put(delivery.key, "best", media.file_id, **meta)
+
+        # From here on new requests are served from the file_id cache; stop
+        # taking subscribers so nobody attaches after the list below is read
+        if _inflight.get(delivery.key) is delivery:
+            del _inflight[delivery.key]
+
+        # Everyone who attached meanwhile gets the uploaded file by id
+        if delivery.followers:
+            file_id = media.file_id
+            for status in delivery.followers:
+                try:
+                    await client.send_video(
+                        chat_id=status.chat.id,
+                        video=file_id,
+                        caption=caption,
+                        supports_streaming=True,
+                    )
+                except Exception as e:
+                    logger.error(f"Re-send to chat {status.chat.id} failed: {e}")
+                    progress.update(status, f"❌ Upload failed:\n`{e}`")
+                    delivery.subscribers.remove(status)
+        await delivery.delete_statuses()
+    except Exception as e:
+        logger.error(f"Upload error: {e}")
+        FAILURES.inc(op="upload")
+        delivery.update(f"❌ Upload failed:\n`{e}`")
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+async def _upload_file(
+    client: Client,
+    delivery: _Delivery,
+    job: Job,
+    file_path: str,
+    caption: str,
+) -> Optional[Message]:
+    """Regular upload of a finished file. Returns None if it was refused."""
+    title = delivery.title
+
     # ── Step 3: Size check ──────────────────────────────────────────
     file_size = os.path.getsize(file_path)
     size_mb = file_size / (1024 * 1024)
 
     if size_mb > config.MAX_FILE_SIZE_MB:
-        await safe_edit(
-            status,
+        delivery.update(
             f"⚠️ **File too large:** {size_mb:.1f} MB\n"
             f"Telegram bot limit is {config.MAX_FILE_SIZE_MB} MB.\n"
             "File deleted from server."
         )
-        os.remove(file_path)
-        return
+        return None
 
-    await safe_edit(status, f"📤 **Uploading:** {title} ({size_mb:.1f} MB)…")
+    delivery.update(f"📤 **Uploading:** {title} ({size_mb:.1f} MB)…")
 
     # ── Step 4: Upload to Telegram ──────────────────────────────────
     last_upload = [0.0]
 
     async def upload_progress(current, total):
         now = time.time()
-        if now - last_upload[0] < 4:
+        if now - last_upload[0] < 1:
             return
         last_upload[0] = now
         pct = (current / total * 100) if total else 0
         filled = int(20 * pct / 100)
         bar = "█" * filled + "░" * (20 - filled)
-        await safe_edit(
-            status,
+        delivery.update(
             f"📤 **Uploading:** {title}\n"
             f"`[{bar}]` {pct:.1f}%\n"
             f"📦 {format_bytes(current)} / {format_bytes(total)}"
         )
 
-    try:
-        await client.send_video(
-            chat_id=trigger_msg.chat.id,
+    async with scheduler.stage(job, "upload", _queued_notice(delivery, "upload")):
+        upload_started = time.monotonic()
+        sent = await client.send_video(
+            chat_id=delivery.chat_id,
             video=file_path,
-            caption=f"🎌 **{title}**\n🔗 {page_url}",
+            caption=caption,
             supports_streaming=True,
             progress=upload_progress,
         )
-        await status.delete()
-        logger.info(f"✅ Delivered: {title}")
-    except Exception as e:
-        logger.error(f"Upload error: {e}")
-        await safe_edit(status, f"❌ Upload failed:\n`{e}`")
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        UPLOAD_THROUGHPUT.observe(
+            file_size / max(time.monotonic() - upload_started, 1e-6), mode="regular"
+        )
+        return sent
 
 
 # ------------------------------------------------------------------ #
 #  Main                                                                #
 # ------------------------------------------------------------------ #
+def _collect_metrics() -> None:
+    """Refresh gauges and mirrored totals right before a /metrics scrape."""
+    pool = scraper.pool_stats()
+    BROWSER_CONTEXTS.set(pool["leased"], state="leased")
+    BROWSER_CONTEXTS.set(pool["idle"], state="idle")
+    BROWSER_CONTEXTS.set(pool["prefetching"], state="prefetching")
+
+    for name, stage in scheduler.stats()["stages"].items():
+        STAGE_JOBS.set(stage["active"], stage=name, state="active")
+        STAGE_JOBS.set(stage["waiting"], stage=name, state="waiting")
+
+    for executor in (download_executor, postprocess_executor):
+        stats = executor.stats()
+        EXECUTOR_TASKS.set(stats["active"], executor=executor.name, state="active")
+        EXECUTOR_TASKS.set(stats["queued"], executor=executor.name, state="queued")
+        for result in ("completed", "failed", "cancelled"):
+            EXECUTOR_RUNS.set_total(stats[result], executor=executor.name, result=result)
+
+    cache_stats = scraper.cache.stats()
+    for result, per_kind in (("hit", cache_stats["hits"]), ("miss", cache_stats["misses"])):
+        for kind, count in per_kind.items():
+            CACHE_REQUESTS.set_total(count, cache=kind, result=result)
+    CACHE_REQUESTS.set_total(file_ids.hits, cache="file_id", result="hit")
+    CACHE_REQUESTS.set_total(file_ids.misses, cache="file_id", result="miss")
+    session_stats = sessions.stats()
+    CACHE_REQUESTS.set_total(session_stats["hits"], cache="session", result="hit")
+    CACHE_REQUESTS.set_total(session_stats["misses"], cache="session", result="miss")
+    SESSION_ENTRIES.set(session_stats["entries"])
+    SESSION_BYTES.set(session_stats["bytes"])
+    SESSION_DROPS.set_total(session_stats["expired"], reason="expired")
+    SESSION_DROPS.set_total(session_stats["evicted"], reason="evicted")
+
+
+async def _resume_jobs(client: Client):
+    """Restart deliveries that were cut short by the last shutdown or crash."""
+    for row in journal.unfinished():
+        status = None
+        try:
+            if row["status_msg_id"]:
+                status = await client.get_messages(row["chat_id"], row["status_msg_id"])
+                if status.empty:
+                    status = None
+            if status is None:
+                status = await client.send_message(row["chat_id"], f"🕒 **Queued:** {row['title']}")
+        except Exception as e:
+            logger.warning(f"Dropping journaled job {row['job_id']} ({row['page_url']}): {e}")
+            journal.finish(row["job_id"])
+            continue
+
+        logger.info(f"Resuming {row['page_url']} from stage {row['stage']}")
+        # The new run journals itself; this row has served its purpose
+        journal.finish(row["job_id"])
+        progress.update(status, f"♻️ **Bot restarted — resuming:** {row['title']}")
+        _spawn(_download_and_send(
+            client, status, row["page_url"], row["title"], row["user_id"], resume=row
+        ))
+
+
 async def main():
     global _loop
     _loop = asyncio.get_running_loop()
+    progress.start()
+    registry.add_collector(_collect_metrics)
+    await registry.start(config.METRICS_HOST, config.METRICS_PORT)
 
     logger.info("Starting Playwright browser…")
     await scraper.start()
@@ -386,13 +1007,23 @@ async def main():
     await bot.start()
     me = await bot.get_me()
     logger.info(f"Bot online as @{me.username} (id={me.id})")
+    await _resume_jobs(bot)
     logger.info("Listening for commands. Press Ctrl+C to stop.")
 
     await idle()
 
     logger.info("Shutting down…")
+    # Cancel deliveries first so they stay journaled instead of failing
+    # against a stopped client/browser
+    for task in list(_background_tasks):
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    await progress.stop()
+    await registry.stop()
     await bot.stop()
     await scraper.stop()
+    download_executor.shutdown()
+    postprocess_executor.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,331 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# One JSON message per line; episode lists are the largest payloads
+_LINE_LIMIT = 4 * 1024 * 1024
+# A call is re-queued this many times when its worker dies under it
+_MAX_REQUEUES = 1
+
+
+def _tcp_address(address: str) -> Optional[tuple[str, int]]:
+    """'host:port' → (host, port); anything with a slash is a socket path."""
+    if "/" in address or ":" not in address:
+        return None
+    host, _, port = address.rpartition(":")
+    return (host or "127.0.0.1", int(port)) if port.isdigit() else None
+
+
+async def connect(address: str) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    tcp = _tcp_address(address)
+    if tcp:
+        return await asyncio.open_connection(*tcp, limit=_LINE_LIMIT)
+    return await asyncio.open_unix_connection(address, limit=_LINE_LIMIT)
+
+
+def send(writer: asyncio.StreamWriter, message: dict) -> None:
+    writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+
+
+async def receive(reader: asyncio.StreamReader) -> Optional[dict]:
+    """Next message, or None once the peer has gone away."""
+    line = await reader.readline()
+    return json.loads(line) if line else None
+
+
+class WorkerError(RuntimeError):
+    """A scrape call failed inside a worker (or the worker was lost)."""
+
+
+class _Worker:
+    __slots__ = ("name", "writer", "capacity", "inflight", "served", "connected")
+
+    def __init__(self, name: str, writer: asyncio.StreamWriter, capacity: int):
+        self.name = name
+        self.writer = writer
+        self.capacity = max(1, capacity)
+        self.inflight: dict[int, "_Call"] = {}
+        self.served = 0
+        self.connected = time.monotonic()
+
+
+class _Call:
+    __slots__ = ("call_id", "method", "args", "kwargs", "future", "worker", "requeues")
+
+    def __init__(self, call_id: int, method: str, args: list, kwargs: dict, future: asyncio.Future):
+        self.call_id = call_id
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.worker: Optional[_Worker] = None
+        self.requeues = 0
+
+
+class ScrapeBroker:
+    """
+    Hands browser work to scraper worker processes over a local socket.
+    Workers connect, announce how many calls they run at once, and get
+    calls pushed to them least-loaded first; replies are matched back to
+    the waiting caller by call id. Cancelling a caller cancels the call in
+    its worker. The broker can spawn and supervise `spawn` local workers;
+    with a host:port address, workers on other machines may join too (a
+    token is then required). on_capacity is called with the new total
+    whenever a worker joins or leaves.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        spawn: int = 0,
+        token: str = "",
+        call_timeout: float = 180,
+        on_capacity: Optional[Callable[[int], None]] = None,
+    ):
+        self.address = address
+        self.spawn = spawn
+        self.token = token
+        self.call_timeout = call_timeout
+        self.on_capacity = on_capacity
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._workers: dict[str, _Worker] = {}
+        self._pending: deque[_Call] = deque()
+        self._ids = itertools.count(1)
+        self._supervisors: list[asyncio.Task] = []
+        self._processes: dict[int, asyncio.subprocess.Process] = {}
+        self._stopping = False
+        self.completed = 0
+        self.failed = 0
+        self.requeued = 0
+        self.restarts = 0
+
+    # ------------------------------------------------------------------ #
+    #  Lifecycle                                                           #
+    # ------------------------------------------------------------------ #
+    async def start(self) -> None:
+        tcp = _tcp_address(self.address)
+        if tcp and not self.token:
+            # Anyone who can reach the port would be trusted as a worker
+            logger.error(
+                f"Refusing to listen on {self.address} without SCRAPE_BROKER_TOKEN; "
+                "set a token or use a socket path"
+            )
+            raise ValueError("a TCP scrape broker address requires a token")
+        if tcp:
+            self._server = await asyncio.start_server(self._serve, *tcp, limit=_LINE_LIMIT)
+        else:
+            os.makedirs(os.path.dirname(self.address) or ".", exist_ok=True)
+            if os.path.exists(self.address):
+                os.unlink(self.address)  # stale socket from a previous run
+            self._server = await asyncio.start_unix_server(self._serve, self.address, limit=_LINE_LIMIT)
+        logger.info(f"Scrape broker listening on {self.address}")
+        loop = asyncio.get_running_loop()
+        self._supervisors = [loop.create_task(self._supervise(i)) for i in range(self.spawn)]
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for worker in list(self._workers.values()):
+            try:
+                send(worker.writer, {"type": "shutdown"})
+            except Exception:
+                pass
+        for call in self._pending:
+            if not call.future.done():
+                call.future.set_exception(WorkerError("scrape broker stopped"))
+        self._pending.clear()
+        # Give workers a moment to close their browsers before forcing it
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(p.wait() for p in self._processes.values())), timeout=15
+            )
+        except asyncio.TimeoutError:
+            for process in self._processes.values():
+                if process.returncode is None:
+                    process.kill()
+        for task in self._supervisors:
+            task.cancel()
+        await asyncio.gather(*self._supervisors, return_exceptions=True)
+        for worker in list(self._workers.values()):
+            self._drop(worker)
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if not _tcp_address(self.address) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    async def _supervise(self, index: int) -> None:
+        """Run local worker `index`, restarting it with backoff when it dies."""
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scrape_worker.py")
+        backoff = 1.0
+        while not self._stopping:
+            env = dict(os.environ, SCRAPE_WORKER_NAME=f"local-{index}")
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, script, "--connect", self.address, env=env
+            )
+            self._processes[index] = process
+            started = time.monotonic()
+            code = await process.wait()
+            if self._stopping:
+                return
+            self.restarts += 1
+            if time.monotonic() - started > 60:
+                backoff = 1.0
+            logger.warning(f"Scrape worker local-{index} exited ({code}); restarting in {backoff:.0f}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+    # ------------------------------------------------------------------ #
+    #  Calls                                                               #
+    # ------------------------------------------------------------------ #
+    async def call(self, method: str, *args, **kwargs) -> Any:
+        """Run scraper `method` in some worker and return its result."""
+        if self._stopping:
+            raise WorkerError("scrape broker stopped")
+        call = _Call(next(self._ids), method, list(args), kwargs, asyncio.get_running_loop().create_future())
+        self._pending.append(call)
+        self._dispatch()
+        try:
+            return await asyncio.wait_for(asyncio.shield(call.future), timeout=self.call_timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            self._abandon(call)
+            raise
+
+    def _abandon(self, call: _Call) -> None:
+        if call in self._pending:
+            self._pending.remove(call)
+        worker = call.worker
+        if worker and worker.inflight.pop(call.call_id, None):
+            try:
+                send(worker.writer, {"type": "cancel", "id": call.call_id})
+            except Exception:
+                pass
+            self._dispatch()
+        if not call.future.done():
+            call.future.cancel()
+
+    def _dispatch(self) -> None:
+        while self._pending:
+            free = [w for w in self._workers.values() if len(w.inflight) < w.capacity]
+            if not free:
+                return
+            worker = min(free, key=lambda w: len(w.inflight) / w.capacity)
+            call = self._pending.popleft()
+            call.worker = worker
+            worker.inflight[call.call_id] = call
+            try:
+                send(worker.writer, {
+                    "type": "call", "id": call.call_id, "method": call.method,
+                    "args": call.args, "kwargs": call.kwargs,
+                })
+            except Exception as e:
+                logger.warning(f"Scrape worker {worker.name} unreachable: {e}")
+                self._drop(worker)
+
+    def _drop(self, worker: _Worker) -> None:
+        """Forget a worker and re-queue (or fail) whatever it was running."""
+        if self._workers.get(worker.name) is not worker:
+            return
+        del self._workers[worker.name]
+        self._capacity_changed()
+        for call in worker.inflight.values():
+            call.worker = None
+            if call.future.done():
+                continue
+            if call.requeues < _MAX_REQUEUES:
+                call.requeues += 1
+                self.requeued += 1
+                self._pending.appendleft(call)
+            else:
+                self.failed += 1
+                call.future.set_exception(WorkerError(f"scrape worker {worker.name} lost"))
+        worker.inflight.clear()
+        try:
+            worker.writer.close()
+        except Exception:
+            pass
+        self._dispatch()
+
+    # ------------------------------------------------------------------ #
+    #  Worker connections                                                  #
+    # ------------------------------------------------------------------ #
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        worker: Optional[_Worker] = None
+        try:
+            hello = await asyncio.wait_for(receive(reader), timeout=30)
+            if not hello or hello.get("type") != "hello":
+                return
+            if self.token and hello.get("token") != self.token:
+                logger.warning(f"Rejected scrape worker {hello.get('name')}: bad token")
+                return
+            name = str(hello.get("name") or f"pid-{hello.get('pid')}")
+            old = self._workers.get(name)
+            if old:
+                self._drop(old)
+            worker = _Worker(name, writer, int(hello.get("capacity") or 1))
+            self._workers[name] = worker
+            logger.info(f"Scrape worker {name} joined (capacity {worker.capacity})")
+            self._capacity_changed()
+            self._dispatch()
+
+            while True:
+                message = await receive(reader)
+                if message is None:
+                    break
+                self._resolve(worker, message)
+        except (asyncio.TimeoutError, ConnectionError, ValueError) as e:
+            logger.debug(f"Scrape worker connection ended: {e}")
+        finally:
+            if worker:
+                logger.info(f"Scrape worker {worker.name} left")
+                self._drop(worker)
+            else:
+                writer.close()
+
+    def _resolve(self, worker: _Worker, message: dict) -> None:
+        call = worker.inflight.pop(message.get("id"), None)
+        if call is None:
+            return  # cancelled meanwhile
+        worker.served += 1
+        if not call.future.done():
+            if message.get("ok"):
+                self.completed += 1
+                call.future.set_result(message.get("result"))
+            else:
+                self.failed += 1
+                call.future.set_exception(WorkerError(message.get("error") or "scrape call failed"))
+        self._dispatch()
+
+    # ------------------------------------------------------------------ #
+    #  Introspection                                                       #
+    # ------------------------------------------------------------------ #
+    @property
+    def capacity(self) -> int:
+        return sum(w.capacity for w in self._workers.values())
+
+    def _capacity_changed(self) -> None:
+        if self.on_capacity and not self._stopping:
+            try:
+                self.on_capacity(self.capacity)
+            except Exception as e:
+                logger.warning(f"Capacity callback failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._workers),
+            "capacity": self.capacity,
+            "inflight": sum(len(w.inflight) for w in self._workers.values()),
+            "pending": len(self._pending),
+            "completed": self.completed,
+            "failed": self.failed,
+            "requeued": self.requeued,
+            "restarts": self.restarts,
+        }
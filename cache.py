@@ -0,0 +1,292 @@
+import base64
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from calendar import timegm
+from collections import OrderedDict
+from typing import Any, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive cache key for a search query."""
+    return " ".join(query.lower().split())
+
+
+# Query parameters CDNs commonly use for a unix-epoch expiry
+_EXPIRY_PARAMS = ("expires", "expire", "expiry", "exp", "e", "validto", "valid_to", "deadline")
+_TOKEN_PARAMS = ("hdnts", "__token__", "token", "hdnea")
+
+
+def _epoch(value: str) -> Optional[float]:
+    if not value.isdigit():
+        return None
+    ts = int(value)
+    if ts > 10**12:  # milliseconds
+        ts //= 1000
+    return float(ts) if ts > 10**9 else None
+
+
+def signed_url_expiry(url: str) -> Optional[float]:
+    """
+    Best-effort unix timestamp at which a signed CDN URL stops working.
+    Understands plain expiry params, AWS SigV4, Akamai-style tokens and
+    CloudFront policies. Returns None when nothing can be parsed.
+    """
+    parts = urlsplit(url)
+    query = {k.lower(): v[-1] for k, v in parse_qs(parts.query).items()}
+
+    for name in _EXPIRY_PARAMS:
+        ts = _epoch(query.get(name, ""))
+        if ts:
+            return ts
+
+    # AWS SigV4: X-Amz-Date=20240101T000000Z & X-Amz-Expires=<seconds>
+    if "x-amz-date" in query and query.get("x-amz-expires", "").isdigit():
+        try:
+            start = timegm(time.strptime(query["x-amz-date"], "%Y%m%dT%H%M%SZ"))
+            return float(start + int(query["x-amz-expires"]))
+        except ValueError:
+            pass
+
+    # Akamai / edge tokens: "st=…~exp=1700000000~acl=…"
+    for name in _TOKEN_PARAMS:
+        m = re.search(r"exp=(\d{10,13})", unquote(query.get(name, "")))
+        if m:
+            return _epoch(m.group(1))
+
+    # CloudFront custom policy: base64 JSON with "AWS:EpochTime"
+    policy = query.get("policy")
+    if policy:
+        try:
+            raw = policy.replace("-", "+").replace("_", "=").replace("~", "/")
+            raw += "=" * (-len(raw) % 4)
+            m = re.search(rb'"AWS:EpochTime"\s*:\s*(\d+)', base64.b64decode(raw))
+            if m:
+                return _epoch(m.group(1).decode())
+        except Exception:
+            pass
+
+    # Expiry baked into the path, e.g. /exp=1700000000/ or /expires_1700000000/
+    m = re.search(r"exp(?:ires)?[=_](\d{10})", parts.path, re.IGNORECASE)
+    if m:
+        return _epoch(m.group(1))
+    return None
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache with a TTL per kind of entry ("search",
+    "episodes", …) and optional write-through persistence to SQLite.
+    Values must be JSON-serialisable when persistence is enabled.
+
+    SQLite statements run under the same lock as the in-memory update so
+    both always agree; commits are batched to at most one per
+    commit_interval seconds, with flush() forcing the rest out.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttls: dict[str, float],
+        db_path: str = "",
+        commit_interval: float = 0.0,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.ttls = ttls
+        self.commit_interval = commit_interval
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+        self._entries: OrderedDict[tuple[str, str], tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits: dict[str, int] = {}
+        self._misses: dict[str, int] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._open_db(db_path)
+
+    # ------------------------------------------------------------------ #
+    #  Persistence                                                         #
+    # ------------------------------------------------------------------ #
+    def _open_db(self, db_path: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires REAL NOT NULL, PRIMARY KEY (kind, key))"
+            )
+            self._db.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT kind, key, value, expires FROM cache"
+                " ORDER BY expires DESC LIMIT ?",
+                (self.max_entries,),
+            ).fetchall()
+            # Oldest first so the freshest rows end up most-recently-used
+            for kind, key, value, expires in reversed(rows):
+                self._entries[(kind, key)] = (expires, json.loads(value))
+            logger.info(f"Cache loaded {len(rows)} entries from {db_path}")
+        except Exception as e:
+            logger.warning(f"Cache persistence disabled ({db_path}): {e}")
+            self._db = None
+
+    def _db_write(self, sql: str, params: tuple) -> None:
+        """Queue a statement; caller holds self._lock."""
+        if not self._db:
+            return
+        try:
+            self._db.execute(sql, params)
+            self._uncommitted += 1
+        except Exception as e:
+            logger.debug(f"Cache write ignored: {e}")
+            return
+        if time.monotonic() - self._last_commit >= self.commit_interval:
+            self._commit()
+
+    def _commit(self) -> None:
+        """Commit queued statements; caller holds self._lock."""
+        if not self._db or not self._uncommitted:
+            return
+        try:
+            self._db.commit()
+        except Exception as e:
+            logger.debug(f"Cache commit ignored: {e}")
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+    def flush(self) -> None:
+        """Commit any batched writes, e.g. before shutdown."""
+        with self._lock:
+            self._commit()
+
+    # ------------------------------------------------------------------ #
+    #  API                                                                 #
+    # ------------------------------------------------------------------ #
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end((kind, key))
+                self._hits[kind] = self._hits.get(kind, 0) + 1
+                return entry[1]
+            self._misses[kind] = self._misses.get(kind, 0) + 1
+            if entry is not None:
+                del self._entries[(kind, key)]
+                self._db_write("DELETE FROM cache WHERE kind = ? AND key = ?", (kind, key))
+        return None
+
+    def set(self, kind: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            ttl = self.ttls.get(kind, 0)
+        if ttl <= 0:
+            return
+        expires = time.time() + ttl
+        data = json.dumps(value) if self._db else ""
+        with self._lock:
+            self._entries[(kind, key)] = (expires, value)
+            self._entries.move_to_end((kind, key))
+            self._db_write(
+                "INSERT OR REPLACE INTO cache (kind, key, value, expires) VALUES (?, ?, ?, ?)",
+                (kind, key, data, expires),
+            )
+            while len(self._entries) > self.max_entries:
+                (old_kind, old_key), _ = self._entries.popitem(last=False)
+                self._db_write(
+                    "DELETE FROM cache WHERE kind = ? AND key = ?", (old_kind, old_key)
+                )
+
+    def invalidate(self, kind: str, key: str) -> None:
+        with self._lock:
+            self._entries.pop((kind, key), None)
+            self._db_write("DELETE FROM cache WHERE kind = ? AND key = ?", (kind, key))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": dict(self._hits),
+                "misses": dict(self._misses),
+            }
+
+
+class FileIdStore:
+    """
+    Persistent map of (canonical episode URL, quality) → Telegram file_id
+    plus file metadata, so an episode that has been uploaded once can be
+    re-sent by id instead of going through the whole pipeline again.
+    """
+
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+        if not db_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS file_ids ("
+                " url TEXT NOT NULL, quality TEXT NOT NULL,"
+                " file_id TEXT NOT NULL, file_unique_id TEXT,"
+                " file_size INTEGER, duration INTEGER, width INTEGER, height INTEGER,"
+                " title TEXT, created REAL NOT NULL,"
+                " PRIMARY KEY (url, quality))"
+            )
+            self._db.commit()
+        except Exception as e:
+            logger.warning(f"file_id store disabled ({db_path}): {e}")
+            self._db = None
+
+    def get(self, url: str, quality: str = "best") -> Optional[dict]:
+        if not self._db:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT file_id, file_unique_id, file_size, duration, width, height, title"
+                " FROM file_ids WHERE url = ? AND quality = ?",
+                (url, quality),
+            ).fetchone()
+        if not row:
+            self.misses += 1
+            return None
+        self.hits += 1
+        keys = ("file_id", "file_unique_id", "file_size", "duration", "width", "height", "title")
+        return dict(zip(keys, row))
+
+    def put(self, url: str, quality: str, file_id: str, **meta) -> None:
+        if not self._db:
+            return
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO file_ids (url, quality, file_id, file_unique_id,"
+                    " file_size, duration, width, height, title, created)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        url, quality, file_id,
+                        meta.get("file_unique_id"), meta.get("file_size"),
+                        meta.get("duration"), meta.get("width"), meta.get("height"),
+                        meta.get("title"), time.time(),
+                    ),
+                )
+                self._db.commit()
+            except Exception as e:
+                logger.debug(f"file_id store write ignored: {e}")
+
+    def delete(self, url: str, quality: str = "best") -> None:
+        if not self._db:
+            return
+        with self._lock:
+            self._db.execute("DELETE FROM file_ids WHERE url = ? AND quality = ?", (url, quality))
+            self._db.commit()
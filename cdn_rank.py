@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import re
+import urllib.request
+from typing import Optional
+from urllib.parse import urlsplit
+
+from fetcher import parse_master
+from net import build_opener
+
+logger = logging.getLogger(__name__)
+
+# Where a candidate was seen. URLs the player itself requested beat URLs
+# merely mentioned in a response body or the page markup.
+ORIGIN_SCORES = {
+    "request": 30,
+    "response": 30,
+    "xhr_body": 20,
+    "video_element": 15,
+    "iframe_video": 15,
+    "page_source": 10,
+}
+
+# Path words typical of prerolls, trailers and scrubbing previews
+_SUSPECT_RE = re.compile(
+    r"pre-?roll|/ads?/|[/_.-]ads?[/_.-]|vast|promo|trailer|teaser|preview|"
+    r"sample|thumb|sprite|intro|banner",
+    re.IGNORECASE,
+)
+
+# Anything shorter than this is a preroll or a preview clip, not an episode
+MIN_EPISODE_SECONDS = 120
+# Progressive files smaller than this are previews, not episodes
+MIN_EPISODE_BYTES = 15 * 1024 * 1024
+# Playlists are small; stop reading one past this
+_PLAYLIST_LIMIT = 2 * 1024 * 1024
+# Probe at most this many candidates per page
+MAX_PROBED = 8
+
+_EXTINF_RE = re.compile(r"^#EXTINF:\s*([\d.]+)", re.MULTILINE)
+
+
+class CdnCandidate:
+    """One stream URL seen while a video page loaded, and what it turned out to be."""
+
+    __slots__ = (
+        "url", "origin", "order", "score", "master", "height",
+        "bandwidth", "duration", "size", "reachable",
+    )
+
+    def __init__(self, url: str, origin: str, order: int):
+        self.url = url
+        self.origin = origin
+        self.order = order
+        self.score = 0.0
+        self.master = False
+        self.height = 0
+        self.bandwidth = 0
+        self.duration = 0.0
+        self.size = 0
+        self.reachable: Optional[bool] = None  # None = not probed
+
+    def describe(self) -> str:
+        parts = [f"{self.score:.0f}", self.origin]
+        if self.height:
+            parts.append(f"{self.height}p")
+        if self.duration:
+            parts.append(f"{self.duration / 60:.1f}min")
+        if self.size:
+            parts.append(f"{self.size / 2**20:.0f}MiB")
+        if self.reachable is False:
+            parts.append("unreachable")
+        return "/".join(parts)
+
+
+def _get_text(opener, url: str, timeout: float) -> str:
+    with opener.open(url, timeout=timeout) as resp:
+        return resp.read(_PLAYLIST_LIMIT).decode("utf-8", "replace")
+
+
+def _probe(candidate: CdnCandidate, timeout: float) -> None:
+    """Fill in resolution, bitrate, duration or size (blocking; run in a thread)."""
+    opener = build_opener()
+    path = urlsplit(candidate.url).path.lower()
+    try:
+        if path.endswith(".m3u8"):
+            text = _get_text(opener, candidate.url, timeout)
+            if "#EXT-X-STREAM-INF" in text:
+                variants = parse_master(text, candidate.url)
+                if variants:
+                    best = max(variants, key=lambda v: (v.bandwidth, v.height))
+                    candidate.master = True
+                    candidate.height = best.height
+                    candidate.bandwidth = best.bandwidth
+                    text = _get_text(opener, best.url, timeout)
+            # Summed directly: parse_media rejects encrypted/live playlists,
+            # which are still perfectly good candidates for yt-dlp
+            candidate.duration = sum(float(d) for d in _EXTINF_RE.findall(text))
+        else:
+            req = urllib.request.Request(candidate.url, headers={"Range": "bytes=0-0"})
+            with opener.open(req, timeout=timeout) as resp:
+                total = (resp.headers.get("Content-Range") or "").rpartition("/")[2]
+                candidate.size = int(total) if total.isdigit() else int(resp.headers.get("Content-Length") or 0)
+        candidate.reachable = True
+    except Exception as e:
+        logger.debug(f"CDN candidate probe failed for {candidate.url[:100]}: {e}")
+        candidate.reachable = False
+
+
+def score(candidate: CdnCandidate) -> float:
+    s = float(ORIGIN_SCORES.get(candidate.origin, 0))
+    if _SUSPECT_RE.search(urlsplit(candidate.url).path):
+        s -= 50
+    if candidate.reachable is False:
+        s -= 100
+    if candidate.master:
+        s += 10  # the player can pick a rendition; so can the downloader
+    if candidate.height:
+        s += min(candidate.height, 2160) / 20
+    if candidate.bandwidth:
+        s += min(candidate.bandwidth / 250_000, 40)
+    if candidate.duration:
+        if candidate.duration < MIN_EPISODE_SECONDS:
+            s -= 60
+        else:
+            s += min(candidate.duration / 60, 30)
+    if candidate.size:
+        if candidate.size < MIN_EPISODE_BYTES:
+            s -= 40
+        else:
+            s += min(candidate.size / (50 * 2**20), 20)
+    # Among equals, the earlier sighting wins
+    return s - candidate.order * 0.5
+
+
+async def rank(candidates: list[CdnCandidate], timeout: float) -> list[CdnCandidate]:
+    """Probe the candidates concurrently and return them best first."""
+    probed = candidates[:MAX_PROBED]
+    await asyncio.gather(*(asyncio.to_thread(_probe, c, timeout) for c in probed))
+    for c in candidates:
+        c.score = score(c)
+    return sorted(candidates, key=lambda c: c.score, reverse=True)
@@ -1,15 +1,111 @@
-import asyncio
 import os
 import logging
+import re
+import subprocess
+import time
 from typing import Callable, Optional
 import yt_dlp
 
 import config
+from executors import download_executor, postprocess_executor
+from fetcher import (
+    HTTPStatusError,
+    NativeFetcher,
+    NativeUnsupported,
+    aiohttp,
+    parse_master,
+    parse_media,
+)
+from metrics import DOWNLOAD_SECONDS, DOWNLOAD_THROUGHPUT, FAILURES
+from net import SITE_HEADERS, build_opener
 
 logger = logging.getLogger(__name__)
 
 os.makedirs(config.DOWNLOAD_DIR, exist_ok=True)
 
+# yt-dlp error text when a signed CDN URL has been revoked or has expired
+_EXPIRED_RE = re.compile(r"HTTP Error (?:403|410)")
+
+# Direct CDN media the native engine can take on
+_DIRECT_RE = re.compile(r"^https?://[^?#]+\.(?:m3u8|mp4)(?:[?#]|$)", re.IGNORECASE)
+
+# Segments sampled to size a single-rendition HLS playlist
+_SIZE_SAMPLES = 3
+
+
+class SizePlan:
+    """
+    What to download so the result fits under the upload limit: the URL
+    (possibly a specific HLS rendition), an optional yt-dlp format spec and
+    the estimated size in bytes (0 when it couldn't be estimated). top is
+    False when a lower rendition was chosen to fit the limit.
+    """
+
+    __slots__ = ("url", "format_spec", "estimate", "label", "fits", "top")
+
+    def __init__(
+        self,
+        url: str,
+        format_spec: Optional[str] = None,
+        estimate: int = 0,
+        label: str = "best",
+        fits: bool = True,
+    ):
+        self.url = url
+        self.format_spec = format_spec
+        self.estimate = estimate
+        self.label = label
+        self.fits = fits
+        self.top = True
+
+
+def _pick(candidates: list[tuple[tuple, int, "SizePlan"]], budget: int) -> Optional[SizePlan]:
+    """
+    candidates: (quality score, estimated bytes, plan). Best quality that
+    fits the budget, else the smallest one marked as not fitting.
+    """
+    sized = [c for c in candidates if c[1] > 0]
+    if not sized:
+        return None
+    fitting = [c for c in sized if c[1] <= budget]
+    if fitting:
+        _, est, plan = max(fitting, key=lambda c: (c[0], -c[1]))
+        plan.top = plan is max(sized, key=lambda c: (c[0], -c[1]))[2]
+    else:
+        _, est, plan = min(sized, key=lambda c: c[1])
+        plan.fits = False
+    plan.estimate = est
+    return plan
+
+
+def remux_to_mp4(path: str) -> str:
+    """
+    Stream-copy a file into a faststart MP4 (what yt-dlp's FixupM3u8 does
+    for HLS downloads). Runs in the post-processing pool; returns
+    the path of the usable file, which is the original one if ffmpeg fails.
+    """
+    base, _ = os.path.splitext(path)
+    final = base + ".mp4"
+    tmp = base + ".remux.mp4"
+    try:
+        subprocess.run(
+            [
+                "ffmpeg", "-y", "-loglevel", "error", "-i", path,
+                "-map", "0", "-c", "copy", "-f", "mp4", "-movflags", "+faststart", tmp,
+            ],
+            check=True,
+            capture_output=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.warning(f"Remux failed for {path}: {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return path
+    os.replace(tmp, final)
+    if final != path and os.path.exists(path):
+        os.remove(path)
+    return final
+
 
 class Downloader:
     def __init__(self):
@@ -19,7 +115,8 @@ class Downloader:
         self,
         output_path: str,
         progress_hook: Optional[Callable] = None,
-        cdn_url: Optional[str] = None,
+        streaming: bool = False,
+        format_spec: Optional[str] = None,
     ) -> dict:
         opts = {
             "outtmpl": output_path,
@@ -27,24 +124,23 @@ class Downloader:
             "quiet": True,
             "no_warnings": True,
             "nocheckcertificate": True,
-            "http_headers": {
-                "User-Agent": (
-                    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                    "AppleWebKit/537.36 (KHTML, like Gecko) "
-                    "Chrome/120.0.0.0 Safari/537.36"
-                ),
-                "Referer": "https://hanime.tv/",
-                "Origin": "https://hanime.tv",
-            },
-            "format": "bestvideo[ext=mp4]+bestaudio[ext=m4a]/bestvideo+bestaudio/best",
+            "http_headers": dict(SITE_HEADERS),
+            "format": format_spec or "bestvideo[ext=mp4]+bestaudio[ext=m4a]/bestvideo+bestaudio/best",
             "concurrent_fragment_downloads": 5,
             "retries": 10,
             "fragment_retries": 10,
+            # Pick up .part/.ytdl leftovers from an interrupted run
+            "continuedl": True,
         }
 
         if progress_hook:
             opts["progress_hooks"] = [progress_hook]
 
+        if streaming:
+            # A fixup rewrite would change bytes already sent to Telegram;
+            # the HLS container is fixed afterwards instead (remux_to_mp4)
+            opts["fixup"] = "never"
+
         if config.PROXY_URL:
             opts["proxy"] = config.PROXY_URL
 
@@ -55,10 +151,20 @@ class Downloader:
         url: str,
         filename: str,
         progress_hook: Optional[Callable] = None,
+        on_expired: Optional[Callable[[], None]] = None,
+        streaming: bool = False,
+        resume: Optional[dict] = None,
+        format_spec: Optional[str] = None,
     ) -> Optional[str]:
         """
         Download video from URL (page URL or direct CDN URL).
         Returns path to downloaded file or None on failure.
+        on_expired is called when the CDN answered 403/410, i.e. the URL
+        should not be reused. streaming=True keeps the written file
+        byte-stable so it can be uploaded while downloading. resume carries
+        the last fragment progress of an interrupted job (native engine);
+        yt-dlp resumes its own .part files. format_spec overrides the
+        default yt-dlp format selection (see plan()).
         """
         safe_name = "".join(
             c if c.isalnum() or c in " ._-" else "_" for c in filename
@@ -67,16 +173,32 @@ class Downloader:
             config.DOWNLOAD_DIR, f"{safe_name}.%(ext)s"
         )
         final_path_holder = []
+        protocols: set[str] = set()
 
         def _hook(d):
+            protocols.add(str((d.get("info_dict") or {}).get("protocol", "")))
             if d["status"] == "finished":
                 final_path_holder.append(d.get("filename") or d.get("info_dict", {}).get("_filename"))
             if progress_hook:
                 progress_hook(d)
 
-        opts = self._make_ydl_opts(output_path, _hook)
+        # Progressive MP4 with streaming upload stays on yt-dlp: it writes
+        # front to back, which the uploader can follow; ranged chunks can't.
+        native = config.NATIVE_FETCH and aiohttp and _DIRECT_RE.match(url) and not format_spec
+        if native and streaming and ".mp4" in url.split("?")[0].lower():
+            native = False
+        started = time.monotonic()
+        if native:
+            handled, fp = await self._download_native(url, safe_name, _hook, on_expired, resume)
+            if handled:
+                self._record(fp, "native", started)
+                return fp
+
+        opts = self._make_ydl_opts(
+            output_path, _hook, streaming=streaming, format_spec=format_spec
+        )
 
-        loop = asyncio.get_event_loop()
+        expired = []
 
         def _run():
             try:
@@ -85,14 +207,201 @@ class Downloader:
                 return True
             except Exception as e:
                 logger.error(f"yt-dlp error: {e}")
+                if _EXPIRED_RE.search(str(e)):
+                    expired.append(True)
                 return False
 
-        success = await loop.run_in_executor(None, _run)
+        success = await download_executor.run(_run)
 
         if not success:
+            if expired and on_expired:
+                on_expired()
+            self._record(None, "ytdlp", started)
             return None
 
-        # Resolve final file path
+        fp = self._resolve_path(final_path_holder, safe_name)
+        if fp and streaming and any("m3u8" in p for p in protocols):
+            # Fixups were off, so HLS output is MPEG-TS in an .mp4 name —
+            # remux off the loop
+            fp = await postprocess_executor.run(remux_to_mp4, fp)
+        self._record(fp, "ytdlp", started)
+        return fp
+
+    @staticmethod
+    def _record(fp: Optional[str], engine: str, started: float) -> None:
+        if not fp or not os.path.exists(fp):
+            FAILURES.inc(op="download")
+            return
+        elapsed = max(time.monotonic() - started, 1e-6)
+        DOWNLOAD_SECONDS.observe(elapsed, engine=engine)
+        DOWNLOAD_THROUGHPUT.observe(os.path.getsize(fp) / elapsed, engine=engine)
+
+    async def _download_native(
+        self,
+        url: str,
+        safe_name: str,
+        hook: Callable,
+        on_expired: Optional[Callable[[], None]],
+        resume: Optional[dict] = None,
+    ) -> tuple[bool, Optional[str]]:
+        """
+        Try the built-in async engine. Returns (handled, path); handled is
+        False when yt-dlp should take over instead.
+        """
+        base = os.path.join(config.DOWNLOAD_DIR, safe_name)
+        fetcher = NativeFetcher(
+            headers=dict(SITE_HEADERS),
+            proxy=config.PROXY_URL,
+            max_concurrency=config.NATIVE_FETCH_MAX_CONCURRENCY,
+            start_concurrency=config.NATIVE_FETCH_START_CONCURRENCY,
+        )
+        try:
+            fp = await fetcher.fetch(url, base, hook, resume)
+        except HTTPStatusError as e:
+            logger.error(f"Native fetch error: {e}")
+            if e.status in (403, 410):
+                if on_expired:
+                    on_expired()
+                return True, None
+            return False, None
+        except NativeUnsupported as e:
+            logger.info(f"Native engine can't handle stream ({e}), using yt-dlp")
+            return False, None
+        except Exception as e:
+            logger.warning(f"Native fetch failed ({e}), falling back to yt-dlp")
+            for leftover in (base + ".ts.part", base + ".mp4.part"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            return False, None
+
+        if fp.endswith(".ts"):
+            fp = await postprocess_executor.run(remux_to_mp4, fp)
+        return True, fp
+
+    # ------------------------------------------------------------------ #
+    #  Pre-flight size probe                                               #
+    # ------------------------------------------------------------------ #
+    async def plan(self, url: str, budget: Optional[int] = None) -> SizePlan:
+        """
+        Estimate the download size before fetching anything big and choose
+        the best rendition that fits budget (MAX_FILE_SIZE_MB by default).
+        Direct mp4 URLs are sized by Content-Length, HLS by BANDWIDTH x
+        duration (or sampled segments), anything else by yt-dlp format
+        metadata. plan.fits is False when even the smallest rendition is
+        too big; an unknown size yields the default plan.
+        """
+        if not config.SIZE_PROBE:
+            return SizePlan(url)
+        budget = budget or config.MAX_FILE_SIZE_MB * 1024 * 1024
+        try:
+            plan = None
+            if _DIRECT_RE.match(url):
+                plan = await download_executor.run(self._probe_direct, url, budget)
+            if plan is None:
+                plan = await download_executor.run(self._probe_ytdlp, url, budget)
+        except Exception as e:
+            logger.warning(f"Size probe failed for {url[:80]}: {e}")
+            plan = None
+        if plan is None:
+            logger.info("Download size unknown, using default format selection")
+            return SizePlan(url)
+        logger.info(
+            f"Size plan: {plan.label} ~{plan.estimate / 1024 / 1024:.0f} MB "
+            f"({'fits' if plan.fits else 'over budget'})"
+        )
+        return plan
+
+    def _open(self, url: str, headers: Optional[dict] = None):
+        return build_opener(headers).open(url, timeout=config.SIZE_PROBE_TIMEOUT)
+
+    def _content_length(self, url: str) -> int:
+        """Size of url from a one-byte ranged GET (HEAD is often refused by CDNs)."""
+        with self._open(url, {"Range": "bytes=0-0"}) as resp:
+            content_range = resp.headers.get("Content-Range", "")
+            if "/" in content_range and not content_range.endswith("/*"):
+                return int(content_range.rsplit("/", 1)[1])
+            return int(resp.headers.get("Content-Length") or 0) if resp.status == 200 else 0
+
+    def _get_text(self, url: str) -> str:
+        with self._open(url) as resp:
+            return resp.read().decode("utf-8", "replace")
+
+    def _probe_direct(self, url: str, budget: int) -> Optional[SizePlan]:
+        if ".m3u8" not in url.split("?")[0].lower():
+            size = self._content_length(url)
+            return SizePlan(url, estimate=size, fits=size <= budget) if size else None
+
+        try:
+            text = self._get_text(url)
+            if "#EXT-X-STREAM-INF" not in text:
+                media = parse_media(text, url)
+                return _pick([((0,), self._sample_hls_size(media), SizePlan(url))], budget)
+
+            variants = parse_master(text, url)
+            if not variants:
+                return None
+            # Renditions share one timeline, so one media playlist gives the duration
+            duration = parse_media(self._get_text(variants[0].url), variants[0].url).duration
+        except NativeUnsupported as e:
+            logger.debug(f"HLS size probe skipped ({e}), asking yt-dlp")
+            return None
+        return _pick(
+            [
+                (
+                    (v.height, v.bandwidth),
+                    int(v.bandwidth * duration / 8),
+                    SizePlan(v.url, label=f"{v.height}p" if v.height else f"{v.bandwidth // 1000}k"),
+                )
+                for v in variants
+            ],
+            budget,
+        )
+
+    def _sample_hls_size(self, media) -> int:
+        """Extrapolate total size from a few segments spread over the playlist."""
+        count = len(media.segments)
+        picks = sorted({int(i * (count - 1) / max(_SIZE_SAMPLES - 1, 1)) for i in range(_SIZE_SAMPLES)})
+        sizes = [self._content_length(media.segments[i]) for i in picks]
+        sizes = [s for s in sizes if s]
+        return int(sum(sizes) / len(sizes) * count) if sizes else 0
+
+    def _probe_ytdlp(self, url: str, budget: int) -> Optional[SizePlan]:
+        opts = self._make_ydl_opts(os.path.join(config.DOWNLOAD_DIR, "%(id)s.%(ext)s"))
+        opts["socket_timeout"] = config.SIZE_PROBE_TIMEOUT
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+        if not info:
+            return None
+        duration = info.get("duration") or 0
+
+        def size(f: dict) -> int:
+            if f.get("filesize") or f.get("filesize_approx"):
+                return int(f.get("filesize") or f.get("filesize_approx"))
+            return int(f["tbr"] * 1000 / 8 * duration) if f.get("tbr") and duration else 0
+
+        formats = info.get("formats") or [info]
+        videos = [f for f in formats if f.get("vcodec") != "none"]
+        audios = [f for f in formats if f.get("vcodec") == "none" and f.get("acodec") != "none"]
+        audio = max(
+            (a for a in audios if size(a)),
+            key=lambda a: a.get("abr") or a.get("tbr") or 0,
+            default=None,
+        )
+
+        candidates = []
+        for f in videos:
+            label = f"{f['height']}p" if f.get("height") else str(f.get("format_id"))
+            score = (f.get("height") or 0, f.get("tbr") or 0)
+            if f.get("acodec") == "none":
+                if audio is None or not size(f):
+                    continue
+                spec = f"{f['format_id']}+{audio['format_id']}"
+                candidates.append((score, size(f) + size(audio), SizePlan(url, spec, label=label)))
+            else:
+                candidates.append((score, size(f), SizePlan(url, str(f["format_id"]), label=label)))
+        return _pick(candidates, budget)
+
+    def _resolve_path(self, final_path_holder: list, safe_name: str) -> Optional[str]:
         if final_path_holder:
             fp = final_path_holder[-1]
             if fp and os.path.exists(fp):
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def _timed(fn: Callable, *args) -> tuple[Any, float, float]:
+    """Runs inside the worker; reports when the call actually ran."""
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+class InstrumentedExecutor:
+    """
+    A dedicated executor that keeps its own work off the loop's default
+    pool and reports queue depth, activity and utilisation.
+    """
+
+    def __init__(self, name: str, executor: Executor, workers: int):
+        self.name = name
+        self.workers = workers
+        self._executor = executor
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._busy = 0.0
+        self._wait = 0.0
+        self._created = time.time()
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run fn(*args) in this executor."""
+        loop = asyncio.get_running_loop()
+        submitted = time.time()
+        self._submitted += 1
+        try:
+            result, started, finished = await loop.run_in_executor(
+                self._executor, _timed, fn, *args
+            )
+        except asyncio.CancelledError:
+            self._cancelled += 1
+            raise
+        except BaseException:
+            self._failed += 1
+            raise
+        self._completed += 1
+        self._busy += finished - started
+        self._wait += max(0.0, started - submitted)
+        return result
+
+    def stats(self) -> dict:
+        in_flight = self._submitted - self._completed - self._failed - self._cancelled
+        active = min(in_flight, self.workers)
+        uptime = max(time.time() - self._created, 1e-6)
+        done = max(self._completed, 1)
+        return {
+            "workers": self.workers,
+            "active": active,
+            "queued": in_flight - active,
+            "completed": self._completed,
+            "failed": self._failed,
+            "cancelled": self._cancelled,
+            "utilization": round(self._busy / (uptime * self.workers), 4),
+            "avg_queue_wait": round(self._wait / done, 3),
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ------------------------------------------------------------------ #
+#  Shared instances                                                    #
+# ------------------------------------------------------------------ #
+# yt-dlp jobs (blocking network I/O)
+download_executor = InstrumentedExecutor(
+    "download",
+    ThreadPoolExecutor(config.DOWNLOAD_WORKERS, thread_name_prefix="ytdlp"),
+    config.DOWNLOAD_WORKERS,
+)
+
+# ffmpeg remux/merge work — ffmpeg is its own process already, so a thread
+# per job only waits on it; the pool size bounds concurrent ffmpeg runs
+postprocess_executor = InstrumentedExecutor(
+    "postprocess",
+    ThreadPoolExecutor(config.POSTPROCESS_WORKERS, thread_name_prefix="ffmpeg"),
+    config.POSTPROCESS_WORKERS,
+)
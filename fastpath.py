@@ -0,0 +1,214 @@
+import asyncio
+import json
+import logging
+import re
+from typing import Any, Optional
+
+try:
+    import aiohttp
+except ImportError:  # optional — every lookup then goes to the browser
+    aiohttp = None
+
+import config
+from metrics import EXTRACT_TIER_SECONDS
+from net import SITE_HEADERS
+
+logger = logging.getLogger(__name__)
+
+_SLUG_RE = re.compile(r"/videos/hentai/([^/?#]+)")
+_NUXT_RE = re.compile(r"window\.__NUXT__\s*=\s*(\{.*?\})\s*;?\s*</script>", re.DOTALL)
+_MEDIA_RE = re.compile(r"\.(m3u8|mp4)(\?|$)", re.IGNORECASE)
+
+
+def _slug(url: str) -> Optional[str]:
+    m = _SLUG_RE.search(url)
+    return m.group(1) if m else None
+
+
+def _find_key(data: Any, key: str) -> Any:
+    """First value stored under `key` anywhere in nested dicts/lists (breadth-first)."""
+    queue = [data]
+    while queue:
+        node = queue.pop(0)
+        if isinstance(node, dict):
+            if key in node:
+                return node[key]
+            queue.extend(node.values())
+        elif isinstance(node, list):
+            queue.extend(node)
+    return None
+
+
+class FastPath:
+    """
+    The plain-HTTP tier in front of the browser: the site's own JSON
+    endpoints (search service, video API) and, failing those, the state a
+    page embeds as window.__NUXT__. Every method returns None when this
+    tier can't answer so the caller escalates to Playwright.
+    """
+
+    def __init__(self, base_url: str, api_url: str, search_url: str, timeout: float, proxy: str = ""):
+        self.base_url = base_url
+        self.api_url = api_url.rstrip("/")
+        self.search_url = search_url
+        self.timeout = timeout
+        self.proxy = proxy or None
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+    @property
+    def enabled(self) -> bool:
+        return config.FAST_PATH and aiohttp is not None
+
+    def _client(self) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=SITE_HEADERS,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=32, keepalive_timeout=60),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _get_json(self, url: str, **kwargs) -> Any:
+        async with self._client().get(url, proxy=self.proxy, **kwargs) as resp:
+            resp.raise_for_status()
+            return await resp.json(content_type=None)
+
+    # ------------------------------------------------------------------ #
+    #  Video data: JSON API first, embedded page state second             #
+    # ------------------------------------------------------------------ #
+    async def _video(self, slug: str) -> Optional[dict]:
+        try:
+            data = await self._get_json(f"{self.api_url}/video", params={"id": slug})
+            if isinstance(data, dict) and data:
+                return data
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.debug(f"Video API failed for {slug}: {e}")
+
+        try:
+            async with self._client().get(
+                f"{self.base_url}/videos/hentai/{slug}", proxy=self.proxy
+            ) as resp:
+                resp.raise_for_status()
+                html = await resp.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.debug(f"Page fetch failed for {slug}: {e}")
+            return None
+        m = _NUXT_RE.search(html)
+        if not m:
+            return None
+        try:
+            # Only plain-JSON state is usable; a minified IIFE needs the browser
+            return json.loads(m.group(1))
+        except ValueError:
+            return None
+
+    # ------------------------------------------------------------------ #
+    #  Tier entry points                                                   #
+    # ------------------------------------------------------------------ #
+    async def search(self, query: str) -> Optional[list[dict]]:
+        if not self.enabled:
+            return None
+        with EXTRACT_TIER_SECONDS.time(op="search", tier="http", result="miss") as timing:
+            try:
+                async with self._client().post(
+                    self.search_url,
+                    json={
+                        "search_text": query,
+                        "tags": [],
+                        "tags_mode": "AND",
+                        "brands": [],
+                        "blacklist": [],
+                        "order_by": "created_at_unix",
+                        "ordering": "desc",
+                        "page": 0,
+                    },
+                    proxy=self.proxy,
+                ) as resp:
+                    resp.raise_for_status()
+                    data = await resp.json(content_type=None)
+                hits = data.get("hits") if isinstance(data, dict) else None
+                if isinstance(hits, str):
+                    hits = json.loads(hits)  # the search service double-encodes
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, AttributeError) as e:
+                logger.info(f"Fast search failed, escalating: {e}")
+                timing["result"] = "error"
+                return None
+
+            results = []
+            for hit in hits or ():
+                if not isinstance(hit, dict) or not hit.get("slug"):
+                    continue
+                results.append({
+                    "title": hit.get("name") or hit["slug"].replace("-", " ").title(),
+                    "url": f"{self.base_url}/videos/hentai/{hit['slug']}",
+                    "thumb": hit.get("cover_url") or hit.get("poster_url") or "",
+                })
+                if len(results) >= config.MAX_SEARCH_RESULTS:
+                    break
+            if not results:
+                return None
+            timing["result"] = "ok"
+            logger.info(f"Fast search returned {len(results)} results for '{query}'")
+            return results
+
+    async def episodes(self, episode_url: str) -> Optional[list[dict]]:
+        """Raw [{"href", "title"}] of the series, in the site's order."""
+        slug = _slug(episode_url)
+        if not self.enabled or not slug:
+            return None
+        with EXTRACT_TIER_SECONDS.time(op="episodes", tier="http", result="miss") as timing:
+            data = await self._video(slug)
+            videos = _find_key(data, "hentai_franchise_hentai_videos") if data else None
+            links = [
+                {"href": f"{self.base_url}/videos/hentai/{v['slug']}", "title": v.get("name") or ""}
+                for v in videos or ()
+                if isinstance(v, dict) and v.get("slug")
+            ]
+            if not links:
+                return None
+            timing["result"] = "ok"
+            return links
+
+    async def cdn_urls(self, video_url: str) -> Optional[list[str]]:
+        """Every stream URL the video data exposes, highest resolution first."""
+        slug = _slug(video_url)
+        if not self.enabled or not slug:
+            return None
+        with EXTRACT_TIER_SECONDS.time(op="cdn", tier="http", result="miss") as timing:
+            data = await self._video(slug)
+            servers = _find_key(_find_key(data, "videos_manifest"), "servers") if data else None
+            streams: dict[str, int] = {}
+            for server in servers or ():
+                for stream in (server or {}).get("streams") or ():
+                    url = (stream or {}).get("url") or ""
+                    if not _MEDIA_RE.search(url.split("#")[0]):
+                        continue  # locked streams come back with an empty url
+                    try:
+                        height = int(stream.get("height") or 0)
+                    except (TypeError, ValueError):
+                        height = 0
+                    streams[url] = max(height, streams.get(url, 0))
+            if not streams:
+                return None
+            # Stable sort: for equal heights the API's server order decides
+            ranked = sorted(streams, key=streams.get, reverse=True)
+            timing["result"] = "ok"
+            logger.info(f"Fast CDN lookup for {slug}: {streams[ranked[0]]}p, {len(ranked)} streams")
+            return ranked
+
+
+# ------------------------------------------------------------------ #
+#  Singleton instance                                                  #
+# ------------------------------------------------------------------ #
+fast_path = FastPath(
+    config.HANIME_BASE_URL,
+    config.HANIME_API_URL,
+    config.HANIME_SEARCH_API_URL,
+    config.FAST_PATH_TIMEOUT,
+    config.PROXY_URL,
+)
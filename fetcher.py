@@ -0,0 +1,425 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import deque
+from typing import Callable, Optional
+from urllib.parse import urljoin
+
+try:
+    import aiohttp
+except ImportError:  # optional — Downloader falls back to yt-dlp
+    aiohttp = None
+
+from net import SITE_HEADERS
+
+logger = logging.getLogger(__name__)
+
+MP4_CHUNK = 4 * 1024 * 1024
+SEGMENT_RETRIES = 5
+
+
+class NativeUnsupported(Exception):
+    """The native engine can't handle this stream; use yt-dlp instead."""
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status: int, url: str):
+        super().__init__(f"HTTP Error {status}: {url[:100]}")
+        self.status = status
+
+
+# ------------------------------------------------------------------ #
+#  M3U8 parsing                                                        #
+# ------------------------------------------------------------------ #
+_ATTR_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def _attrs(line: str) -> dict:
+    return {k: v.strip('"') for k, v in _ATTR_RE.findall(line.split(":", 1)[1])}
+
+
+class Variant:
+    __slots__ = ("url", "bandwidth", "height")
+
+    def __init__(self, url: str, bandwidth: int, height: int):
+        self.url = url
+        self.bandwidth = bandwidth
+        self.height = height
+
+
+class MediaPlaylist:
+    __slots__ = ("segments", "durations", "init_url")
+
+    def __init__(self):
+        self.segments: list[str] = []
+        self.durations: list[float] = []
+        self.init_url: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return sum(self.durations)
+
+
+def parse_master(text: str, base_url: str) -> list[Variant]:
+    variants = []
+    lines = [l.strip() for l in text.splitlines()]
+    for i, line in enumerate(lines):
+        if not line.startswith("#EXT-X-STREAM-INF"):
+            continue
+        attrs = _attrs(line)
+        uri = next((l for l in lines[i + 1:] if l and not l.startswith("#")), None)
+        if not uri:
+            continue
+        res = attrs.get("RESOLUTION", "")
+        height = int(res.split("x")[1]) if "x" in res else 0
+        variants.append(Variant(
+            urljoin(base_url, uri),
+            int(attrs.get("BANDWIDTH", "0") or 0),
+            height,
+        ))
+    return variants
+
+
+def parse_media(text: str, base_url: str) -> MediaPlaylist:
+    pl = MediaPlaylist()
+    duration = 0.0
+    ended = False
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXTINF"):
+            duration = float(line.split(":", 1)[1].split(",")[0] or 0)
+        elif line.startswith("#EXT-X-KEY"):
+            if _attrs(line).get("METHOD", "NONE") != "NONE":
+                raise NativeUnsupported("encrypted HLS")
+        elif line.startswith("#EXT-X-BYTERANGE"):
+            raise NativeUnsupported("byte-range segments")
+        elif line.startswith("#EXT-X-MAP"):
+            attrs = _attrs(line)
+            if "BYTERANGE" in attrs:
+                raise NativeUnsupported("byte-range init segment")
+            pl.init_url = urljoin(base_url, attrs["URI"])
+        elif line.startswith("#EXT-X-ENDLIST"):
+            ended = True
+        elif not line.startswith("#"):
+            pl.segments.append(urljoin(base_url, line))
+            pl.durations.append(duration)
+            duration = 0.0
+    if not ended:
+        raise NativeUnsupported("live playlist")
+    if not pl.segments:
+        raise NativeUnsupported("empty playlist")
+    return pl
+
+
+# ------------------------------------------------------------------ #
+#  Adaptive concurrency                                                #
+# ------------------------------------------------------------------ #
+class AdaptiveConcurrency:
+    """
+    Hill-climbing limit: every `window` completed fetches the observed
+    throughput is compared with the previous window. Errors halve the
+    limit; a throughput gain keeps moving in the same direction, a loss
+    reverses it.
+    """
+
+    def __init__(self, start: int, maximum: int, window: int = 8):
+        self.limit = max(1, min(start, maximum))
+        self.maximum = maximum
+        self.window = window
+        self._done = 0
+        self._errors = 0
+        self._bytes = 0
+        self._started = time.monotonic()
+        self._last_rate = 0.0
+        self._step = 1
+
+    def record(self, nbytes: int, ok: bool) -> None:
+        if ok:
+            self._done += 1
+            self._bytes += nbytes
+        else:
+            self._errors += 1
+        if self._errors:
+            self.limit = max(1, self.limit // 2)
+            self._step = 1
+            self._reset()
+        elif self._done >= self.window:
+            rate = self._bytes / max(time.monotonic() - self._started, 1e-6)
+            if rate < self._last_rate * 0.95:
+                self._step = -self._step
+            self.limit = max(1, min(self.maximum, self.limit + self._step))
+            self._last_rate = rate
+            self._reset()
+
+    def _reset(self) -> None:
+        self._done = self._errors = self._bytes = 0
+        self._started = time.monotonic()
+
+
+# ------------------------------------------------------------------ #
+#  Engine                                                              #
+# ------------------------------------------------------------------ #
+class NativeFetcher:
+    """
+    asyncio download engine for direct m3u8/mp4 CDN URLs: one keep-alive
+    connection pool per job, adaptive fragment concurrency, and segments
+    written to the output in order. Progress is reported with yt-dlp style
+    dicts so the same hooks work for both engines.
+    """
+
+    def __init__(
+        self,
+        headers: Optional[dict] = None,
+        proxy: str = "",
+        max_concurrency: int = 16,
+        start_concurrency: int = 4,
+    ):
+        if aiohttp is None:
+            raise NativeUnsupported("aiohttp is not installed")
+        self.headers = headers or dict(SITE_HEADERS)
+        self.proxy = proxy or None
+        self.max_concurrency = max_concurrency
+        self.start_concurrency = start_concurrency
+
+    async def fetch(
+        self,
+        url: str,
+        output_base: str,
+        progress_hook: Optional[Callable] = None,
+        resume: Optional[dict] = None,
+    ) -> str:
+        """
+        Download url to output_base + extension. Returns the written path
+        (.ts/.mp4 — the caller remuxes TS). Raises NativeUnsupported when
+        yt-dlp should handle the stream, HTTPStatusError on HTTP failures.
+        resume ({"fragment_index", "fragment_count", "part_bytes"} from an
+        earlier progress report) continues an HLS .part file in place.
+        """
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=60)
+        async with aiohttp.ClientSession(
+            headers=self.headers, connector=connector, timeout=timeout
+        ) as session:
+            self._session = session
+            if ".m3u8" in url.split("?")[0].lower():
+                return await self._fetch_hls(url, output_base, progress_hook, resume)
+            return await self._fetch_mp4(url, output_base, progress_hook)
+
+    async def _get(self, url: str, headers: Optional[dict] = None) -> bytes:
+        async with self._session.get(url, headers=headers, proxy=self.proxy) as resp:
+            if resp.status >= 400:
+                raise HTTPStatusError(resp.status, url)
+            return await resp.read()
+
+    async def _get_retry(self, url: str, limiter: AdaptiveConcurrency, headers=None) -> bytes:
+        delay = 0.5
+        for attempt in range(SEGMENT_RETRIES):
+            try:
+                data = await self._get(url, headers)
+                limiter.record(len(data), True)
+                return data
+            except HTTPStatusError as e:
+                limiter.record(0, False)
+                if e.status in (403, 404, 410) or attempt == SEGMENT_RETRIES - 1:
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                limiter.record(0, False)
+                if attempt == SEGMENT_RETRIES - 1:
+                    raise
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 8)
+        raise RuntimeError("unreachable")
+
+    # ── HLS ─────────────────────────────────────────────────────────
+    async def _resolve_playlist(self, url: str) -> tuple[str, MediaPlaylist]:
+        text = (await self._get(url)).decode("utf-8", "replace")
+        if "#EXT-X-STREAM-INF" in text:
+            variants = parse_master(text, url)
+            if not variants:
+                raise NativeUnsupported("master playlist without variants")
+            best = max(variants, key=lambda v: (v.bandwidth, v.height))
+            url = best.url
+            text = (await self._get(url)).decode("utf-8", "replace")
+        return url, parse_media(text, url)
+
+    async def _fetch_hls(
+        self,
+        url: str,
+        output_base: str,
+        hook: Optional[Callable],
+        resume: Optional[dict] = None,
+    ) -> str:
+        media_url, playlist = await self._resolve_playlist(url)
+        segments = playlist.segments
+        ext = ".mp4" if playlist.init_url else ".ts"
+        path = output_base + ext
+        tmp = path + ".part"
+        limiter = AdaptiveConcurrency(self.start_concurrency, self.max_concurrency)
+        info = {"protocol": "m3u8_native", "ext": "mp4", "duration": playlist.duration}
+
+        done: dict[int, bytes] = {}
+        tasks: dict[int, asyncio.Task] = {}
+        start_idx, start_bytes = self._resume_point(tmp, len(segments), resume)
+        next_write = next_fetch = start_idx
+        written = start_bytes
+        started = time.monotonic()
+
+        with open(tmp, "r+b" if start_idx else "wb") as f:
+            if start_idx:
+                f.truncate(start_bytes)
+                f.seek(start_bytes)
+                logger.info(f"Resuming HLS fetch at fragment {start_idx}/{len(segments)}")
+            elif playlist.init_url:
+                f.write(await self._get_retry(playlist.init_url, limiter))
+            try:
+                while next_write < len(segments):
+                    # Keep `limit` fetches running, but never run too far
+                    # ahead of the writer so buffered segments stay bounded.
+                    while (
+                        next_fetch < len(segments)
+                        and len(tasks) < limiter.limit
+                        and next_fetch - next_write < limiter.maximum * 2
+                    ):
+                        tasks[next_fetch] = asyncio.create_task(
+                            self._get_retry(segments[next_fetch], limiter)
+                        )
+                        next_fetch += 1
+
+                    if tasks:
+                        await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_COMPLETED)
+                    for idx, task in list(tasks.items()):
+                        if task.done():
+                            del tasks[idx]
+                            done[idx] = task.result()  # re-raises fetch errors
+
+                    while next_write in done:
+                        chunk = done.pop(next_write)
+                        f.write(chunk)
+                        written += len(chunk)
+                        next_write += 1
+
+                    if hook:
+                        # part_bytes must be on disk for a later resume to trust it
+                        f.flush()
+                        elapsed = max(time.monotonic() - started, 1e-6)
+                        speed = (written - start_bytes) / elapsed
+                        estimate = int(written / next_write * len(segments)) if next_write else 0
+                        hook({
+                            "status": "downloading",
+                            "downloaded_bytes": written,
+                            "total_bytes_estimate": estimate,
+                            "speed": speed,
+                            "eta": int((estimate - written) / speed) if speed else 0,
+                            "fragment_index": next_write,
+                            "fragment_count": len(segments),
+                            "part_bytes": f.tell(),
+                            "filename": path,
+                            "tmpfilename": tmp,
+                            "info_dict": info,
+                        })
+            finally:
+                for t in tasks.values():
+                    t.cancel()
+                await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+        os.replace(tmp, path)
+        if hook:
+            hook({"status": "finished", "filename": path, "downloaded_bytes": written, "info_dict": info})
+        logger.info(f"Native HLS fetch done: {len(segments)} segments, {written} bytes")
+        return path
+
+    @staticmethod
+    def _resume_point(tmp: str, count: int, resume: Optional[dict]) -> tuple[int, int]:
+        """(fragment index, byte offset) to continue from, or (0, 0)."""
+        if not resume or not os.path.exists(tmp):
+            return 0, 0
+        idx = resume.get("fragment_index") or 0
+        nbytes = resume.get("part_bytes") or 0
+        if resume.get("fragment_count") != count or not 0 < idx < count:
+            return 0, 0
+        if os.path.getsize(tmp) < nbytes:
+            return 0, 0
+        return idx, nbytes
+
+    # ── Progressive MP4 ─────────────────────────────────────────────
+    async def _fetch_mp4(self, url: str, output_base: str, hook: Optional[Callable]) -> str:
+        path = output_base + ".mp4"
+        tmp = path + ".part"
+        limiter = AdaptiveConcurrency(self.start_concurrency, self.max_concurrency)
+        # Ranged chunks land out of order, so this is never streamable
+        info = {"protocol": "http_native_ranged", "ext": "mp4"}
+
+        async with self._session.get(
+            url, headers={"Range": "bytes=0-0"}, proxy=self.proxy
+        ) as resp:
+            if resp.status >= 400:
+                raise HTTPStatusError(resp.status, url)
+            total = 0
+            if resp.status == 206:
+                crange = resp.headers.get("Content-Range", "")
+                if "/" in crange and crange.rsplit("/", 1)[1].isdigit():
+                    total = int(crange.rsplit("/", 1)[1])
+        if not total:
+            raise NativeUnsupported("server doesn't support range requests")
+
+        ranges = deque((o, min(o + MP4_CHUNK, total) - 1) for o in range(0, total, MP4_CHUNK))
+        count = len(ranges)
+        tasks: dict[int, tuple[int, asyncio.Task]] = {}
+        written = 0
+        started = time.monotonic()
+
+        with open(tmp, "wb") as f:
+            f.truncate(total)
+            try:
+                while ranges or tasks:
+                    while ranges and len(tasks) < limiter.limit:
+                        start, end = ranges.popleft()
+                        tasks[start] = (end, asyncio.create_task(self._get_retry(
+                            url, limiter, headers={"Range": f"bytes={start}-{end}"}
+                        )))
+
+                    await asyncio.wait(
+                        [task for _, task in tasks.values()], return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for start, (end, task) in list(tasks.items()):
+                        if not task.done():
+                            continue
+                        del tasks[start]
+                        data = task.result()  # re-raises fetch errors
+                        if len(data) > end - start + 1:
+                            raise NativeUnsupported("server ignored the Range header")
+                        if not data:
+                            raise NativeUnsupported(f"empty ranged response at byte {start}")
+                        f.seek(start)
+                        f.write(data)
+                        written += len(data)
+                        if len(data) < end - start + 1:
+                            # Short range (capped or cut off) — fetch the rest next
+                            ranges.appendleft((start + len(data), end))
+
+                    if hook:
+                        speed = written / max(time.monotonic() - started, 1e-6)
+                        hook({
+                            "status": "downloading",
+                            "downloaded_bytes": written,
+                            "total_bytes": total,
+                            "speed": speed,
+                            "eta": int((total - written) / speed) if speed else 0,
+                            "filename": path,
+                            "tmpfilename": tmp,
+                            "info_dict": info,
+                        })
+            finally:
+                for _, t in tasks.values():
+                    t.cancel()
+                await asyncio.gather(*(t for _, t in tasks.values()), return_exceptions=True)
+
+        os.replace(tmp, path)
+        if hook:
+            hook({"status": "finished", "filename": path, "downloaded_bytes": written, "info_dict": info})
+        logger.info(f"Native MP4 fetch done: {total} bytes in {count} ranges")
+        return path
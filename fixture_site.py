@@ -0,0 +1,377 @@
+"""
+Local stand-in for hanime.tv used by benchmark.py.
+
+Serves synthetic pages shaped like the real site — age gate, search page
+with result cards, series/episode pages with a player iframe and embedded
+__NUXT__ state — the JSON APIs the fast path uses (search service, video
+API), and a CDN that hands out HLS playlists/segments or a progressive MP4
+with configurable latency and per-connection bandwidth. Standard library
+only.
+"""
+import html
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, quote, urlsplit
+
+_WORDS = (
+    "sakura", "yuri", "kaede", "harem", "isekai", "academy", "night", "summer",
+    "sister", "maid", "queen", "dungeon", "island", "secret", "office", "angel",
+)
+
+_GATE_COOKIE = "age_ok=1"
+
+_PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>{title}</title></head>
+<body>
+{gate}
+{body}
+<script>
+const gate = document.querySelector('.age-gate');
+if (gate) gate.querySelector('button').addEventListener('click', () => {{
+    document.cookie = '{cookie}; path=/; max-age=31536000';
+    localStorage.setItem('age_ok', '1');
+    gate.remove();
+}});
+</script>
+</body></html>
+"""
+
+_GATE = """<div class="age-gate" style="position:fixed;inset:0;background:#000">
+<p>This site is for adults only.</p><button class="confirm-btn">I am 18</button></div>"""
+
+_SEARCH_BODY = """<div class="search-bar"><input type="search" placeholder="Search" name="query"></div>
+<div id="results"></div>
+<script>
+const input = document.querySelector('input[type=search]');
+input.addEventListener('keydown', async (e) => {{
+    if (e.key !== 'Enter') return;
+    const r = await fetch('/api/search?q=' + encodeURIComponent(input.value));
+    const hits = await r.json();
+    document.getElementById('results').innerHTML = hits.map(h =>
+        `<div class="htv-card"><a href="${{h.url}}"><img src="/thumbs/${{h.slug}}.jpg">` +
+        `<div class="title">${{h.title}}</div></a></div>`).join('');
+}});
+</script>"""
+
+_EPISODE_BODY = """<script>window.__NUXT__={state};</script>
+<h1>{title}</h1>
+<iframe src="/player/{slug}" width="640" height="360"></iframe>
+<div class="episodes-wrapper">{links}</div>"""
+
+_PLAYER = """<!doctype html>
+<html><head><meta charset="utf-8"></head>
+<body>
+<video width="640" height="360"></video><button class="play-button">Play</button>
+<script>
+let started = false;
+async function load() {{
+    if (started) return;
+    started = true;
+    {loader}
+}}
+document.querySelector('.play-button').addEventListener('click', load);
+setTimeout(load, {autoplay_ms});
+</script>
+</body></html>
+"""
+
+# Player fetches the manifest itself (request interception) or gets it from
+# a JSON API first (response body inspection)
+_LOADERS = {
+    "request": "fetch({media!r});",
+    "xhr": "const r = await fetch('/api/v8/video?id={slug}'); await r.json();",
+}
+
+
+class FixtureSite:
+    """
+    A throwaway site on 127.0.0.1. start() returns the base URL to use as
+    HANIME_BASE_URL; every request sleeps `latency` seconds and media bodies
+    are sent at `bandwidth` bytes/s per connection (0 = unthrottled).
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        bandwidth: int = 0,
+        series: int = 6,
+        episodes: int = 4,
+        media: str = "hls",
+        segments: int = 20,
+        segment_size: int = 256 * 1024,
+        segment_duration: float = 10.0,
+        cdn_path: str = "request",
+        autoplay_ms: int = 300,
+        api: bool = True,
+        range_cap: int = 0,
+        port: int = 0,
+    ):
+        if media not in ("hls", "mp4"):
+            raise ValueError(f"media must be 'hls' or 'mp4', not {media!r}")
+        if cdn_path not in _LOADERS:
+            raise ValueError(f"cdn_path must be one of {sorted(_LOADERS)}")
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.media = media
+        self.segments = segments
+        self.segment_size = segment_size
+        self.segment_duration = segment_duration
+        self.cdn_path = cdn_path
+        self.autoplay_ms = autoplay_ms
+        self.api = api  # False: JSON APIs answer 404, only page state is left
+        self.range_cap = range_cap  # >0: ranged replies stop short after this many bytes, like some CDNs
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        # Media bodies are slices of this repeating pattern; doubled so any
+        # chunk up to its length can be cut without wrapping
+        self._block = random.Random(1).randbytes(1024 * 1024) * 2
+        rng = random.Random(2)
+        self.catalog: dict[str, dict] = {}
+        for n in range(series):
+            name = " ".join(w.title() for w in rng.sample(_WORDS, 2)) + f" {n + 1}"
+            base = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+            self.catalog[base] = {
+                "title": name,
+                "episodes": [f"{base}-{i}" for i in range(1, episodes + 1)],
+            }
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------ #
+    #  Lifecycle                                                           #
+    # ------------------------------------------------------------------ #
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    # ------------------------------------------------------------------ #
+    #  Catalog helpers                                                     #
+    # ------------------------------------------------------------------ #
+    def first_episode_url(self) -> str:
+        series = next(iter(self.catalog.values()))
+        return f"{self.base_url}/videos/hentai/{series['episodes'][0]}"
+
+    def media_url(self, slug: str) -> str:
+        """Direct CDN URL of an episode, as the player would request it."""
+        if self.media == "mp4":
+            return f"{self.base_url}/cdn/{slug}/video.mp4"
+        return f"{self.base_url}/cdn/{slug}/master.m3u8"
+
+    def media_size(self) -> int:
+        return self.segments * self.segment_size
+
+    def _series_of(self, slug: str) -> Optional[dict]:
+        base = slug.rsplit("-", 1)[0]
+        series = self.catalog.get(base)
+        return series if series and slug in series["episodes"] else None
+
+    def _video_data(self, slug: str) -> dict:
+        """Video API payload: the episode, its franchise and its streams."""
+        series = self._series_of(slug)
+        videos = [
+            {"name": f"{series['title']} {i}", "slug": s}
+            for i, s in enumerate(series["episodes"], 1)
+        ]
+        return {
+            "hentai_video": next(v for v in videos if v["slug"] == slug),
+            "hentai_franchise_hentai_videos": videos,
+            "videos_manifest": {"servers": [{"streams": [
+                {"height": "1080", "url": ""},  # premium-only: no URL for guests
+                {"height": "720", "url": self.media_url(slug)},
+                {"height": "360", "url": self.media_url(slug)},
+            ]}]},
+        }
+
+    def _search(self, query: str) -> list[dict]:
+        words = [w for w in query.lower().split() if w]
+        hits = [
+            (base, s) for base, s in self.catalog.items()
+            if any(w in s["title"].lower() for w in words)
+        ] or list(self.catalog.items())
+        return [
+            {
+                "title": s["title"],
+                "slug": base,
+                "url": f"/videos/hentai/{s['episodes'][0]}",
+            }
+            for base, s in hits
+        ]
+
+    # ------------------------------------------------------------------ #
+    #  HTTP                                                                #
+    # ------------------------------------------------------------------ #
+    def _handler_class(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, fmt, *args):
+                pass
+
+            def do_GET(self):
+                with site._lock:
+                    site.requests += 1
+                if site.latency:
+                    time.sleep(site.latency)
+                try:
+                    site._route(self)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            do_POST = do_GET
+
+        return Handler
+
+    def _route(self, h: BaseHTTPRequestHandler) -> None:
+        parts = urlsplit(h.path)
+        path, query = parts.path, parse_qs(parts.query)
+        gated = _GATE_COOKIE not in (h.headers.get("Cookie") or "")
+
+        if path in ("/", "/search"):
+            return self._page(h, "Search", _SEARCH_BODY.format(), gated)
+        if path == "/api/search" and h.command == "GET":
+            return self._send(h, 200, json.dumps(self._search(query.get("q", [""])[0])), "application/json")
+        if path == "/api/search" and self.api:
+            # Shaped like the site's search service: hits is a JSON string
+            length = int(h.headers.get("Content-Length") or 0)
+            try:
+                text = json.loads(h.rfile.read(length) or b"{}").get("search_text") or ""
+            except ValueError:
+                return self._send(h, 400, "bad request")
+            hits = [
+                {"name": r["title"], "slug": r["url"].rsplit("/", 1)[-1], "cover_url": f"/thumbs/{r['slug']}.jpg"}
+                for r in self._search(text)
+            ]
+            body = {"page": 0, "nbPages": 1, "nbHits": len(hits), "hits": json.dumps(hits)}
+            return self._send(h, 200, json.dumps(body), "application/json")
+        if path == "/api/v8/video" and self.api:
+            slug = query.get("id", [""])[0]
+            if not self._series_of(slug):
+                return self._send(h, 404, "unknown video")
+            return self._send(h, 200, json.dumps(self._video_data(slug)), "application/json")
+
+        m = re.fullmatch(r"/videos/hentai/([a-z0-9-]+)", path)
+        if m:
+            series = self._series_of(m.group(1))
+            if not series:
+                return self._send(h, 404, "not found")
+            links = "".join(
+                f'<a href="/videos/hentai/{slug}"><span class="title">'
+                f'{html.escape(series["title"])} - Episode {i}</span></a>'
+                for i, slug in enumerate(series["episodes"], 1)
+            )
+            state = json.dumps({"state": {"data": {"video": self._video_data(m.group(1))}}})
+            body = _EPISODE_BODY.format(
+                state=state.replace("</", "<\\/"), title=html.escape(series["title"]),
+                slug=m.group(1), links=links,
+            )
+            return self._page(h, series["title"], body, gated)
+
+        m = re.fullmatch(r"/player/([a-z0-9-]+)", path)
+        if m:
+            slug = m.group(1)
+            loader = _LOADERS[self.cdn_path].format(media=self.media_url(slug), slug=quote(slug))
+            return self._send(h, 200, _PLAYER.format(loader=loader, autoplay_ms=self.autoplay_ms), "text/html")
+
+        m = re.fullmatch(r"/cdn/([a-z0-9-]+)/(.+)", path)
+        if m and self._series_of(m.group(1)):
+            return self._cdn(h, m.group(1), m.group(2))
+        return self._send(h, 404, "not found")
+
+    def _cdn(self, h: BaseHTTPRequestHandler, slug: str, rest: str) -> None:
+        playlist = "application/vnd.apple.mpegurl"
+        if rest == "master.m3u8":
+            lines = ["#EXTM3U"]
+            for name, height, divisor in (("v360", 360, 4), ("v720", 720, 1)):
+                bandwidth = int(self.segment_size / divisor * 8 / self.segment_duration)
+                lines += [
+                    f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={height * 16 // 9}x{height}",
+                    f"{name}/index.m3u8",
+                ]
+            return self._send(h, 200, "\n".join(lines) + "\n", playlist)
+
+        m = re.fullmatch(r"(v360|v720)/index\.m3u8", rest)
+        if m:
+            lines = [
+                "#EXTM3U", "#EXT-X-VERSION:3",
+                f"#EXT-X-TARGETDURATION:{int(self.segment_duration + 0.999)}",
+                "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:VOD",
+            ]
+            for i in range(self.segments):
+                lines += [f"#EXTINF:{self.segment_duration:.3f},", f"seg{i}.ts"]
+            lines.append("#EXT-X-ENDLIST")
+            return self._send(h, 200, "\n".join(lines) + "\n", playlist)
+
+        m = re.fullmatch(r"(v360|v720)/seg(\d+)\.ts", rest)
+        if m and int(m.group(2)) < self.segments:
+            size = self.segment_size // (4 if m.group(1) == "v360" else 1)
+            return self._media(h, size, "video/mp2t")
+
+        if rest == "video.mp4":
+            return self._media(h, self.media_size(), "video/mp4")
+        return self._send(h, 404, "not found")
+
+    def _page(self, h: BaseHTTPRequestHandler, title: str, body: str, gated: bool) -> None:
+        page = _PAGE.format(
+            title=html.escape(title), gate=_GATE if gated else "", body=body, cookie=_GATE_COOKIE
+        )
+        self._send(h, 200, page, "text/html")
+
+    def _send(self, h: BaseHTTPRequestHandler, status: int, body: str, ctype: str = "text/plain") -> None:
+        data = body.encode()
+        h.send_response(status)
+        h.send_header("Content-Type", f"{ctype}; charset=utf-8")
+        h.send_header("Content-Length", str(len(data)))
+        h.end_headers()
+        h.wfile.write(data)
+
+    def _media(self, h: BaseHTTPRequestHandler, size: int, ctype: str) -> None:
+        start, end = 0, size - 1
+        m = re.fullmatch(r"bytes=(\d*)-(\d*)", h.headers.get("Range") or "")
+        if m and (m.group(1) or m.group(2)):
+            if m.group(1):
+                start = int(m.group(1))
+                end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+            else:
+                start = max(0, size - int(m.group(2)))
+            if self.range_cap:
+                end = min(end, start + self.range_cap - 1)
+            h.send_response(206)
+            h.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            h.send_response(200)
+        h.send_header("Content-Type", ctype)
+        h.send_header("Accept-Ranges", "bytes")
+        h.send_header("Content-Length", str(end - start + 1))
+        h.end_headers()
+
+        chunk = min(256 * 1024, max(16 * 1024, self.bandwidth // 20)) if self.bandwidth else 256 * 1024
+        period = len(self._block) // 2
+        pos = start
+        while pos <= end:
+            n = min(chunk, end - pos + 1)
+            if self.bandwidth:
+                time.sleep(n / self.bandwidth)
+            offset = pos % period
+            h.wfile.write(self._block[offset:offset + n])
+            pos += n
+            with self._lock:
+                self.bytes_sent += n
@@ -0,0 +1,121 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = (
+    "job_id", "key", "page_url", "title", "user_id", "chat_id", "status_msg_id",
+    "stage", "cdn_url", "output_path", "fragment_index", "fragment_count",
+    "part_bytes", "bytes_done", "quality", "top_quality", "created", "updated",
+)
+
+# Added after the first release; older databases get them via ALTER TABLE
+_ADDED_COLUMNS = {"quality": "TEXT", "top_quality": "INTEGER DEFAULT 0"}
+
+
+class JobJournal:
+    """
+    Crash-safe record of every delivery that hasn't finished yet: who asked
+    for it, which stage it reached, where its partial output lives and how
+    many fragments are on disk. Once the download is complete the stage is
+    "downloaded" and output_path names the finished file, so a restart can
+    upload it without fetching it again. Rows are deleted when a job ends
+    normally, so whatever is left at startup was interrupted and can be
+    resumed.
+    """
+
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if not db_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " key TEXT NOT NULL, page_url TEXT NOT NULL, title TEXT,"
+                " user_id INTEGER, chat_id INTEGER, status_msg_id INTEGER,"
+                " stage TEXT NOT NULL, cdn_url TEXT, output_path TEXT,"
+                " fragment_index INTEGER DEFAULT 0, fragment_count INTEGER DEFAULT 0,"
+                " part_bytes INTEGER DEFAULT 0, bytes_done INTEGER DEFAULT 0,"
+                " quality TEXT, top_quality INTEGER DEFAULT 0,"
+                " created REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            present = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            for name, decl in _ADDED_COLUMNS.items():
+                if name not in present:
+                    self._db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {decl}")
+            self._db.commit()
+        except Exception as e:
+            logger.warning(f"Job journal disabled ({db_path}): {e}")
+            self._db = None
+
+    def create(
+        self,
+        key: str,
+        page_url: str,
+        title: str,
+        user_id: int,
+        chat_id: int,
+        status_msg_id: int,
+    ) -> Optional[int]:
+        if not self._db:
+            return None
+        now = time.time()
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO jobs (key, page_url, title, user_id, chat_id, status_msg_id,"
+                " stage, created, updated) VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?)",
+                (key, page_url, title, user_id, chat_id, status_msg_id, now, now),
+            )
+            self._db.commit()
+            return cur.lastrowid
+
+    def update(self, job_id: Optional[int], **fields) -> None:
+        if not self._db or job_id is None or not fields:
+            return
+        unknown = set(fields) - set(_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown journal fields: {unknown}")
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            try:
+                self._db.execute(
+                    f"UPDATE jobs SET {assignments} WHERE job_id = ?",
+                    (*fields.values(), job_id),
+                )
+                self._db.commit()
+            except Exception as e:
+                logger.debug(f"Journal update ignored: {e}")
+
+    def finish(self, job_id: Optional[int]) -> None:
+        if not self._db or job_id is None:
+            return
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            self._db.commit()
+
+    def unfinished(self) -> list[dict]:
+        if not self._db:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs ORDER BY job_id"
+            ).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+
+# ------------------------------------------------------------------ #
+#  Singleton instance                                                  #
+# ------------------------------------------------------------------ #
+journal = JobJournal(config.JOURNAL_DB_PATH)
@@ -0,0 +1,314 @@
+import asyncio
+import bisect
+import logging
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds — from a cached lookup up to a long episode upload
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1200)
+# Bytes per second — from a stalled CDN to a fast local link
+THROUGHPUT_BUCKETS = tuple(2 ** n * 1024 for n in range(6, 17, 1))  # 64 KiB/s … 64 MiB/s
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic total per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels) -> None:
+        """Mirror a total that another component already keeps."""
+        self._values[self._key(labels)] = value
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}"
+            for k, v in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Current value per label set."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}"
+            for k, v in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative buckets plus sum and count per label set."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts (+Inf last), sum, count]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[dict]:
+        """
+        Observe the duration of the block. The yielded dict can be updated
+        to change label values once the outcome is known.
+        """
+        started = time.monotonic()
+        labels = dict(labels)
+        try:
+            yield labels
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip((*self.buckets, math.inf), counts):
+                cumulative += n
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    """
+    All metrics of the process, rendered in the Prometheus text format.
+    Collectors run right before each scrape to refresh gauges and mirrored
+    totals from components that keep their own stats.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], None]] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} registered twice")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def add_collector(self, fn: Callable[[], None]) -> None:
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        for fn in self._collectors:
+            try:
+                fn()
+            except Exception as e:
+                logger.debug(f"Metrics collector failed: {e}")
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    # ------------------------------------------------------------------ #
+    #  HTTP endpoint                                                       #
+    # ------------------------------------------------------------------ #
+    async def start(self, host: str, port: int) -> None:
+        if not port or self._server:
+            return
+        self._server = await asyncio.start_server(self._handle, host, port)
+        logger.info(f"Metrics endpoint on http://{host}:{port}/metrics")
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Drain headers; nothing in them matters here
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            parts = request.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, ctype, body = "200 OK", "text/plain; version=0.0.4; charset=utf-8", self.render()
+            else:
+                status, ctype, body = "404 Not Found", "text/plain; charset=utf-8", "not found\n"
+            payload = body.encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode()
+                + payload
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.debug(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
+
+
+# ------------------------------------------------------------------ #
+#  Shared registry and metrics                                         #
+# ------------------------------------------------------------------ #
+registry = Registry()
+
+SEARCH_SECONDS = registry.histogram(
+    "hanime_search_seconds", "Search latency.", ("cache", "result"),
+)
+EPISODES_SECONDS = registry.histogram(
+    "hanime_episode_list_seconds", "Episode list latency.", ("cache", "result"),
+)
+CDN_EXTRACT_SECONDS = registry.histogram(
+    "hanime_cdn_extract_seconds",
+    "Browser CDN extraction latency by the interception path that produced the URL.",
+    ("path",),
+)
+EXTRACT_TIER_SECONDS = registry.histogram(
+    "hanime_extract_tier_seconds",
+    "Latency per extraction tier (http fast path, browser) by outcome.",
+    ("op", "tier", "result"),
+)
+CDN_LOOKUPS = registry.counter(
+    "hanime_cdn_lookups_total", "get_cdn_url calls by how they were answered.", ("source",),
+)
+DOWNLOAD_SECONDS = registry.histogram(
+    "hanime_download_seconds", "Episode download duration.", ("engine",),
+)
+DOWNLOAD_THROUGHPUT = registry.histogram(
+    "hanime_download_bytes_per_second", "Episode download throughput.", ("engine",),
+    THROUGHPUT_BUCKETS,
+)
+UPLOAD_THROUGHPUT = registry.histogram(
+    "hanime_upload_bytes_per_second", "Telegram upload throughput.", ("mode",),
+    THROUGHPUT_BUCKETS,
+)
+DELIVERY_SECONDS = registry.histogram(
+    "hanime_delivery_seconds", "End-to-end delivery time per request.", ("result",),
+)
+RETRIES = registry.counter(
+    "hanime_retries_total", "Retried operations.", ("op",),
+)
+FAILURES = registry.counter(
+    "hanime_failures_total", "Operations that failed for good.", ("op",),
+)
+CACHE_REQUESTS = registry.counter(
+    "hanime_cache_requests_total", "Cache lookups.", ("cache", "result"),
+)
+BROWSER_CONTEXTS = registry.gauge(
+    "hanime_browser_contexts", "Pooled browser contexts.", ("state",),
+)
+BROWSER_RSS = registry.gauge(
+    "hanime_browser_rss_bytes", "Resident memory of the browser process tree.",
+)
+BROWSER_RESTARTS = registry.counter(
+    "hanime_browser_restarts_total", "Browser recycles by the watchdog.", ("reason",),
+)
+STAGE_JOBS = registry.gauge(
+    "hanime_stage_jobs", "Jobs per scheduler stage.", ("stage", "state"),
+)
+SESSION_ENTRIES = registry.gauge(
+    "hanime_session_entries", "Browse sessions held in memory.",
+)
+SESSION_BYTES = registry.gauge(
+    "hanime_session_bytes", "Estimated memory held by browse sessions.",
+)
+SESSION_DROPS = registry.counter(
+    "hanime_session_drops_total", "Browse sessions dropped from memory.", ("reason",),
+)
+EXECUTOR_TASKS = registry.gauge(
+    "hanime_executor_tasks", "Executor work items.", ("executor", "state"),
+)
+EXECUTOR_RUNS = registry.counter(
+    "hanime_executor_runs_total", "Finished executor work items by outcome.",
+    ("executor", "result"),
+)
+
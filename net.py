@@ -0,0 +1,26 @@
+import urllib.request
+from typing import Optional
+
+import config
+
+# What every plain-HTTP client presents to the site and its CDN
+SITE_HEADERS = {
+    "User-Agent": config.USER_AGENT,
+    "Referer": config.HANIME_BASE_URL + "/",
+    "Origin": config.HANIME_BASE_URL,
+}
+
+
+def build_opener(headers: Optional[dict] = None) -> urllib.request.OpenerDirector:
+    """
+    urllib opener that goes through PROXY_URL when one is set and sends
+    SITE_HEADERS (plus `headers`) unless a request sets its own.
+    """
+    handlers = []
+    if config.PROXY_URL:
+        handlers.append(urllib.request.ProxyHandler(
+            {"http": config.PROXY_URL, "https": config.PROXY_URL}
+        ))
+    opener = urllib.request.build_opener(*handlers)
+    opener.addheaders = list({**SITE_HEADERS, **(headers or {})}.items())
+    return opener
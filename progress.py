@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from pyrogram.errors import FloodWait, MessageNotModified
+from pyrogram.types import Message
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def ready_in(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+class ProgressService:
+    """
+    Single place that edits status messages. Callers just post the latest
+    text for a message; only the newest text per message is kept, and a
+    background flusher sends edits under a global and a per-chat token
+    bucket. FloodWait pauses the flusher instead of the caller.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float):
+        self._global = _TokenBucket(global_rate, max(1.0, global_rate))
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chats: dict[int, _TokenBucket] = {}
+        # (chat_id, message_id) -> (message, text, kwargs); insertion = FIFO
+        self._pending: OrderedDict[tuple[int, int], tuple[Message, str, dict]] = OrderedDict()
+        self._last_text: dict[tuple[int, int], str] = {}
+        self._paused_until = 0.0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.superseded = 0
+        self.flood_waits = 0
+
+    # ------------------------------------------------------------------ #
+    #  Lifecycle                                                           #
+    # ------------------------------------------------------------------ #
+    def start(self) -> None:
+        if self._task:
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # ------------------------------------------------------------------ #
+    #  API                                                                 #
+    # ------------------------------------------------------------------ #
+    def update(self, msg: Message, text: str, **kwargs) -> None:
+        """Post the latest text for msg. Never blocks; older text is dropped."""
+        key = (msg.chat.id, msg.id)
+        if key in self._pending:
+            self.superseded += 1
+            del self._pending[key]
+        elif self._last_text.get(key) == text and not kwargs:
+            return
+        self._pending[key] = (msg, text, kwargs)
+        if self._wake:
+            self._wake.set()
+
+    def discard(self, msg: Message) -> None:
+        """Forget a message (e.g. it is about to be deleted)."""
+        key = (msg.chat.id, msg.id)
+        self._pending.pop(key, None)
+        self._last_text.pop(key, None)
+        self._evict_idle(time.monotonic())
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "chats": len(self._chats),
+            "sent": self.sent,
+            "superseded": self.superseded,
+            "flood_waits": self.flood_waits,
+        }
+
+    # ------------------------------------------------------------------ #
+    #  Flusher                                                             #
+    # ------------------------------------------------------------------ #
+    def _chat_bucket(self, chat_id: int) -> _TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = _TokenBucket(self._chat_rate, self._chat_burst)
+        return bucket
+
+    def _evict_idle(self, now: float) -> None:
+        """Drop buckets of chats with nothing queued once they have refilled.
+
+        A full bucket is what a new chat starts with, so forgetting it does
+        not loosen the per-chat limit; buckets still refilling are kept and
+        swept on a later pass.
+        """
+        busy = {chat_id for chat_id, _ in self._pending}
+        for chat_id in [c for c in self._chats if c not in busy]:
+            bucket = self._chats[chat_id]
+            bucket.ready_in(now)
+            if bucket.tokens >= bucket.burst:
+                del self._chats[chat_id]
+
+    def _next_ready(self, now: float) -> tuple[Optional[tuple[int, int]], float]:
+        """Oldest pending edit whose chat has a token, else the shortest wait."""
+        wait = 1.0
+        for key in self._pending:
+            delay = self._chat_bucket(key[0]).ready_in(now)
+            if delay == 0:
+                return key, 0.0
+            wait = min(wait, delay)
+        return None, wait
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._flush_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f"Progress flusher error: {e}")
+                await asyncio.sleep(1)
+
+    async def _flush_once(self) -> None:
+        now = time.monotonic()
+        if not self._pending:
+            # Idle: wake once in a while until every bucket has refilled and gone
+            self._evict_idle(now)
+            self._wake.clear()
+            refill = self._chat_burst / self._chat_rate if self._chats else None
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=refill)
+            except asyncio.TimeoutError:
+                pass
+            return
+        if now < self._paused_until:
+            await asyncio.sleep(self._paused_until - now)
+            return
+        global_wait = self._global.ready_in(now)
+        if global_wait:
+            await asyncio.sleep(global_wait)
+            return
+        key, wait = self._next_ready(now)
+        if key is None:
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+            return
+
+        msg, text, kwargs = self._pending.pop(key)
+        self._global.take()
+        self._chat_bucket(key[0]).take()
+        try:
+            await msg.edit_text(text, **kwargs)
+            self.sent += 1
+            self._last_text[key] = text
+        except MessageNotModified:
+            self._last_text[key] = text
+        except FloodWait as e:
+            self.flood_waits += 1
+            self._paused_until = time.monotonic() + e.value
+            logger.warning(f"FloodWait {e.value}s — pausing status edits")
+            # Retry later unless something newer arrived meanwhile
+            if key not in self._pending:
+                self._pending[key] = (msg, text, kwargs)
+                self._pending.move_to_end(key, last=False)
+        except Exception as e:
+            logger.debug(f"Status edit ignored: {e}")
+
+        if len(self._last_text) > 10000:
+            # Bounded memory: keep only messages that still have edits queued
+            self._last_text = {k: v for k, v in self._last_text.items() if k in self._pending}
+
+
+# ------------------------------------------------------------------ #
+#  Singleton instance                                                  #
+# ------------------------------------------------------------------ #
+progress = ProgressService(
+    config.PROGRESS_GLOBAL_RATE,
+    config.PROGRESS_CHAT_RATE,
+    config.PROGRESS_CHAT_BURST,
+)
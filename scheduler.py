@@ -0,0 +1,227 @@
+import asyncio
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_LOW = -10
+PRIORITY_NORMAL = 0
+
+# How often a queued job re-reports its position while it waits
+POSITION_REFRESH = 3.0
+
+_seq = itertools.count()
+
+
+class Job:
+    """One delivery (extract → download → upload) owned by a user."""
+
+    __slots__ = ("user_id", "priority", "seq", "stage", "created", "parent")
+
+    def __init__(self, user_id: int, priority: int = PRIORITY_NORMAL, parent: Optional["Job"] = None):
+        self.user_id = user_id
+        self.priority = priority
+        self.seq = next(_seq)
+        self.stage: Optional[str] = None
+        self.created = time.monotonic()
+        self.parent = parent  # batch job this one was admitted under
+
+
+class _Waiter:
+    __slots__ = ("job", "granted")
+
+    def __init__(self, job: Job, granted: asyncio.Future):
+        self.job = job
+        self.granted = granted
+
+
+class Stage:
+    """
+    Bounded pipeline stage. Free slots go to the highest priority first and,
+    within a priority, round-robin across users so one user queueing ten
+    jobs can't starve everyone else.
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.active = 0
+        self._waiters: list[_Waiter] = []
+        self._last_served: dict[int, int] = {}
+        self._running: dict[int, int] = {}
+        self._tick = 0
+
+    def _ordered(self) -> list[_Waiter]:
+        # A user's n-th waiting job is in round n; earlier rounds go first,
+        # and inside a round the user served longest ago goes first.
+        rounds: dict[tuple[int, int], int] = {}
+        keyed = []
+        for w in sorted(self._waiters, key=lambda w: w.job.seq):
+            slot = (w.job.user_id, w.job.priority)
+            rnd = rounds.get(slot, 0)
+            rounds[slot] = rnd + 1
+            keyed.append((
+                -w.job.priority,
+                rnd,
+                self._last_served.get(w.job.user_id, -1),
+                w.job.seq,
+                w,
+            ))
+        keyed.sort(key=lambda k: k[:4])
+        return [k[-1] for k in keyed]
+
+    def position(self, job: Job) -> int:
+        """1-based queue position, or 0 if the job isn't waiting here."""
+        for i, w in enumerate(self._ordered(), 1):
+            if w.job is job:
+                return i
+        return 0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _grant(self) -> None:
+        while self.active < self.limit and self._waiters:
+            w = self._ordered()[0]
+            self._waiters.remove(w)
+            if w.granted.done():
+                continue
+            self._start(w.job)
+            w.granted.set_result(None)
+
+    def _start(self, job: Job) -> None:
+        self.active += 1
+        self._tick += 1
+        self._last_served[job.user_id] = self._tick
+        self._running[job.user_id] = self._running.get(job.user_id, 0) + 1
+
+    def _forget_idle(self, user_id: int) -> None:
+        """Drop a user's round-robin state once they have nothing queued or running."""
+        if user_id in self._running:
+            return
+        if any(w.job.user_id == user_id for w in self._waiters):
+            return
+        self._last_served.pop(user_id, None)
+
+    async def acquire(
+        self,
+        job: Job,
+        on_wait: Optional[Callable[[int], Awaitable[None]]] = None,
+    ) -> None:
+        if self.active < self.limit and not self._waiters:
+            self._start(job)
+            return
+
+        waiter = _Waiter(job, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        last_pos = None
+        try:
+            while not waiter.granted.done():
+                pos = self.position(job)
+                if on_wait and pos and pos != last_pos:
+                    last_pos = pos
+                    try:
+                        await on_wait(pos)
+                    except Exception as e:
+                        logger.debug(f"Queue position callback failed: {e}")
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.granted), POSITION_REFRESH)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._forget_idle(job.user_id)
+            elif waiter.granted.done() and not waiter.granted.cancelled():
+                self.release(job)
+            waiter.granted.cancel()
+            raise
+
+    def release(self, job: Job) -> None:
+        self.active -= 1
+        left = self._running.get(job.user_id, 0) - 1
+        if left > 0:
+            self._running[job.user_id] = left
+        else:
+            self._running.pop(job.user_id, None)
+        self._grant()
+        self._forget_idle(job.user_id)
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "active": self.active, "waiting": self.waiting}
+
+
+class JobScheduler:
+    """
+    Global download scheduler: separate bounded stages for CDN extraction,
+    download and upload, plus a cap on how many jobs a single user may have
+    queued or running at once.
+    """
+
+    def __init__(self, limits: dict[str, int], per_user: int):
+        self.stages = {name: Stage(name, limit) for name, limit in limits.items()}
+        self.per_user = max(1, per_user)
+        self._user_jobs: dict[int, int] = {}
+
+    def new_job(self, user_id: int, priority: int = PRIORITY_NORMAL) -> Optional[Job]:
+        """Admit a job, or return None when the user is already at their cap."""
+        if self._user_jobs.get(user_id, 0) >= self.per_user:
+            return None
+        self._user_jobs[user_id] = self._user_jobs.get(user_id, 0) + 1
+        return Job(user_id, priority)
+
+    def child_job(self, parent: Job) -> Job:
+        """A job that runs under parent's admission, e.g. one episode of a batch."""
+        return Job(parent.user_id, parent.priority, parent)
+
+    def finish(self, job: Job) -> None:
+        if job.parent is not None:
+            return
+        left = self._user_jobs.get(job.user_id, 0) - 1
+        if left > 0:
+            self._user_jobs[job.user_id] = left
+        else:
+            self._user_jobs.pop(job.user_id, None)
+
+    @asynccontextmanager
+    async def stage(
+        self,
+        job: Job,
+        name: str,
+        on_wait: Optional[Callable[[int], Awaitable[None]]] = None,
+    ) -> AsyncIterator[None]:
+        """Hold a slot in `name` for the duration of the block."""
+        stage = self.stages[name]
+        await stage.acquire(job, on_wait)
+        job.stage = name
+        try:
+            yield
+        finally:
+            job.stage = None
+            stage.release(job)
+
+    def stats(self) -> dict:
+        return {
+            "stages": {name: st.stats() for name, st in self.stages.items()},
+            "jobs": sum(self._user_jobs.values()),
+            "users": len(self._user_jobs),
+        }
+
+
+# ------------------------------------------------------------------ #
+#  Singleton instance                                                  #
+# ------------------------------------------------------------------ #
+scheduler = JobScheduler(
+    {
+        "extract": config.EXTRACT_CONCURRENCY,
+        "download": config.DOWNLOAD_CONCURRENCY,
+        "upload": config.UPLOAD_CONCURRENCY,
+    },
+    config.MAX_JOBS_PER_USER,
+)
@@ -0,0 +1,104 @@
+"""
+Scraper worker process: owns one Chromium and runs browser calls handed
+out by the bot's ScrapeBroker. Spawned by the bot when SCRAPE_WORKERS > 0;
+can also be started by hand (e.g. on another host with a host:port
+broker address):
+
+    python scrape_worker.py --connect /app/data/scrape.sock
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+# Workers never spawn workers, and the bot process owns caches, metrics
+# and persistence — only the browser lives here.
+os.environ["SCRAPE_WORKERS"] = "0"
+os.environ["CACHE_DB_PATH"] = ""
+os.environ["METRICS_PORT"] = "0"
+
+import config  # noqa: E402
+from broker import connect, receive, send  # noqa: E402
+from scraper import scraper  # noqa: E402
+
+logger = logging.getLogger("scrape_worker")
+
+# Broker method name → the scraper's single-attempt browser operation
+METHODS = {
+    "search": scraper._search_attempt,
+    "episodes": scraper._get_series_episodes_attempt,
+    "cdn": scraper._get_cdn_url_attempt,
+}
+
+
+async def _handle(writer: asyncio.StreamWriter, message: dict, running: dict) -> None:
+    call_id = message["id"]
+    try:
+        fn = METHODS[message["method"]]
+        result = await fn(*message.get("args", ()), **message.get("kwargs", {}))
+        send(writer, {"type": "result", "id": call_id, "ok": True, "result": result})
+    except asyncio.CancelledError:
+        pass  # the broker asked for it and has stopped waiting
+    except Exception as e:
+        send(writer, {"type": "result", "id": call_id, "ok": False, "error": f"{type(e).__name__}: {e}"})
+    finally:
+        running.pop(call_id, None)
+
+
+async def run(address: str, name: str) -> None:
+    await scraper.start()
+    running: dict[int, asyncio.Task] = {}
+    writer = None
+    try:
+        reader, writer = await connect(address)
+        send(writer, {
+            "type": "hello",
+            "name": name,
+            "pid": os.getpid(),
+            "capacity": config.BROWSER_POOL_SIZE,
+            "token": config.SCRAPE_BROKER_TOKEN,
+        })
+        await writer.drain()
+        logger.info(f"Worker {name} connected to {address}")
+        while True:
+            message = await receive(reader)
+            if message is None or message.get("type") == "shutdown":
+                break
+            if message.get("type") == "call":
+                task = asyncio.get_running_loop().create_task(_handle(writer, message, running))
+                running[message["id"]] = task
+            elif message.get("type") == "cancel":
+                task = running.get(message.get("id"))
+                if task:
+                    task.cancel()
+    finally:
+        for task in list(running.values()):
+            task.cancel()
+        await asyncio.gather(*running.values(), return_exceptions=True)
+        if writer:
+            writer.close()
+        await scraper.stop()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Scraper worker for the bot's scrape broker")
+    parser.add_argument("--connect", default=config.SCRAPE_BROKER_ADDRESS, help="socket path or host:port")
+    parser.add_argument("--name", default=os.environ.get("SCRAPE_WORKER_NAME") or f"pid-{os.getpid()}")
+    args = parser.parse_args()
+    logging.basicConfig(
+        format=f"%(asctime)s | %(levelname)s | {args.name} | %(name)s | %(message)s",
+        level=logging.INFO,
+    )
+    try:
+        asyncio.run(run(args.connect, args.name))
+    except (ConnectionError, FileNotFoundError) as e:
+        logger.error(f"Could not reach scrape broker at {args.connect}: {e}")
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,257 @@
 import asyncio
+import itertools
+import json
+import os
 import re
 import logging
-from typing import Optional
-from playwright.async_api import async_playwright, Page, Browser, BrowserContext
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional
+from urllib.parse import urlsplit
+from playwright.async_api import (
+    async_playwright,
+    Page,
+    Browser,
+    BrowserContext,
+    ElementHandle,
+    Route,
+)
 
 import config
+import cdn_rank
+from broker import ScrapeBroker
+from cache import TTLCache, normalize_query, signed_url_expiry
+from fastpath import fast_path
+from metrics import (
+    BROWSER_RESTARTS,
+    BROWSER_RSS,
+    CDN_EXTRACT_SECONDS,
+    CDN_LOOKUPS,
+    EPISODES_SECONDS,
+    EXTRACT_TIER_SECONDS,
+    FAILURES,
+    RETRIES,
+    SEARCH_SECONDS,
+)
+from net import build_opener
 
 logger = logging.getLogger(__name__)
 
+AGE_GATE_SELECTORS = [
+    "button[class*='confirm']",
+    "button[class*='agree']",
+    "button[class*='enter']",
+    "[class*='age-gate'] button",
+    "[class*='age_gate'] button",
+    "[class*='ageGate'] button",
+    "[class*='age-verify'] button",
+    "button:has-text('Enter')",
+    "button:has-text('I am 18')",
+    "button:has-text('Yes')",
+    "button:has-text('Confirm')",
+]
+
+# Resource types aborted per lease profile. Listing pages only need the
+# document, scripts (the site is an SPA) and XHR; CDN extraction also keeps
+# stylesheets so the player lays out and can be clicked.
+BLOCK_PROFILES = {
+    "listing": {
+        "image", "media", "font", "stylesheet", "texttrack",
+        "websocket", "eventsource", "manifest", "other",
+    },
+    "cdn": {"image", "media", "font", "texttrack", "eventsource", "manifest", "other"},
+}
+
+# Ads, analytics and trackers — aborted under every profile
+_BLOCKED_URL_RE = re.compile(
+    r"google-analytics\.com|googletagmanager\.com|doubleclick\.net|"
+    r"googlesyndication\.com|adservice\.google|facebook\.(?:net|com)/tr|"
+    r"connect\.facebook\.net|hotjar\.com|clarity\.ms|cloudflareinsights\.com|"
+    r"exoclick\.com|exosrv\.com|juicyads\.com|trafficjunky\.(?:com|net)|"
+    r"popads\.net|popcash\.net|adsterra\.com|a-ads\.com|tsyndicate\.com|"
+    r"realsrv\.com|magsrv\.com|/ads?/|[?&]ad_?(?:id|unit)=",
+    re.IGNORECASE,
+)
+
+# Media segments — the manifest request is all CDN extraction needs
+_SEGMENT_RE = re.compile(r"\.(?:ts|m4s|aac|m4a|m4v)(?:\?|$)", re.IGNORECASE)
+
+# Stream manifests / progressive files, in URLs and in response bodies
+_CDN_URL_RE = re.compile(r"https?://[^\s\"'<>]+\.(?:m3u8|mp4)(?:[^\s\"'<>]*)?", re.IGNORECASE)
+# Response bodies worth scanning for embedded stream URLs
+_SNIFF_TYPES = ("json", "javascript", "text/plain")
+
+# Walks a selector cascade inside the page and returns every card's
+# href/title/thumb from the first selector that yields episode links, so a
+# whole result page costs one round trip instead of several per card.
+_EXTRACT_LINKS_JS = """
+({selectors, titleSelector, textFallback}) => {
+    for (const sel of selectors) {
+        let nodes;
+        try { nodes = document.querySelectorAll(sel); } catch (e) { continue; }
+        const items = [];
+        for (const card of nodes) {
+            const a = card.tagName.toLowerCase() === "a" ? card : card.querySelector("a");
+            const href = a ? a.getAttribute("href") : null;
+            if (!href || !href.includes("/videos/hentai/")) continue;
+            const titleEl = card.querySelector(titleSelector);
+            const title = titleEl ? titleEl.innerText : (textFallback ? card.innerText : "");
+            const img = card.querySelector("img");
+            items.push({
+                href: href,
+                title: (title || "").trim(),
+                thumb: img ? (img.getAttribute("src") || "") : "",
+            });
+        }
+        if (items.length) return {selector: sel, items: items};
+    }
+    return {selector: null, items: []};
+}
+"""
+
+
+def canonical_url(url: str) -> str:
+    """Normalise a hanime.tv page URL so one episode always maps to one key."""
+    parts = urlsplit(url.strip())
+    host = (parts.netloc or urlsplit(config.HANIME_BASE_URL).netloc).lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return f"https://{host}{parts.path.rstrip('/')}"
+
+
+def _browser_rss(owner: int) -> int:
+    """
+    Resident memory of the Playwright driver started by `owner` and every
+    process below it — the browser and its renderers — summed from /proc.
+    Other children of `owner` (e.g. ffmpeg) are not counted. 0 without /proc.
+    """
+    try:
+        pids = [int(p) for p in os.listdir("/proc") if p.isdigit()]
+    except OSError:
+        return 0
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    children: dict[int, list[int]] = {}
+    rss: dict[int, int] = {}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue  # exited meanwhile
+        # The command name may contain spaces; fields resume after its ")"
+        fields = stat[stat.rindex(b")") + 2:].split()
+        children.setdefault(int(fields[1]), []).append(pid)
+        rss[pid] = int(fields[21]) * page_size
+    stack = []
+    for pid in children.get(owner, ()):
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                # The driver runs as `node …/cli.js run-driver`
+                if b"\0run-driver" in f.read():
+                    stack.append(pid)
+        except OSError:
+            continue
+    total = 0
+    while stack:
+        pid = stack.pop()
+        total += rss.get(pid, 0)
+        stack.extend(children.get(pid, ()))
+    return total
+
+
+class _PooledContext:
+    """A warmed browser context and its page, leased out by the pool."""
+
+    __slots__ = ("context", "page", "uses", "created", "profile", "generation", "sniff")
+
+    def __init__(self, context: BrowserContext, page: Page, generation: int = 0):
+        self.context = context
+        self.page = page
+        self.uses = 0
+        self.created = time.monotonic()
+        self.profile = "listing"
+        self.generation = generation  # browser launch it belongs to
+        self.sniff: Optional[Callable[[str], None]] = None  # CDN extraction's URL hook
+
 
 class HanimeScraper:
     def __init__(self):
         self.browser: Optional[Browser] = None
         self.playwright = None
+        # Context pool — idle entries are reused LIFO so the warmest one goes
+        # out first; the semaphore caps concurrent browser operations.
+        self._idle: list[_PooledContext] = []
+        self._pool_size = max(1, config.BROWSER_POOL_SIZE)
+        self._slots = asyncio.Semaphore(self._pool_size)
+        self._slot_debt = 0  # slots to retire on release after a shrink
+        self._leased = 0
+        self.blocked_requests = 0
+        # Speculative CDN prefetch: one task per page URL (single-flight),
+        # the subset currently holding a pool slot, and foreground callers
+        # waiting for a slot (prefetch only runs while this is zero).
+        self._prefetching: dict[str, asyncio.Task] = {}
+        self._prefetch_leases: set[asyncio.Task] = set()
+        self._prefetch_slots = asyncio.Semaphore(max(1, config.PREFETCH_CONCURRENCY))
+        self._foreground_waiting = 0
+        self._capacity = asyncio.Event()
+        self.prefetch_hits = 0
+        self.prefetch_preempted = 0
+        # Cookies/localStorage captured once the age gate has been passed;
+        # every new context starts from it so the gate rarely shows again.
+        self._storage_state: Optional[dict] = None
+        # With SCRAPE_WORKERS > 0 the browser attempts run in worker
+        # processes; caching, retries and prefetch stay here.
+        self.broker: Optional[ScrapeBroker] = None
+        # Browser health: launches so far, operations and recent outcomes
+        # since the current launch. New leases wait on _browser_ready while
+        # a restart drains and relaunches.
+        self._generation = 0
+        self._ops = 0
+        self._outcomes: deque[bool] = deque(maxlen=max(1, config.BROWSER_ERROR_WINDOW))
+        self._browser_ready = asyncio.Event()
+        self._browser_ready.set()
+        self._restarting = False
+        self._closing = False
+        self._watchdog: Optional[asyncio.Task] = None
+        self.browser_restarts = 0
+        self.browser_rss = 0
+        self.cache = TTLCache(
+            config.CACHE_MAX_ENTRIES,
+            {
+                "search": config.SEARCH_CACHE_TTL,
+                "episodes": config.EPISODES_CACHE_TTL,
+                "cdn": config.CDN_CACHE_TTL,
+            },
+            config.CACHE_DB_PATH,
+            config.CACHE_COMMIT_INTERVAL,
+        )
 
     async def start(self):
+        if config.SCRAPE_WORKERS > 0:
+            self.broker = ScrapeBroker(
+                config.SCRAPE_BROKER_ADDRESS,
+                spawn=config.SCRAPE_WORKERS,
+                token=config.SCRAPE_BROKER_TOKEN,
+                call_timeout=config.SCRAPE_CALL_TIMEOUT,
+                on_capacity=self._resize_slots,
+            )
+            # Slots now bound in-flight worker calls across all workers; the
+            # expected local capacity until workers report their own
+            self._pool_size = config.SCRAPE_WORKERS * max(1, config.BROWSER_POOL_SIZE)
+            self._slots = asyncio.Semaphore(self._pool_size)
+            await self.broker.start()
+            logger.info(f"Scraping in {config.SCRAPE_WORKERS} worker process(es).")
+            return
+        self._load_storage_state()
         self.playwright = await async_playwright().start()
-        self.browser = await self.playwright.chromium.launch(
+        await self._launch()
+        await self._warm_pool()
+        if config.BROWSER_WATCHDOG_INTERVAL > 0:
+            self._watchdog = asyncio.get_running_loop().create_task(self._watch())
+
+    async def _launch(self) -> None:
+        browser = await self.playwright.chromium.launch(
             headless=config.HEADLESS_BROWSER,
             args=[
                 "--no-sandbox",
@@ -25,9 +260,30 @@ class HanimeScraper:
                 "--disable-gpu",
             ],
         )
+        browser.on("disconnected", lambda _: self._on_disconnected(browser))
+        self.browser = browser
+        self._generation += 1
+        self._ops = 0
+        self._outcomes.clear()
         logger.info("Browser started.")
 
     async def stop(self):
+        self.cancel_prefetch()
+        await fast_path.close()
+        self.cache.flush()
+        if self.broker:
+            await self.broker.stop()
+            self.broker = None
+            logger.info("Scrape workers stopped.")
+            return
+        self._closing = True
+        if self._watchdog:
+            self._watchdog.cancel()
+            await asyncio.gather(self._watchdog, return_exceptions=True)
+            self._watchdog = None
+        idle, self._idle = self._idle, []
+        for entry in idle:
+            await self._discard(entry)
         if self.browser:
             await self.browser.close()
         if self.playwright:
@@ -36,46 +292,427 @@ class HanimeScraper:
 
     async def _new_context(self) -> BrowserContext:
         return await self.browser.new_context(
-            user_agent=(
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/120.0.0.0 Safari/537.36"
-            ),
+            user_agent=config.USER_AGENT,
             viewport={"width": 1280, "height": 800},
+            storage_state=self._storage_state,
+        )
+
+    # ------------------------------------------------------------------ #
+    #  CONTEXT POOL                                                        #
+    # ------------------------------------------------------------------ #
+    async def _create_pooled(self) -> _PooledContext:
+        context = await self._new_context()
+        try:
+            page = await context.new_page()
+            entry = _PooledContext(context, page, self._generation)
+            if config.BLOCK_RESOURCES:
+                await context.route("**/*", lambda route: self._route(entry, route))
+        except Exception:
+            await context.close()
+            raise
+        return entry
+
+    async def _route(self, entry: _PooledContext, route: Route) -> None:
+        """Abort what the current lease profile doesn't need."""
+        request = route.request
+        blocked = BLOCK_PROFILES.get(entry.profile, set())
+        url = request.url
+        # Seen here, before any blocking, so CDN extraction needs no
+        # request listener of its own
+        if entry.sniff and _CDN_URL_RE.search(url):
+            entry.sniff(url)
+        try:
+            if (
+                request.resource_type in blocked
+                or _BLOCKED_URL_RE.search(url)
+                or (entry.profile == "cdn" and _SEGMENT_RE.search(url))
+            ):
+                self.blocked_requests += 1
+                await route.abort()
+            else:
+                await route.continue_()
+        except Exception as e:
+            # Context closed or request already handled
+            logger.debug(f"Route handling ignored for {url[:80]}: {e}")
+
+    async def _warm_pool(self) -> None:
+        count = min(config.BROWSER_POOL_WARM, config.BROWSER_POOL_SIZE)
+        if count <= 0:
+            return
+        created = await asyncio.gather(
+            *(self._create_pooled() for _ in range(count)),
+            return_exceptions=True,
+        )
+        for entry in created:
+            if isinstance(entry, _PooledContext):
+                self._idle.append(entry)
+            else:
+                logger.warning(f"Could not pre-warm browser context: {entry}")
+        logger.info(f"Context pool warmed with {len(self._idle)} context(s).")
+
+    async def _discard(self, entry: _PooledContext) -> None:
+        try:
+            await entry.context.close()
+        except Exception as e:
+            logger.debug(f"Context close ignored: {e}")
+
+    async def _is_healthy(self, entry: _PooledContext) -> bool:
+        if not self.browser or not self.browser.is_connected():
+            return False
+        if entry.page.is_closed():
+            return False
+        try:
+            await asyncio.wait_for(entry.page.evaluate("1"), timeout=3)
+        except Exception:
+            return False
+        return True
+
+    def _release_slot(self) -> None:
+        if self._slot_debt:
+            self._slot_debt -= 1
+        else:
+            self._slots.release()
+
+    def _resize_slots(self, size: int) -> None:
+        """Follow the broker's worker capacity, remote workers included."""
+        size = max(1, size)
+        delta = size - self._pool_size
+        if not delta:
+            return
+        self._pool_size = size
+        if delta > 0:
+            # New slots pay off any pending shrink first
+            paid = min(delta, self._slot_debt)
+            self._slot_debt -= paid
+            for _ in range(delta - paid):
+                self._slots.release()
+        else:
+            self._slot_debt -= delta
+        logger.info(f"Scrape pool resized to {size} slot(s)")
+
+    async def _acquire_slot(self, background: bool) -> None:
+        if background:
+            await self._slots.acquire()
+            return
+        self._foreground_waiting += 1
+        try:
+            if self._slots.locked():
+                self._preempt_prefetch()
+            await self._slots.acquire()
+        finally:
+            self._foreground_waiting -= 1
+
+    async def _checkout(self, background: bool = False) -> _PooledContext:
+        while True:
+            await self._browser_ready.wait()
+            await self._acquire_slot(background)
+            if self._browser_ready.is_set():
+                break
+            # A restart began while we queued for the slot
+            self._release_slot()
+        try:
+            while self._idle:
+                entry = self._idle.pop()
+                if await self._is_healthy(entry):
+                    break
+                logger.info("Dropping unhealthy pooled context.")
+                await self._discard(entry)
+            else:
+                entry = await self._create_pooled()
+        except BaseException:
+            self._release_slot()
+            raise
+        entry.uses += 1
+        self._leased += 1
+        self._ops += 1
+        return entry
+
+    async def _checkin(self, entry: _PooledContext) -> None:
+        self._leased -= 1
+        try:
+            if (
+                entry.uses < config.BROWSER_CONTEXT_MAX_USES
+                and entry.generation == self._generation
+                and self._browser_ready.is_set()
+                and self.browser
+                and self.browser.is_connected()
+                and not entry.page.is_closed()
+            ):
+                try:
+                    # Stop players/timers from the last page before parking it
+                    await entry.page.goto("about:blank", timeout=5000)
+                    self._idle.append(entry)
+                    return
+                except Exception as e:
+                    logger.debug(f"Pooled page reset failed: {e}")
+            await self._discard(entry)
+        finally:
+            self._release_slot()
+            self._capacity.set()
+
+    @asynccontextmanager
+    async def _lease(
+        self, profile: str = "listing", background: bool = False
+    ) -> AsyncIterator[_PooledContext]:
+        """
+        Check a warmed context out of the pool for one operation.
+        profile selects what the routing layer blocks (see BLOCK_PROFILES).
+        background leases (prefetch) can be cancelled by foreground ones.
+        """
+        entry = await self._checkout(background)
+        entry.profile = profile
+        try:
+            yield entry
+        except Exception:
+            self._outcomes.append(False)
+            raise
+        else:
+            self._outcomes.append(True)
+        finally:
+            await self._checkin(entry)
+
+    async def _browser_tier(self, op: str, attempt):
+        """Await one browser attempt, recording it as the "browser" tier."""
+        with EXTRACT_TIER_SECONDS.time(op=op, tier="browser", result="error") as timing:
+            result = await attempt
+            timing["result"] = "ok" if result else "miss"
+            return result
+
+    # ------------------------------------------------------------------ #
+    #  BROWSER WATCHDOG                                                    #
+    # ------------------------------------------------------------------ #
+    def _error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    async def _check_health(self) -> Optional[tuple[str, str]]:
+        """(reason, detail) when the browser should be recycled, else None."""
+        if not self.browser or not self.browser.is_connected():
+            return "disconnected", "browser is not connected"
+        self.browser_rss = await asyncio.to_thread(_browser_rss, os.getpid())
+        BROWSER_RSS.set(self.browser_rss)
+        limit = config.BROWSER_MAX_RSS_MB * 1024 * 1024
+        if limit and self.browser_rss > limit:
+            return "rss", f"RSS {self.browser_rss // 2**20} MiB over {config.BROWSER_MAX_RSS_MB} MiB"
+        contexts = len(self.browser.contexts)
+        if config.BROWSER_MAX_CONTEXTS and contexts > config.BROWSER_MAX_CONTEXTS:
+            return "contexts", f"{contexts} open contexts"
+        if config.BROWSER_MAX_OPS and self._ops >= config.BROWSER_MAX_OPS:
+            return "ops", f"{self._ops} operations since launch"
+        if (
+            len(self._outcomes) >= self._outcomes.maxlen
+            and self._error_rate() >= config.BROWSER_MAX_ERROR_RATE
+        ):
+            return "errors", f"{self._error_rate():.0%} of the last {len(self._outcomes)} operations failed"
+        return None
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(config.BROWSER_WATCHDOG_INTERVAL)
+            try:
+                verdict = await self._check_health()
+                if verdict:
+                    await self._restart_browser(*verdict)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Browser watchdog check failed: {e}")
+
+    def _on_disconnected(self, browser: Browser) -> None:
+        # Our own close() during stop or a restart also lands here
+        if self._closing or self._restarting or browser is not self.browser:
+            return
+        logger.error("Browser disconnected unexpectedly.")
+        asyncio.get_running_loop().create_task(
+            self._restart_browser("disconnected", "browser process went away")
+        )
+
+    async def _restart_browser(self, reason: str, detail: str) -> None:
+        """
+        Stop handing out leases, let in-flight operations finish (up to
+        BROWSER_DRAIN_TIMEOUT), then replace the browser and re-warm the pool.
+        """
+        if self._restarting or self._closing:
+            return
+        self._restarting = True
+        self._browser_ready.clear()
+        logger.warning(f"Recycling browser ({detail}); draining {self._leased} operation(s)")
+        try:
+            # Prefetch is speculative — it must not hold the drain up
+            for task in list(self._prefetch_leases):
+                task.cancel()
+            deadline = time.monotonic() + config.BROWSER_DRAIN_TIMEOUT
+            while self._leased and time.monotonic() < deadline:
+                await asyncio.sleep(0.2)
+            if self._leased:
+                logger.warning(f"Drain timed out; {self._leased} operation(s) still on the old browser")
+
+            idle, self._idle = self._idle, []
+            for entry in idle:
+                await self._discard(entry)
+            old, self.browser = self.browser, None
+            if old:
+                try:
+                    await old.close()
+                except Exception as e:
+                    logger.debug(f"Old browser close ignored: {e}")
+            await self._launch()
+            await self._warm_pool()
+            self.browser_restarts += 1
+            BROWSER_RESTARTS.inc(reason=reason)
+        except Exception as e:
+            # Leave it to the next watchdog tick; callers fail fast meanwhile
+            logger.error(f"Browser restart failed: {e}")
+        finally:
+            self._restarting = False
+            self._browser_ready.set()
+            self._capacity.set()
+
+    async def _remote(
+        self,
+        method: str,
+        args: list,
+        kwargs: Optional[dict] = None,
+        background: bool = False,
+    ):
+        """One browser attempt run by a worker process, holding a pool slot."""
+        await self._acquire_slot(background)
+        self._leased += 1
+        try:
+            return await self.broker.call(method, *args, **(kwargs or {}))
+        finally:
+            self._leased -= 1
+            self._release_slot()
+            self._capacity.set()
+
+    def pool_stats(self) -> dict:
+        stats = {
+            "size": self._pool_size,
+            "idle": len(self._idle),
+            "leased": self._leased,
+            "blocked_requests": self.blocked_requests,
+            "prefetching": len(self._prefetching),
+            "prefetch_hits": self.prefetch_hits,
+            "prefetch_preempted": self.prefetch_preempted,
+            "browser_restarts": self.browser_restarts,
+            "browser_rss": self.browser_rss,
+            "ops_since_launch": self._ops,
+            "error_rate": round(self._error_rate(), 3),
+        }
+        if self.broker:
+            stats["workers"] = self.broker.stats()
+        return stats
+
+    # ------------------------------------------------------------------ #
+    #  AGE GATE STORAGE STATE                                              #
+    # ------------------------------------------------------------------ #
+    def _load_storage_state(self) -> None:
+        path = config.AGE_GATE_STATE_FILE
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._storage_state = json.load(f)
+            logger.info(f"Loaded age-gate storage state from {path}")
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable storage state {path}: {e}")
+
+    async def _save_storage_state(self, context: BrowserContext) -> None:
+        try:
+            self._storage_state = await context.storage_state()
+        except Exception as e:
+            logger.debug(f"Could not capture storage state: {e}")
+            return
+        await self._share_cookies(context)
+        path = config.AGE_GATE_STATE_FILE
+        if not path:
+            return
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            # Per process: several scrape workers may save at the same time
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._storage_state, f)
+            os.replace(tmp, path)
+            logger.info(f"Saved age-gate storage state to {path}")
+        except Exception as e:
+            logger.warning(f"Could not save storage state to {path}: {e}")
+
+    async def _share_cookies(self, source: BrowserContext) -> None:
+        """
+        Hand the captured cookies to the contexts that already exist (idle
+        or leased), which were created before the state was known and would
+        otherwise keep meeting the gate.
+        """
+        cookies = (self._storage_state or {}).get("cookies")
+        if not cookies or not self.browser:
+            return
+        others = [c for c in self.browser.contexts if c is not source]
+        results = await asyncio.gather(
+            *(c.add_cookies(cookies) for c in others), return_exceptions=True
         )
+        shared = sum(1 for r in results if not isinstance(r, Exception))
+        if shared:
+            logger.info(f"Applied age-gate cookies to {shared} open context(s)")
 
     # ------------------------------------------------------------------ #
     #  DISMISS AGE GATE (called after every page.goto)                    #
     # ------------------------------------------------------------------ #
+    async def _find_age_gate(
+        self, page: Page, timeout_ms: int
+    ) -> Optional[tuple[str, ElementHandle]]:
+        """
+        Probe every gate selector concurrently and return the first hit.
+        With timeout_ms == 0 this is a single instant DOM check.
+        """
+
+        async def probe(sel: str) -> Optional[tuple[str, ElementHandle]]:
+            if timeout_ms <= 0:
+                el = await page.query_selector(sel)
+            else:
+                el = await page.wait_for_selector(sel, timeout=timeout_ms)
+            return (sel, el) if el else None
+
+        tasks = [asyncio.create_task(probe(sel)) for sel in AGE_GATE_SELECTORS]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                try:
+                    hit = await fut
+                except Exception:
+                    continue
+                if hit:
+                    return hit
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return None
+
     async def _dismiss_age_gate(self, page: Page) -> None:
         """
         Hanime.tv shows an age-verification gate on first visit.
-        Try several common selectors and click the confirm button if found.
+        Once it has been dismissed the storage state is reused by every
+        context, so only a short re-check is needed; otherwise all selectors
+        are raced against the full deadline. State is saved only after a
+        real dismissal, so a gate that was merely slow is never recorded as
+        passed.
         """
-        age_gate_selectors = [
-            "button[class*='confirm']",
-            "button[class*='agree']",
-            "button[class*='enter']",
-            "[class*='age-gate'] button",
-            "[class*='age_gate'] button",
-            "[class*='ageGate'] button",
-            "[class*='age-verify'] button",
-            "button:has-text('Enter')",
-            "button:has-text('I am 18')",
-            "button:has-text('Yes')",
-            "button:has-text('Confirm')",
-        ]
-        for sel in age_gate_selectors:
-            try:
-                btn = await page.wait_for_selector(sel, timeout=4000)
-                if btn:
-                    await btn.click()
-                    await asyncio.sleep(0.6)
-                    logger.info(f"Age gate dismissed with selector: {sel}")
-                    return
-            except Exception:
-                continue
-        logger.debug("No age gate detected or already dismissed.")
+        timeout_ms = config.AGE_GATE_RECHECK_MS if self._storage_state else config.AGE_GATE_TIMEOUT_MS
+        hit = await self._find_age_gate(page, timeout_ms)
+        if not hit:
+            logger.debug("No age gate detected or already dismissed.")
+            return
+
+        sel, btn = hit
+        try:
+            await btn.click()
+            await asyncio.sleep(0.6)
+            logger.info(f"Age gate dismissed with selector: {sel}")
+        except Exception as e:
+            logger.debug(f"Age gate click failed ({sel}): {e}")
+            return
+        await self._save_storage_state(page.context)
 
     # ------------------------------------------------------------------ #
     #  SEARCH                                                              #
@@ -86,26 +723,48 @@ class HanimeScraper:
         for results and scrapes them.
         Returns: [{"title": str, "url": str, "thumb": str}]
         """
-        for attempt in range(1, retries + 2):
-            try:
-                return await self._search_attempt(query)
-            except Exception as e:
-                logger.warning(f"Search attempt {attempt} failed: {e}")
-                if attempt > retries:
-                    logger.error("All search attempts exhausted.")
-                    return []
-                await asyncio.sleep(2)
-        return []
+        key = normalize_query(query)
+        with SEARCH_SECONDS.time(cache="hit", result="ok") as timing:
+            cached = self.cache.get("search", key)
+            if cached is not None:
+                logger.info(f"Search cache hit for '{key}'")
+                return cached
+
+            timing["cache"] = "miss"
+            results = await fast_path.search(query)
+            if results:
+                self.cache.set("search", key, results)
+                return results
+
+            for attempt in range(1, retries + 2):
+                try:
+                    results = await self._browser_tier("search", self._search_attempt(query))
+                    if results:
+                        self.cache.set("search", key, results)
+                    else:
+                        timing["result"] = "empty"
+                    return results
+                except Exception as e:
+                    logger.warning(f"Search attempt {attempt} failed: {e}")
+                    if attempt > retries:
+                        logger.error("All search attempts exhausted.")
+                        FAILURES.inc(op="search")
+                        timing["result"] = "error"
+                        return []
+                    RETRIES.inc(op="search")
+                    await asyncio.sleep(2)
+            return []
 
     async def _search_attempt(self, query: str) -> list[dict]:
-        context = await self._new_context()
-        page = await context.new_page()
+        if self.broker:
+            return await self._remote("search", [query])
         results = []
 
-        try:
-            logger.info("Navigating to hanime.tv/search…")
+        async with self._lease() as entry:
+            page = entry.page
+            logger.info(f"Navigating to {config.HANIME_BASE_URL}/search…")
             await page.goto(
-                "https://hanime.tv/search",
+                f"{config.HANIME_BASE_URL}/search",
                 wait_until="networkidle",
                 timeout=60000,
             )
@@ -137,7 +796,7 @@ class HanimeScraper:
                     continue
 
             if not search_input:
-                raise RuntimeError("Could not find search input on hanime.tv/search")
+                raise RuntimeError(f"Could not find search input on {config.HANIME_BASE_URL}/search")
 
             # ── Click, clear, type ────────────────────────────────────
             await search_input.click()
@@ -175,63 +834,34 @@ class HanimeScraper:
 
             await asyncio.sleep(1.5)
 
-            # ── Scrape cards ──────────────────────────────────────────
-            seen_urls: set[str] = set()
-
-            for sel in result_selectors:
-                cards = await page.query_selector_all(sel)
-                if not cards:
-                    continue
-
+            # ── Scrape cards (one in-page pass) ───────────────────────
+            sel, cards = await self._extract_links(
+                page,
+                result_selectors,
+                "[class*='title'], [class*='name'], h3, h4, span, p",
+            )
+            if sel:
                 logger.info(f"Found {len(cards)} cards with selector: {sel}")
 
-                for card in cards:
-                    try:
-                        # Resolve the anchor element (card may itself be <a>)
-                        tag = await card.evaluate("el => el.tagName.toLowerCase()")
-                        a_el = card if tag == "a" else await card.query_selector("a")
-
-                        href = await a_el.get_attribute("href") if a_el else None
-                        if not href or "/videos/hentai/" not in href:
-                            continue
-                        if not href.startswith("http"):
-                            href = "https://hanime.tv" + href
-                        if href in seen_urls:
-                            continue
-                        seen_urls.add(href)
-
-                        # Title
-                        title_el = await card.query_selector(
-                            "[class*='title'], [class*='name'], h3, h4, span, p"
-                        )
-                        title = (
-                            (await title_el.inner_text()).strip()
-                            if title_el
-                            else href.rstrip("/").split("/")[-1].replace("-", " ").title()
-                        )
-
-                        # Thumbnail
-                        img_el = await card.query_selector("img")
-                        thumb = await img_el.get_attribute("src") if img_el else ""
-
-                        results.append({
-                            "title": title or href.split("/")[-1],
-                            "url": href,
-                            "thumb": thumb or "",
-                        })
-
-                        if len(results) >= config.MAX_SEARCH_RESULTS:
-                            break
+            seen_urls: set[str] = set()
+            for card in cards:
+                href = card["href"]
+                if not href.startswith("http"):
+                    href = config.HANIME_BASE_URL + href
+                if href in seen_urls:
+                    continue
+                seen_urls.add(href)
 
-                    except Exception as e:
-                        logger.debug(f"Card parse error: {e}")
+                title = card["title"] or href.rstrip("/").split("/")[-1].replace("-", " ").title()
+                results.append({
+                    "title": title or href.split("/")[-1],
+                    "url": href,
+                    "thumb": card["thumb"],
+                })
 
-                if results:
+                if len(results) >= config.MAX_SEARCH_RESULTS:
                     break
 
-        finally:
-            await context.close()
-
         logger.info(f"Search returned {len(results)} results for '{query}'")
         return results
 
@@ -243,23 +873,48 @@ class HanimeScraper:
         Given any episode URL, scrape the full episode list for that series.
         Returns: [{"title": str, "url": str, "number": int}]
         """
-        for attempt in range(1, retries + 2):
-            try:
-                return await self._get_series_episodes_attempt(episode_url)
-            except Exception as e:
-                logger.warning(f"Episode list attempt {attempt} failed: {e}")
-                if attempt > retries:
-                    logger.error("All episode list attempts exhausted.")
-                    return []
-                await asyncio.sleep(2)
-        return []
+        key = canonical_url(episode_url)
+        with EPISODES_SECONDS.time(cache="hit", result="ok") as timing:
+            cached = self.cache.get("episodes", key)
+            if cached is not None:
+                logger.info(f"Episode list cache hit for {key}")
+                return cached
+
+            timing["cache"] = "miss"
+            links = await fast_path.episodes(episode_url)
+            if links:
+                episodes = self._shape_episodes(links)
+                self._cache_episodes(key, episodes)
+                return episodes
+
+            for attempt in range(1, retries + 2):
+                try:
+                    episodes = await self._browser_tier(
+                        "episodes", self._get_series_episodes_attempt(episode_url)
+                    )
+                    if episodes:
+                        self._cache_episodes(key, episodes)
+                    else:
+                        timing["result"] = "empty"
+                    return episodes
+                except Exception as e:
+                    logger.warning(f"Episode list attempt {attempt} failed: {e}")
+                    if attempt > retries:
+                        logger.error("All episode list attempts exhausted.")
+                        FAILURES.inc(op="episodes")
+                        timing["result"] = "error"
+                        return []
+                    RETRIES.inc(op="episodes")
+                    await asyncio.sleep(2)
+            return []
 
     async def _get_series_episodes_attempt(self, episode_url: str) -> list[dict]:
-        context = await self._new_context()
-        page = await context.new_page()
-        episodes = []
+        if self.broker:
+            return await self._remote("episodes", [episode_url])
+        episodes: list[dict] = []
 
-        try:
+        async with self._lease() as entry:
+            page = entry.page
             logger.info(f"Fetching episode list from: {episode_url}")
             await page.goto(episode_url, wait_until="networkidle", timeout=60000)
             await self._dismiss_age_gate(page)
@@ -275,50 +930,67 @@ class HanimeScraper:
                 "a[href*='/videos/hentai/']",
             ]
 
-            ep_links = []
-            for sel in ep_selectors:
-                ep_links = await page.query_selector_all(sel)
-                if ep_links:
-                    logger.info(f"Episode links found with selector: {sel}")
-                    break
-
-            seen: set[str] = set()
-            for el in ep_links:
-                try:
-                    href = await el.get_attribute("href")
-                    if not href or "/videos/hentai/" not in href:
-                        continue
-                    if not href.startswith("http"):
-                        href = "https://hanime.tv" + href
-                    if href in seen:
-                        continue
-                    seen.add(href)
-
-                    title_el = await el.query_selector("[class*='title'], span, p")
-                    title = (
-                        (await title_el.inner_text()).strip()
-                        if title_el
-                        else (await el.inner_text()).strip()
-                    )
-                    if not title:
-                        title = href.rstrip("/").split("/")[-1].replace("-", " ").title()
+            sel, ep_links = await self._extract_links(
+                page, ep_selectors, "[class*='title'], span, p", text_fallback=True
+            )
+            if sel:
+                logger.info(f"Episode links found with selector: {sel}")
+            episodes = self._shape_episodes(ep_links)
 
-                    slug = href.rstrip("/").split("/")[-1]
-                    num = self._extract_episode_number(slug, title)
+        logger.info(f"Found {len(episodes)} episodes for {episode_url}")
+        return episodes
 
-                    episodes.append({"title": title, "url": href, "number": num})
+    def _shape_episodes(self, links: list[dict]) -> list[dict]:
+        """[{"href", "title"}] from either tier → deduplicated, numbered, sorted."""
+        episodes = []
+        seen: set[str] = set()
+        for link in links:
+            href = link["href"]
+            if not href.startswith("http"):
+                href = config.HANIME_BASE_URL + href
+            if href in seen:
+                continue
+            seen.add(href)
 
-                except Exception as e:
-                    logger.debug(f"Episode link parse error: {e}")
+            title = link["title"]
+            if not title:
+                title = href.rstrip("/").split("/")[-1].replace("-", " ").title()
 
-            episodes.sort(key=lambda x: x["number"])
+            slug = href.rstrip("/").split("/")[-1]
+            num = self._extract_episode_number(slug, title)
 
-        finally:
-            await context.close()
+            episodes.append({"title": title, "url": href, "number": num})
 
-        logger.info(f"Found {len(episodes)} episodes for {episode_url}")
+        episodes.sort(key=lambda x: x["number"])
         return episodes
 
+    def _cache_episodes(self, key: str, episodes: list[dict]) -> None:
+        # Every episode of the series shares the same list
+        for url in {key, *(canonical_url(ep["url"]) for ep in episodes)}:
+            self.cache.set("episodes", url, episodes)
+
+    async def _extract_links(
+        self,
+        page: Page,
+        selectors: list[str],
+        title_selector: str,
+        text_fallback: bool = False,
+    ) -> tuple[Optional[str], list[dict]]:
+        """
+        Run a selector cascade in the page with a single evaluate call.
+        Returns (matching selector, [{"href", "title", "thumb"}]) with raw,
+        un-deduplicated hrefs.
+        """
+        data = await page.evaluate(
+            _EXTRACT_LINKS_JS,
+            {
+                "selectors": selectors,
+                "titleSelector": title_selector,
+                "textFallback": text_fallback,
+            },
+        )
+        return data.get("selector"), data.get("items") or []
+
     def _extract_episode_number(self, slug: str, title: str) -> int:
         """
         Extract episode number from slug or title, ignoring resolution tokens
@@ -349,81 +1021,332 @@ class HanimeScraper:
     # ------------------------------------------------------------------ #
     #  GET CDN URL — context-level interception catches iframes too       #
     # ------------------------------------------------------------------ #
-    async def get_cdn_url(self, video_url: str, retries: int = 2) -> Optional[str]:
+    async def get_cdn_url(
+        self, video_url: str, retries: int = 2, use_cache: bool = True
+    ) -> Optional[str]:
         """
-        Intercept all network traffic (including iframes) at the context level
-        to find the CDN video URL (mp4 or m3u8).  Also inspects XHR/JSON
-        response bodies for embedded CDN URLs.
-        Returns the first matching URL or None.
+        Resolve the CDN video URL (mp4 or m3u8) for an episode page: the HTTP
+        fast path first, else every stream URL the page reveals in the
+        browser (network traffic including iframes, XHR/JSON bodies, DOM).
+        Returns the top-ranked candidate or None; the runners-up are kept
+        for cdn_alternates().
+        Resolved URLs are cached per page until the signed URL expires and
+        re-checked with a cheap request before being handed out again.
         """
+        key = canonical_url(video_url)
+        if use_cache:
+            prefetched = await self._join_prefetch(key)
+            if prefetched:
+                CDN_LOOKUPS.inc(source="prefetch")
+                return prefetched
+            cached = self.cache.get("cdn", key)
+            if cached is not None:
+                if await self._cdn_url_alive(cached):
+                    logger.info(f"CDN cache hit for {key}")
+                    CDN_LOOKUPS.inc(source="cache")
+                    return cached
+                logger.info(f"Cached CDN URL for {key} is dead, re-extracting")
+                self.invalidate_cdn_url(video_url)
+        else:
+            self._cancel_prefetch_task(key)
+
+        ranked = await fast_path.cdn_urls(video_url)
+        if ranked:
+            self._cache_cdn_url(key, ranked)
+            CDN_LOOKUPS.inc(source="http")
+            return ranked[0]
+
         for attempt in range(1, retries + 2):
             try:
-                result = await self._get_cdn_url_attempt(video_url)
-                if result:
-                    return result
+                ranked = await self._browser_tier("cdn", self._get_cdn_url_attempt(video_url))
+                if ranked:
+                    self._cache_cdn_url(key, ranked)
+                    CDN_LOOKUPS.inc(source="browser")
+                    return ranked[0]
                 logger.warning(f"CDN attempt {attempt} returned no URL, retrying…")
             except Exception as e:
                 logger.warning(f"CDN attempt {attempt} failed: {e}")
             if attempt <= retries:
+                RETRIES.inc(op="cdn")
                 await asyncio.sleep(2)
 
         logger.error("All CDN extraction attempts exhausted.")
+        FAILURES.inc(op="cdn")
+        CDN_LOOKUPS.inc(source="none")
         return None
 
-    async def _get_cdn_url_attempt(self, video_url: str) -> Optional[str]:
-        context = await self._new_context()
-        cdn_url: Optional[str] = None
-        found_event = asyncio.Event()
-        loop = asyncio.get_event_loop()
+    def invalidate_cdn_url(self, video_url: str) -> None:
+        """Forget the cached CDN URL for a page (e.g. after a 403/410)."""
+        key = canonical_url(video_url)
+        self.cache.invalidate("cdn", key)
+        # Signed by the same page load — expired along with the first
+        self.cache.invalidate("cdn_alt", key)
+
+    def cdn_alternates(self, video_url: str) -> list[str]:
+        """Runner-up stream URLs from the last extraction, best first."""
+        return self.cache.get("cdn_alt", canonical_url(video_url)) or []
+
+    def _cache_cdn_url(self, key: str, ranked: list[str]) -> None:
+        expires = signed_url_expiry(ranked[0])
+        if expires is None:
+            ttl = config.CDN_CACHE_TTL
+        else:
+            ttl = min(expires - time.time() - config.CDN_EXPIRY_MARGIN, config.CDN_CACHE_MAX_TTL)
+        if ttl > 0:
+            self.cache.set("cdn", key, ranked[0], ttl=ttl)
+            if len(ranked) > 1:
+                self.cache.set("cdn_alt", key, ranked[1:], ttl=ttl)
+            else:
+                self.cache.invalidate("cdn_alt", key)
+
+    async def _cdn_url_alive(self, cdn_url: str) -> bool:
+        """One-byte ranged GET — enough to tell a live signed URL from a dead one."""
+
+        def _probe() -> bool:
+            opener = build_opener({"Range": "bytes=0-0"})
+            try:
+                with opener.open(cdn_url, timeout=config.CDN_LIVENESS_TIMEOUT) as resp:
+                    return resp.status < 400
+            except Exception as e:
+                logger.debug(f"CDN liveness check failed: {e}")
+                return False
 
-        cdn_pattern = re.compile(
-            r"https?://[^\s\"'<>]+\.(?:m3u8|mp4)(?:[^\s\"'<>]*)?",
-            re.IGNORECASE,
+        return await asyncio.to_thread(_probe)
+
+    async def _get_cdn_url_attempt(
+        self, video_url: str, background: bool = False
+    ) -> list[str]:
+        if self.broker:
+            return await self._remote(
+                "cdn", [video_url], {"background": background}, background
+            )
+        started = time.monotonic()
+        async with self._lease("cdn", background) as entry:
+            candidates = await self._extract_cdn_url(entry, video_url)
+        # Probing is plain HTTP — rank once the context is back in the pool
+        ranked = await self._rank_cdn_candidates(candidates)
+        CDN_EXTRACT_SECONDS.observe(
+            time.monotonic() - started, path=ranked[0].origin if ranked else "none"
         )
+        if not ranked:
+            logger.warning(f"No CDN URL found for {video_url}")
+        return [c.url for c in ranked]
 
-        # ── Handlers ──────────────────────────────────────────────────
+    # ------------------------------------------------------------------ #
+    #  SPECULATIVE PREFETCH                                                #
+    # ------------------------------------------------------------------ #
+    def prefetch_cdn_urls(self, video_urls: list[str]) -> Optional[asyncio.Task]:
+        """
+        Resolve CDN URLs for episodes the user is likely to pick next,
+        using only spare browser capacity. Results land in the CDN cache.
+        Returns the task so the caller can cancel it (e.g. when the user
+        moves on to another list), or None when there is nothing to do.
+        """
+        if not config.PREFETCH_CDN or not (self.browser or self.broker):
+            return None
+        pending = []
+        for url in video_urls[:config.PREFETCH_MAX_EPISODES]:
+            key = canonical_url(url)
+            if key not in self._prefetching and self.cache.get("cdn", key) is None:
+                pending.append((key, url))
+        if not pending:
+            return None
+        return asyncio.get_running_loop().create_task(self._prefetch_many(pending))
+
+    async def _prefetch_many(self, pending: list[tuple[str, str]]) -> None:
+        tasks = []
+        try:
+            for key, url in pending:
+                if key in self._prefetching:
+                    continue
+                task = asyncio.get_running_loop().create_task(self._prefetch_one(key, url))
+                self._prefetching[key] = task
+                task.add_done_callback(lambda t, k=key: self._prefetch_done(k, t))
+                tasks.append(task)
+                # One at a time, in list order — the first episodes matter most
+                await asyncio.gather(task, return_exceptions=True)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    def _prefetch_done(self, key: str, task: asyncio.Task) -> None:
+        if self._prefetching.get(key) is task:
+            del self._prefetching[key]
+
+    def _has_spare_capacity(self) -> bool:
+        free = self._pool_size - self._leased
+        return (
+            not self._foreground_waiting
+            and not self._slots.locked()
+            and free > config.PREFETCH_RESERVE
+        )
 
-        async def handle_request(request):
-            nonlocal cdn_url
-            if cdn_url:
-                return
-            url = request.url
-            if cdn_pattern.search(url):
-                cdn_url = url
-                logger.info(f"CDN URL (request intercept): {url[:100]}")
-                found_event.set()
-
-        async def handle_response(response):
-            nonlocal cdn_url
-            if cdn_url:
+    async def _prefetch_one(self, key: str, video_url: str) -> Optional[str]:
+        # The HTTP tier needs no browser slot, so it doesn't wait for one
+        ranked = await fast_path.cdn_urls(video_url)
+        if ranked:
+            self._cache_cdn_url(key, ranked)
+            logger.info(f"Prefetched CDN URL for {key} over HTTP")
+            return ranked[0]
+
+        async with self._prefetch_slots:
+            while not self._has_spare_capacity():
+                self._capacity.clear()
+                try:
+                    await asyncio.wait_for(self._capacity.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    pass
+            if self.cache.get("cdn", key) is not None:
+                return None
+
+            task = asyncio.current_task()
+            self._prefetch_leases.add(task)
+            try:
+                ranked = await self._get_cdn_url_attempt(video_url, background=True)
+            except Exception as e:
+                logger.debug(f"Prefetch failed for {key}: {e}")
+                return None
+            finally:
+                self._prefetch_leases.discard(task)
+            if not ranked:
+                return None
+            self._cache_cdn_url(key, ranked)
+            logger.info(f"Prefetched CDN URL for {key}")
+            return ranked[0]
+
+    async def _join_prefetch(self, key: str) -> Optional[str]:
+        """
+        A foreground request for a page being prefetched: wait for the
+        prefetch if it already holds a browser slot, otherwise cancel it so
+        the foreground extraction doesn't queue behind it.
+        """
+        task = self._prefetching.get(key)
+        if task is None or task.done():
+            return None
+        if task not in self._prefetch_leases:
+            self._cancel_prefetch_task(key)
+            return None
+        logger.info(f"Joining in-flight prefetch for {key}")
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise  # we were cancelled, not the prefetch
+            return None
+        except Exception:
+            return None
+        if result:
+            self.prefetch_hits += 1
+        return result
+
+    def _cancel_prefetch_task(self, key: str) -> None:
+        task = self._prefetching.pop(key, None)
+        if task:
+            task.cancel()
+
+    def _preempt_prefetch(self) -> None:
+        """Free a pool slot for a foreground caller by cancelling a prefetch."""
+        for task in list(self._prefetch_leases):
+            if not task.done():
+                self.prefetch_preempted += 1
+                logger.info("Cancelling CDN prefetch for a foreground request")
+                task.cancel()
                 return
-            url = response.url
 
-            # Direct URL match
-            if cdn_pattern.search(url):
-                cdn_url = url
-                logger.info(f"CDN URL (response intercept): {url[:100]}")
-                found_event.set()
+    def cancel_prefetch(self) -> None:
+        for key in list(self._prefetching):
+            self._cancel_prefetch_task(key)
+
+    async def _extract_cdn_url(
+        self, entry: _PooledContext, video_url: str
+    ) -> list[cdn_rank.CdnCandidate]:
+        """
+        Collect every stream URL the page reveals until CDN_SETTLE_SECONDS
+        after the first one (the real stream often follows a preroll, and
+        renditions trickle in), in the order they were seen.
+        """
+        context = entry.context
+        candidates: dict[str, cdn_rank.CdnCandidate] = {}
+        found_event = asyncio.Event()
+        loop = asyncio.get_event_loop()
+        body_reads: set[asyncio.Task] = set()
+        body_budget = [config.CDN_MAX_BODIES]
+
+        def add(url: str, origin: str) -> None:
+            url = url.rstrip("\"'\\").replace("\\/", "/")
+            if url in candidates:
                 return
+            candidates[url] = cdn_rank.CdnCandidate(url, origin, len(candidates))
+            logger.info(f"CDN candidate ({origin}): {url[:100]}")
+            found_event.set()
 
-            # Inspect JSON / text response bodies for embedded CDN URLs
-            content_type = response.headers.get("content-type", "")
-            if any(ct in content_type for ct in ("json", "javascript", "text/plain")):
-                try:
-                    body = await response.text()
-                    match = cdn_pattern.search(body)
-                    if match:
-                        cdn_url = match.group(0).rstrip("\"'\\")
-                        logger.info(f"CDN URL (XHR body): {cdn_url[:100]}")
-                        found_event.set()
-                except Exception as e:
-                    logger.debug(f"Could not read response body for {url}: {e}")
+        # ── Handlers ──────────────────────────────────────────────────
+        # Everything is decided synchronously from URL, resource type and
+        # headers; only the few bodies worth reading get a task.
 
-        # ── Attach listeners at CONTEXT level (catches all iframes) ───
-        context.on("request", lambda req: loop.create_task(handle_request(req)))
-        context.on("response", lambda res: loop.create_task(handle_response(res)))
+        def on_request(request):
+            if _CDN_URL_RE.search(request.url):
+                add(request.url, "request")
 
-        page = await context.new_page()
+        async def read_body(response):
+            try:
+                body = await response.body()
+            except Exception as e:
+                logger.debug(f"Could not read response body for {response.url}: {e}")
+                return
+            text = body.decode("utf-8", "replace")
+            for match in itertools.islice(_CDN_URL_RE.finditer(text), 20):
+                add(match.group(0), "xhr_body")
+
+        def on_response(response):
+            url = response.url
+            # Direct URL match (also catches redirect targets the route never sees)
+            if _CDN_URL_RE.search(url):
+                add(url, "response")
+                return
+            if (
+                body_budget[0] <= 0
+                or response.request.resource_type not in ("xhr", "fetch")
+                or _BLOCKED_URL_RE.search(url)
+            ):
+                return
+            headers = response.headers
+            if not any(ct in headers.get("content-type", "") for ct in _SNIFF_TYPES):
+                return
+            # Only bodies that declare a small size up front; an undeclared
+            # (chunked) one would cross the Playwright pipe whole to find out
+            length = headers.get("content-length", "")
+            if not length.isdigit() or int(length) > config.CDN_MAX_BODY_BYTES:
+                return
+            body_budget[0] -= 1
+            task = loop.create_task(read_body(response))
+            body_reads.add(task)
+            task.add_done_callback(body_reads.discard)
+
+        listeners = []
+
+        def detach() -> None:
+            entry.sniff = None
+            while listeners:
+                context.remove_listener(*listeners.pop())
+            for task in body_reads:
+                task.cancel()
+
+        # ── Attach at CONTEXT level (catches all iframes) ─────────────
+        # With resource blocking on, the pool's route handler already sees
+        # every request, so URL matching rides along there. The context
+        # goes back to the pool afterwards, so everything is detached again
+        # as soon as collection ends.
+        if config.BLOCK_RESOURCES:
+            entry.sniff = lambda url: add(url, "request")
+        else:
+            listeners.append(("request", on_request))
+        listeners.append(("response", on_response))
+        for event, handler in listeners:
+            context.on(event, handler)
+
+        page = entry.page
 
         try:
             logger.info(f"Loading video page: {video_url}")
@@ -469,56 +1392,59 @@ class HanimeScraper:
             except Exception as e:
                 logger.debug(f"Frame play-click error: {e}")
 
-            # Wait up to 25 s for CDN URL via network intercept
+            # Wait up to 25 s for a first CDN URL via network intercept,
+            # then keep collecting for the settle window
             try:
                 await asyncio.wait_for(found_event.wait(), timeout=25)
+                await asyncio.sleep(config.CDN_SETTLE_SECONDS)
             except asyncio.TimeoutError:
                 logger.warning("Timed out waiting for CDN URL via network intercept.")
+            detach()
 
             # Fallback 1 — raw page source
-            if not cdn_url:
+            if not candidates:
                 content = await page.content()
-                match = cdn_pattern.search(content)
-                if match:
-                    cdn_url = match.group(0).rstrip("\"'\\")
-                    logger.info(f"CDN URL (page source fallback): {cdn_url[:100]}")
+                for match in itertools.islice(_CDN_URL_RE.finditer(content), 20):
+                    add(match.group(0), "page_source")
 
             # Fallback 2 — <video>/<source> elements in main page
-            if not cdn_url:
+            if not candidates:
                 for sel in ["video source[src]", "video[src]", "source[src]"]:
                     el = await page.query_selector(sel)
                     if el:
                         src = await el.get_attribute("src")
-                        if src and cdn_pattern.search(src):
-                            cdn_url = src
-                            logger.info(f"CDN URL (<video> element): {cdn_url[:100]}")
-                            break
+                        if src and _CDN_URL_RE.search(src):
+                            add(src, "video_element")
 
             # Fallback 3 — <video>/<source> elements inside iframes
-            if not cdn_url:
+            if not candidates:
                 for frame in page.frames:
-                    if cdn_url:
-                        break
                     try:
                         for sel in ["video source[src]", "video[src]", "source[src]"]:
                             el = await frame.query_selector(sel)
                             if el:
                                 src = await el.get_attribute("src")
-                                if src and cdn_pattern.search(src):
-                                    cdn_url = src
-                                    logger.info(
-                                        f"CDN URL (iframe <video> element): {cdn_url[:100]}"
-                                    )
-                                    break
+                                if src and _CDN_URL_RE.search(src):
+                                    add(src, "iframe_video")
                     except Exception as e:
                         logger.debug(f"iframe video element check failed: {e}")
 
         finally:
-            await context.close()
-
-        if not cdn_url:
-            logger.warning(f"No CDN URL found for {video_url}")
-        return cdn_url
+            detach()
+
+        return list(candidates.values())
+
+    async def _rank_cdn_candidates(
+        self, candidates: list[cdn_rank.CdnCandidate]
+    ) -> list[cdn_rank.CdnCandidate]:
+        if len(candidates) < 2:
+            return candidates
+        ranked = await cdn_rank.rank(candidates, config.CDN_RANK_TIMEOUT)
+        logger.info(
+            f"Ranked {len(ranked)} CDN candidates: "
+            + ", ".join(c.describe() for c in ranked[:5])
+        )
+        return ranked
 
 
 # ------------------------------------------------------------------ #
@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Drop expired rows from the database every this many writes
+_DB_PRUNE_EVERY = 500
+
+
+class Entry:
+    """One search result or episode: all the bot keeps of the scraped dict."""
+
+    __slots__ = ("title", "url", "number")
+
+    def __init__(self, title: str, url: str, number: int = 0):
+        self.title = title
+        self.url = url
+        self.number = number
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Entry":
+        return cls(d.get("title") or "", d["url"], int(d.get("number") or 0))
+
+
+class Session:
+    """A user's browsing state: last search, its results and the open series."""
+
+    __slots__ = (
+        "user_id", "query", "results", "episodes", "selected_url",
+        "selected_title", "prefetch", "touched", "size",
+    )
+
+    def __init__(self, user_id: int, query: str, results: tuple[Entry, ...]):
+        self.user_id = user_id
+        self.query = query
+        self.results = results
+        self.episodes: tuple[Entry, ...] = ()
+        self.selected_url: Optional[str] = None
+        self.selected_title: Optional[str] = None
+        self.prefetch: Any = None  # background prefetch task, never persisted
+        self.touched = time.time()
+        self.size = 0
+
+    def select(self, entry: Entry, episodes: Iterable[Entry]) -> None:
+        self.selected_url = entry.url
+        self.selected_title = entry.title
+        self.episodes = tuple(episodes)
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "q": self.query,
+            "r": [(e.title, e.url, e.number) for e in self.results],
+            "e": [(e.title, e.url, e.number) for e in self.episodes],
+            "su": self.selected_url,
+            "st": self.selected_title,
+        })
+
+    @classmethod
+    def from_json(cls, user_id: int, data: str, touched: float) -> "Session":
+        d = json.loads(data)
+        session = cls(user_id, d["q"], tuple(Entry(*r) for r in d["r"]))
+        session.episodes = tuple(Entry(*e) for e in d["e"])
+        session.selected_url = d.get("su")
+        session.selected_title = d.get("st")
+        session.touched = touched
+        return session
+
+
+_ENTRY_OVERHEAD = sys.getsizeof(Entry("", "")) + sys.getsizeof(0)
+_SESSION_OVERHEAD = sys.getsizeof(Session(0, "", ())) + 2 * sys.getsizeof(())
+
+
+def _measure(session: Session) -> int:
+    """Approximate bytes held by a session (record, tuples and strings)."""
+    size = _SESSION_OVERHEAD + sys.getsizeof(session.query)
+    for entries in (session.results, session.episodes):
+        size += 8 * len(entries)
+        for e in entries:
+            size += _ENTRY_OVERHEAD + sys.getsizeof(e.title) + sys.getsizeof(e.url)
+    for text in (session.selected_url, session.selected_title):
+        if text:
+            size += sys.getsizeof(text)
+    return size
+
+
+class SessionStore:
+    """
+    Per-user sessions with a sliding TTL, evicted least-recently-used first
+    once either the entry count or the memory budget is exceeded. With a
+    database path every save is written through to SQLite and sessions that
+    aren't in memory (evicted, or lost in a restart) are loaded back on
+    demand, so old inline keyboards keep working.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int, db_path: str = ""):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self._sessions: OrderedDict[int, Session] = OrderedDict()
+        self._bytes = 0
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.loaded = 0
+        self.expired = 0
+        self.evicted = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._open_db(db_path)
+
+    # ------------------------------------------------------------------ #
+    #  Persistence                                                         #
+    # ------------------------------------------------------------------ #
+    def _open_db(self, db_path: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, touched REAL NOT NULL)"
+            )
+            self._prune_db()
+        except Exception as e:
+            logger.warning(f"Session persistence disabled ({db_path}): {e}")
+            self._db = None
+
+    def _db_write(self, sql: str, params: tuple) -> None:
+        if not self._db:
+            return
+        try:
+            self._db.execute(sql, params)
+            self._db.commit()
+        except Exception as e:
+            logger.debug(f"Session write ignored: {e}")
+
+    def _prune_db(self) -> None:
+        self._db_write("DELETE FROM sessions WHERE touched <= ?", (time.time() - self.ttl,))
+
+    def _load(self, user_id: int) -> Optional[Session]:
+        if not self._db:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT data, touched FROM sessions WHERE user_id = ? AND touched > ?",
+                (user_id, time.time() - self.ttl),
+            ).fetchone()
+            return Session.from_json(user_id, row[0], row[1]) if row else None
+        except Exception as e:
+            logger.debug(f"Session load ignored: {e}")
+            return None
+
+    # ------------------------------------------------------------------ #
+    #  Memory bookkeeping                                                  #
+    # ------------------------------------------------------------------ #
+    def _remember(self, session: Session) -> None:
+        old = self._sessions.pop(session.user_id, None)
+        if old is not None:
+            self._bytes -= old.size
+        session.size = _measure(session)
+        self._sessions[session.user_id] = session
+        self._bytes += session.size
+        self._evict()
+
+    def _forget(self, user_id: int) -> None:
+        session = self._sessions.pop(user_id, None)
+        if session is not None:
+            self._bytes -= session.size
+
+    def _evict(self) -> None:
+        # LRU order is touch order, so expired sessions sit at the front
+        cutoff = time.time() - self.ttl
+        while self._sessions:
+            user_id, oldest = next(iter(self._sessions.items()))
+            if oldest.touched <= cutoff:
+                self.expired += 1
+            elif len(self._sessions) > self.max_entries or self._bytes > self.max_bytes:
+                # Still persisted (if enabled) — only the memory copy goes
+                self.evicted += 1
+            else:
+                break
+            self._forget(user_id)
+
+    # ------------------------------------------------------------------ #
+    #  API                                                                 #
+    # ------------------------------------------------------------------ #
+    def get(self, user_id: int) -> Optional[Session]:
+        session = self._sessions.get(user_id)
+        if session is not None and session.touched <= time.time() - self.ttl:
+            self._forget(user_id)
+            self.expired += 1
+            session = None
+        if session is None:
+            session = self._load(user_id)
+            if session is None:
+                self.misses += 1
+                return None
+            self.loaded += 1
+            session.touched = time.time()
+            self._remember(session)
+        else:
+            session.touched = time.time()
+            self._sessions.move_to_end(user_id)
+        self.hits += 1
+        self._db_write(
+            "UPDATE sessions SET touched = ? WHERE user_id = ?", (session.touched, user_id)
+        )
+        return session
+
+    def start(self, user_id: int, query: str, results: Iterable[dict]) -> Session:
+        """Begin a fresh session for a new search, replacing any old one."""
+        session = Session(user_id, query, tuple(Entry.from_dict(r) for r in results))
+        self.save(session)
+        return session
+
+    def save(self, session: Session) -> None:
+        session.touched = time.time()
+        self._remember(session)
+        self._db_write(
+            "INSERT OR REPLACE INTO sessions (user_id, data, touched) VALUES (?, ?, ?)",
+            (session.user_id, session.to_json(), session.touched),
+        )
+        self._writes += 1
+        if self._writes % _DB_PRUNE_EVERY == 0:
+            self._prune_db()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._sessions),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "loaded": self.loaded,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+# ------------------------------------------------------------------ #
+#  Singleton instance                                                  #
+# ------------------------------------------------------------------ #
+sessions = SessionStore(
+    config.SESSION_TTL,
+    config.SESSION_MAX_ENTRIES,
+    config.SESSION_MAX_MB * 1024 * 1024,
+    config.SESSION_DB_PATH,
+)
@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pyrogram")
+pytest.importorskip("playwright")
+pytest.importorskip("yt_dlp")
+
+import bot  # noqa: E402
+from scheduler import Job  # noqa: E402
+
+
+class StubMessage:
+    def __init__(self, chat_id: int, msg_id: int, fail_delete: bool = False):
+        self.chat = SimpleNamespace(id=chat_id)
+        self.id = msg_id
+        self.deleted = False
+        self._fail_delete = fail_delete
+
+    async def delete(self):
+        if self._fail_delete:
+            raise RuntimeError("message to delete not found")
+        self.deleted = True
+
+
+class StubProgress:
+    def __init__(self):
+        self.texts: dict[int, str] = {}
+        self.discarded: list[int] = []
+
+    def update(self, msg, text, **kwargs):
+        self.texts[msg.id] = text
+
+    def discard(self, msg):
+        self.discarded.append(msg.id)
+
+
+@pytest.fixture
+def progress(monkeypatch):
+    stub = StubProgress()
+    monkeypatch.setattr(bot, "progress", stub)
+    return stub
+
+
+def _delivery(*subscribers: StubMessage) -> "bot._Delivery":
+    delivery = bot._Delivery("key", "https://example.test/ep-1", "Episode 1", 1)
+    delivery.subscribers.extend(subscribers)
+    return delivery
+
+
+def test_update_mirrors_to_every_subscriber(progress):
+    owner, follower = StubMessage(1, 10), StubMessage(2, 20)
+    delivery = _delivery(owner, follower)
+    delivery.update("⬇️ 50.0%")
+    assert progress.texts == {10: "⬇️ 50.0%", 20: "⬇️ 50.0%"}
+    assert delivery.followers == [follower]
+
+
+def test_delete_statuses_survives_failed_delete(progress):
+    owner, gone, follower = StubMessage(1, 10), StubMessage(2, 20, fail_delete=True), StubMessage(3, 30)
+    delivery = _delivery(owner, gone, follower)
+    asyncio.run(delivery.delete_statuses())
+    assert owner.deleted and follower.deleted
+    assert progress.discarded == [10, 20, 30]
+
+
+def test_batch_reports_episodes_in_one_message(progress):
+    status = StubMessage(1, 99)
+    episodes = [{"url": "a", "title": "Ep A"}, {"url": "b", "title": "Ep B"}]
+    batch = bot._Batch("Series", status, Job(1), episodes)
+
+    # Batch episodes have no own status message; attached requests are all followers
+    follower = StubMessage(2, 20)
+    delivery = _delivery(follower)
+    delivery.batch = batch
+    assert delivery.followers == [follower]
+
+    job = Job(1, parent=batch.job)
+    job.stage = "download"
+    batch.jobs[0], batch.deliveries[0] = job, delivery
+    delivery.update("⬇️ **Downloading:** Ep A\n`[████░]` 42.0%")
+    assert "0/2 done" in progress.texts[99]
+    assert "⬇️ Ep A 42.0%" in progress.texts[99]
+    assert "🕒 Ep B" in progress.texts[99]
+
+    batch.finish(0, "✅")
+    batch.finish(1, "❌")
+    assert "1/2 delivered" in progress.texts[99]
+    assert "✅ Ep A" in progress.texts[99] and "❌ Ep B" in progress.texts[99]
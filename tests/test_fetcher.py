@@ -0,0 +1,93 @@
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+import fetcher  # noqa: E402
+from fetcher import NativeFetcher  # noqa: E402
+from fixture_site import FixtureSite  # noqa: E402
+
+SEGMENTS = 8
+SEGMENT_SIZE = 64 * 1024
+
+
+@pytest.fixture
+def site_factory():
+    sites = []
+
+    def make(**kwargs) -> FixtureSite:
+        site = FixtureSite(latency=0, segments=SEGMENTS, segment_size=SEGMENT_SIZE, **kwargs)
+        site.start()
+        sites.append(site)
+        return site
+
+    yield make
+    for site in sites:
+        site.stop()
+
+
+def _slug(site: FixtureSite) -> str:
+    return site.first_episode_url().rsplit("/", 1)[-1]
+
+
+def _fetch(site: FixtureSite, base: str, resume=None) -> str:
+    url = site.media_url(_slug(site))
+    return asyncio.run(NativeFetcher().fetch(url, base, resume=resume))
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_hls_download(site_factory, tmp_path):
+    site = site_factory()
+    path = _fetch(site, str(tmp_path / "ep"))
+
+    assert path.endswith(".ts")
+    # Every fixture segment is the same slice of the pattern block
+    assert _read(path) == site._block[:SEGMENT_SIZE] * SEGMENTS
+    assert not os.path.exists(path + ".part")
+
+
+def test_hls_resume_from_part(site_factory, tmp_path):
+    site = site_factory()
+    segment = site._block[:SEGMENT_SIZE]
+    done = 3
+    part = tmp_path / "ep.ts.part"
+    # Whole fragments plus a torn one that must be truncated away
+    part.write_bytes(segment * done + b"\0" * 1000)
+
+    path = _fetch(site, str(tmp_path / "ep"), resume={
+        "fragment_index": done,
+        "fragment_count": SEGMENTS,
+        "part_bytes": done * SEGMENT_SIZE,
+    })
+
+    assert _read(path) == segment * SEGMENTS
+    assert site.bytes_sent == (SEGMENTS - done) * SEGMENT_SIZE
+
+
+def test_mp4_ranges(site_factory, tmp_path, monkeypatch):
+    monkeypatch.setattr(fetcher, "MP4_CHUNK", 100 * 1000)
+    site = site_factory(media="mp4")
+    size = site.media_size()
+    path = _fetch(site, str(tmp_path / "ep"))
+
+    assert path.endswith(".mp4")
+    assert _read(path) == site._block[:size]
+    # The size probe plus each byte exactly once
+    assert site.bytes_sent == size + 1
+
+
+def test_mp4_short_ranged_response(site_factory, tmp_path, monkeypatch):
+    monkeypatch.setattr(fetcher, "MP4_CHUNK", 100 * 1000)
+    # The server answers every range with at most 30 000 bytes
+    site = site_factory(media="mp4", range_cap=30 * 1000)
+    size = site.media_size()
+    path = _fetch(site, str(tmp_path / "ep"))
+
+    assert _read(path) == site._block[:size]
+    assert site.bytes_sent == size + 1
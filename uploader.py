@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import math
+import os
+from typing import Awaitable, Callable, Optional
+
+from pyrogram import Client, raw, types, utils
+from pyrogram.session import Session
+
+import config
+
+logger = logging.getLogger(__name__)
+
+PART_SIZE = 512 * 1024
+# Telegram only accepts saveBigFilePart uploads for files above 10 MB
+BIG_FILE_THRESHOLD = 10 * 1024 * 1024
+UPLOAD_WORKERS = 4
+
+
+def is_streamable(info: dict) -> bool:
+    """
+    True when yt-dlp writes the final file front to back with no merge or
+    remux afterwards — only then can the growing file be uploaded as-is.
+    """
+    if info.get("requested_formats"):
+        return False
+    return info.get("protocol") in ("http", "https") and info.get("ext") == "mp4"
+
+
+class StreamingUpload:
+    """
+    Uploads a file to Telegram while yt-dlp is still writing it.
+
+    Parts are sent with upload.saveBigFilePart as soon as the bytes behind
+    them are on disk, with file_total_parts = -1 until the final size is
+    known (Telegram's streamed-upload mode). feed() is called from yt-dlp's
+    progress hook thread; finish()/abort() from the event loop.
+    """
+
+    def __init__(self, client: Client, file_name: str, loop: asyncio.AbstractEventLoop):
+        self.client = client
+        self.file_name = file_name
+        self.loop = loop
+        self.streamable: Optional[bool] = None
+        self.uploaded = 0
+        self._tmp_path: Optional[str] = None
+        self._final_path: Optional[str] = None
+        self._info: dict = {}
+        self._finished = False
+        self._aborted = False
+        self._changed = asyncio.Event()
+
+    # ------------------------------------------------------------------ #
+    #  Signals from the downloader                                         #
+    # ------------------------------------------------------------------ #
+    def feed(self, d: dict) -> None:
+        """yt-dlp progress hook (runs in the download thread)."""
+        if d.get("status") != "downloading":
+            return
+        self.loop.call_soon_threadsafe(
+            self._on_progress, d.get("tmpfilename"), d.get("info_dict") or {}
+        )
+
+    def _on_progress(self, tmp_path: Optional[str], info: dict) -> None:
+        if self.streamable is None:
+            self.streamable = is_streamable(info)
+            self._info = info
+            if not self.streamable:
+                logger.info("Format can't be streamed, uploading after download.")
+        if tmp_path:
+            self._tmp_path = tmp_path
+        self._changed.set()
+
+    def finish(self, final_path: str) -> None:
+        self._final_path = final_path
+        self._finished = True
+        if self.streamable is None:
+            # Finished before the first progress event — nothing to overlap
+            self.streamable = False
+        self._changed.set()
+
+    def abort(self) -> None:
+        self._aborted = True
+        self._changed.set()
+
+    async def wait_ready(self) -> bool:
+        """Wait until the first progress event tells whether we can stream."""
+        while self.streamable is None and not self._aborted:
+            await self._wait()
+        return bool(self.streamable) and not self._aborted
+
+    async def _wait(self) -> None:
+        self._changed.clear()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=0.5)
+        except asyncio.TimeoutError:
+            pass
+
+    # ------------------------------------------------------------------ #
+    #  Upload                                                              #
+    # ------------------------------------------------------------------ #
+    def _open(self):
+        for path in (self._final_path, self._tmp_path):
+            if path:
+                try:
+                    return open(path, "rb")
+                except FileNotFoundError:
+                    continue
+        return None
+
+    async def _upload_parts(self, f) -> Optional[raw.types.InputFileBig]:
+        limit = config.MAX_FILE_SIZE_MB * 1024 * 1024
+        file_id = self.client.rnd_id()
+        queue: asyncio.Queue = asyncio.Queue(UPLOAD_WORKERS)
+        errors: list[Exception] = []
+
+        session = Session(
+            self.client,
+            await self.client.storage.dc_id(),
+            await self.client.storage.auth_key(),
+            await self.client.storage.test_mode(),
+            is_media=True,
+        )
+
+        async def worker():
+            while True:
+                rpc = await queue.get()
+                try:
+                    if rpc is None:
+                        return
+                    if not errors:
+                        await session.invoke(rpc)
+                        self.uploaded += len(rpc.bytes)
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    queue.task_done()
+
+        await session.start()
+        workers = [self.loop.create_task(worker()) for _ in range(UPLOAD_WORKERS)]
+        try:
+            part = 0
+            while not errors:
+                if self._aborted:
+                    return None
+                size = os.fstat(f.fileno()).st_size
+                if size > limit:
+                    logger.info("Streamed file exceeds MAX_FILE_SIZE_MB, aborting upload.")
+                    return None
+
+                total = math.ceil(size / PART_SIZE) if self._finished else -1
+                if self._finished and part >= total:
+                    break
+                if not self._finished and size <= (part + 1) * PART_SIZE:
+                    await self._wait()
+                    continue
+
+                if self._finished and part == total - 1:
+                    # Last part goes out once every earlier part is in
+                    await queue.join()
+                    if errors:
+                        break
+
+                f.seek(part * PART_SIZE)
+                chunk = f.read(PART_SIZE)
+                await queue.put(raw.functions.upload.SaveBigFilePart(
+                    file_id=file_id,
+                    file_part=part,
+                    file_total_parts=total,
+                    bytes=chunk,
+                ))
+                part += 1
+
+            await queue.join()
+            if errors:
+                raise errors[0]
+            return raw.types.InputFileBig(id=file_id, parts=part, name=self.file_name)
+        finally:
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers, return_exceptions=True)
+            await session.stop()
+
+    async def send(
+        self,
+        chat_id: int,
+        caption: str,
+        progress: Optional[Callable[[int], Awaitable[None]]] = None,
+    ) -> Optional["types.Message"]:
+        """
+        Stream the file to chat_id. Returns the sent message, or None when
+        the download turned out not to be streamable (or too small/large,
+        or aborted) and the caller should fall back to a normal upload.
+        """
+        if not await self.wait_ready():
+            return None
+
+        # Small files must go through the regular (non-big) upload path
+        f = None
+        while not self._aborted:
+            f = f or self._open()
+            size = os.fstat(f.fileno()).st_size if f else 0
+            if size > BIG_FILE_THRESHOLD or self._finished:
+                break
+            await self._wait()
+        if self._aborted or not f:
+            if f:
+                f.close()
+            return None
+
+        with f:
+            if self._finished and os.fstat(f.fileno()).st_size <= BIG_FILE_THRESHOLD:
+                return None
+            logger.info(f"Streaming upload started for {self.file_name}")
+
+            reporter = None
+            if progress:
+                async def report():
+                    while True:
+                        await asyncio.sleep(4)
+                        await progress(self.uploaded)
+                reporter = self.loop.create_task(report())
+            try:
+                input_file = await self._upload_parts(f)
+            finally:
+                if reporter:
+                    reporter.cancel()
+        if not input_file:
+            return None
+
+        info = self._info
+        media = raw.types.InputMediaUploadedDocument(
+            mime_type="video/mp4",
+            file=input_file,
+            attributes=[
+                raw.types.DocumentAttributeVideo(
+                    supports_streaming=True,
+                    duration=int(info.get("duration") or 0),
+                    w=int(info.get("width") or 0),
+                    h=int(info.get("height") or 0),
+                ),
+                raw.types.DocumentAttributeFilename(file_name=self.file_name),
+            ],
+        )
+        r = await self.client.invoke(
+            raw.functions.messages.SendMedia(
+                peer=await self.client.resolve_peer(chat_id),
+                media=media,
+                random_id=self.client.rnd_id(),
+                **await utils.parse_text_entities(self.client, caption, None, None),
+            )
+        )
+        for update in r.updates:
+            if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+                return await types.Message._parse(
+                    self.client,
+                    update.message,
+                    {u.id: u for u in r.users},
+                    {c.id: c for c in r.chats},
+                )
+        return None